@@ -0,0 +1,430 @@
+#JSON endpoints on the Flask server that runs the Dash app
+#They return the same numbers as the webapp (metrics table and rolling analysis), calculated by
+#the same TickerReturns instance, so results are shared between the webapp, scripts and notebooks
+#Every response has an ETag and Last-Modified date derived from the market data version,
+#repeated requests with If-None-Match / If-Modified-Since get a 304 without any calculation
+import hashlib
+import math
+
+from flask import Response, jsonify, request, stream_with_context
+
+from robust_regression import ROBUST_METHODS
+
+#Window sizes accepted by /api/rolling (same limits as the slider in the webapp)
+MIN_WINDOW_SIZE = 6
+MAX_WINDOW_SIZE = 36
+
+#Maximum number of tickers in one /api/capm request
+MAX_TICKERS = 100
+
+#Maximum number of paths of one /api/simulation request (and of the webapp)
+MAX_SIMULATION_PATHS = 200000
+
+#Default and maximum number of tickers returned by /api/screen
+DEFAULT_SCREEN_LIMIT = 50
+MAX_SCREEN_LIMIT = 500
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+#JSON does not support NaN, so missing values are returned as null
+def clean_value(value):
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def parse_tickers(raw_tickers):
+    tickers = [ticker.strip().upper() for ticker in (raw_tickers or '').split(',') if ticker.strip()]
+    #Removing duplicates while keeping the order
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        raise APIError("Missing 'tickers' parameter (e.g. ?tickers=AAPL,MSFT)")
+    if len(tickers) > MAX_TICKERS:
+        raise APIError(f"Too many tickers ({len(tickers)}), the maximum is {MAX_TICKERS}")
+    return tickers
+
+
+def parse_window(raw_window):
+    try:
+        window_size = int(raw_window) if raw_window is not None else 12
+    except ValueError:
+        raise APIError(f"Invalid 'window' parameter: {raw_window}")
+    if not MIN_WINDOW_SIZE <= window_size <= MAX_WINDOW_SIZE:
+        raise APIError(f"'window' must be between {MIN_WINDOW_SIZE} and {MAX_WINDOW_SIZE} months")
+    return window_size
+
+
+def parse_method(raw_method):
+    method = (raw_method or 'ols').strip().lower()
+    if method not in ['ols'] + ROBUST_METHODS:
+        raise APIError(f"Invalid 'method' parameter: {raw_method}, use one of {['ols'] + ROBUST_METHODS}")
+    return method
+
+
+def parse_format(raw_format):
+    from exporter import EXPORT_FORMATS
+
+    export_format = (raw_format or 'csv').strip().lower()
+    if export_format not in EXPORT_FORMATS:
+        raise APIError(f"Invalid 'format' parameter: {raw_format}, use one of {list(EXPORT_FORMATS)}")
+    return export_format
+
+
+#Tickers of an export: ?tickers=AAPL,MSFT or ?universe=1 (every ticker of the screener universe)
+def parse_export_tickers(args, screener):
+    if args.get('universe') in ('1', 'true'):
+        if screener is None:
+            raise APIError("The universe is not available on this server")
+        return screener.get_tickers()
+    return parse_tickers(args.get('tickers'))
+
+
+#Analysis of the period given by ?start=2008&end=2012 (years, months or days, see TickerReturns.with_date_range)
+#Without start and end, the whole history
+def parse_date_range(args, capm_regression):
+    try:
+        return capm_regression.with_date_range(args.get('start'), args.get('end'))
+    except ValueError as e:
+        raise APIError(f"Invalid date range: {e}")
+
+
+#Streamed file download (the chunks are generated while the response is sent)
+def export_response(chunks, export_format, filename):
+    from exporter import EXPORT_FORMATS
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}{extension}"'
+    return response
+
+
+def parse_float(name, raw_value):
+    try:
+        return float(raw_value)
+    except ValueError:
+        raise APIError(f"Invalid '{name}' parameter: {raw_value}")
+
+
+#Screener parameters: <metric>_min / <metric>_max filters, sort=<metric>, order=asc|desc and limit
+def parse_screen(args):
+    from screener import SCREEN_COLUMNS
+
+    filters = {}
+    for name, column in SCREEN_COLUMNS.items():
+        low, high = args.get(f'{name}_min'), args.get(f'{name}_max')
+        if low is not None or high is not None:
+            filters[column] = (parse_float(f'{name}_min', low) if low is not None else None,
+                               parse_float(f'{name}_max', high) if high is not None else None)
+
+    sort_name = args.get('sort')
+    if sort_name is not None and sort_name not in SCREEN_COLUMNS:
+        raise APIError(f"Invalid 'sort' parameter: {sort_name}, use one of {list(SCREEN_COLUMNS)}")
+    sort_by = SCREEN_COLUMNS[sort_name] if sort_name is not None else None
+
+    order = args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        raise APIError("'order' must be 'asc' or 'desc'")
+
+    try:
+        limit = int(args.get('limit', DEFAULT_SCREEN_LIMIT))
+    except ValueError:
+        raise APIError(f"Invalid 'limit' parameter: {args.get('limit')}")
+    if not 1 <= limit <= MAX_SCREEN_LIMIT:
+        raise APIError(f"'limit' must be between 1 and {MAX_SCREEN_LIMIT}")
+
+    return filters, sort_by, order == 'asc', limit
+
+
+#ETag of a response: the data version plus the endpoint and its (normalized) parameters
+def make_etag(data_version, endpoint, *params):
+    key = '|'.join([data_version, endpoint] + [str(param) for param in params])
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+#True when the client already has this version of the response
+def is_not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified is not None:
+        #HTTP dates have no microseconds
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+#A payload with errors (e.g. a ticker that could not be fetched) is not cached by the client: it has no ETag
+#or Last-Modified to revalidate with, so the next request calculates it again instead of getting a 304
+def conditional_response(etag, last_modified, build_payload):
+    if is_not_modified(etag, last_modified):
+        response = jsonify()
+        response.status_code = 304
+        response.set_data(b'')
+    else:
+        payload = build_payload()
+        response = jsonify(payload)
+        if payload.get('errors'):
+            response.cache_control.no_store = True
+            return response
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    #Clients can keep the response but have to check if it is still valid (cheap 304)
+    response.cache_control.no_cache = True
+    return response
+
+
+#Simulation parameters: paths, horizons (months, comma-separated), method=bootstrap|normal and seed
+def parse_simulation(args):
+    from simulation import SIMULATION_METHODS, DEFAULT_PATHS, DEFAULT_HORIZONS
+
+    try:
+        n_paths = int(args.get('paths', DEFAULT_PATHS))
+    except ValueError:
+        raise APIError(f"Invalid 'paths' parameter: {args.get('paths')}")
+    if not 1 <= n_paths <= MAX_SIMULATION_PATHS:
+        raise APIError(f"'paths' must be between 1 and {MAX_SIMULATION_PATHS}")
+
+    raw_horizons = args.get('horizons')
+    try:
+        horizons = sorted(set(int(horizon) for horizon in raw_horizons.split(',') if horizon.strip())) if raw_horizons else DEFAULT_HORIZONS
+    except ValueError:
+        raise APIError(f"Invalid 'horizons' parameter: {raw_horizons}")
+    if not horizons or not 1 <= horizons[0] <= horizons[-1] <= 120:
+        raise APIError("'horizons' must be between 1 and 120 months")
+
+    method = args.get('method', 'bootstrap')
+    if method not in SIMULATION_METHODS:
+        raise APIError(f"Invalid 'method' parameter: {method}, use one of {SIMULATION_METHODS}")
+
+    try:
+        seed = int(args.get('seed', 0))
+    except ValueError:
+        raise APIError(f"Invalid 'seed' parameter: {args.get('seed')}")
+    return n_paths, horizons, method, seed
+
+
+#Sector parameters: level=sector|industry and weighting=equal|cap
+def parse_sectors(args):
+    from sectors import SECTOR_LEVELS, SECTOR_WEIGHTINGS
+
+    level = args.get('level', 'sector')
+    if level not in SECTOR_LEVELS:
+        raise APIError(f"Invalid 'level' parameter: {level}, use one of {list(SECTOR_LEVELS)}")
+    weighting = args.get('weighting', 'equal')
+    if weighting not in SECTOR_WEIGHTINGS:
+        raise APIError(f"Invalid 'weighting' parameter: {weighting}, use one of {SECTOR_WEIGHTINGS}")
+    return level, weighting, args.get('returns') in ('1', 'true')
+
+
+#Adding the /api routes to the Flask server of the Dash app
+#/api/screen is only added if a screener (screener.UniverseScreener) is given,
+#/api/sectors if a sector analyzer (sectors.SectorAnalyzer) is given
+#warmup (warmup.WarmUp) is the warm start of the worker reported by /api/ready (ready at once without it)
+def register_api(server, capm_regression, screener=None, sector_analyzer=None, warmup=None):
+
+    @server.errorhandler(APIError)
+    def handle_api_error(error):
+        response = jsonify({'error': error.message})
+        response.status_code = error.status
+        return response
+
+    #Liveness: the worker answers requests (always 200)
+    @server.route('/api/health')
+    def api_health():
+        return jsonify({'status': 'ok'})
+
+    #Readiness: 200 once the market data and the hot tickers are loaded, 503 while the worker is warming up
+    #(load balancers only send traffic to ready workers)
+    @server.route('/api/ready')
+    def api_ready():
+        status = warmup.status() if warmup is not None else {'ready': True, 'state': 'disabled'}
+        response = jsonify(status)
+        response.status_code = 200 if status['ready'] else 503
+        response.cache_control.no_store = True
+        return response
+
+    #Metrics table (Beta, Alpha, R2, Treynor and Sharpe Ratio) for a list of tickers
+    #Each row also has the downside risk (Downside / Upside Beta, Sortino Ratio, Max Drawdown and Calmar Ratio)
+    #With OLS, each row also has the standard errors, t-stats and p-values of Beta and Alpha (classical and Newey-West)
+    #GET /api/capm?tickers=AAPL,MSFT&method=ols (method: ols, huber or theil-sen)
+    #Every endpoint except /api/screen accepts start and end (e.g. &start=2008&end=2012) to analyze a sub-period
+    @server.route('/api/capm')
+    def api_capm():
+        tickers = parse_tickers(request.args.get('tickers'))
+        method = parse_method(request.args.get('method'))
+        analysis = parse_date_range(request.args, capm_regression)
+        data_version, last_modified = analysis.get_data_version()
+        etag = make_etag(data_version, 'capm', ','.join(tickers), method)
+
+        def build_payload():
+            metrics = []
+            errors = {}
+            if method in ROBUST_METHODS:
+                try:
+                    rows = analysis.calculate_robust_metrics(tickers, method)
+                except Exception as e:
+                    raise APIError(f"Could not calculate the robust metrics: {e}", status=422)
+            else:
+                rows = []
+                for ticker in tickers:
+                    try:
+                        rows.append(analysis.calculate_capm_metrics(ticker))
+                    except Exception as e:
+                        errors[ticker] = str(e)
+                #Standard errors, t-stats and p-values (classical and Newey-West) of the OLS Beta and Alpha
+                inference = analysis.calculate_capm_inference([row['Ticker'] for row in rows])
+                rows = [{**row, **inference.get(row['Ticker'], {})} for row in rows]
+            #Downside risk of every ticker (one vectorized pass, same for every method)
+            downside = analysis.calculate_downside_risk([row['Ticker'] for row in rows])
+            rows = [{**row, **downside.get(row['Ticker'], {})} for row in rows]
+            for row in rows:
+                metrics.append({column: clean_value(value) for column, value in row.items()})
+            return {'data_version': data_version, 'method': method, 'metrics': metrics, 'errors': errors}
+
+        return conditional_response(etag, last_modified, build_payload)
+
+    #Rolling Beta, Alpha and R2 of one ticker
+    #GET /api/rolling?ticker=AAPL&window=12
+    @server.route('/api/rolling')
+    def api_rolling():
+        ticker = (request.args.get('ticker') or '').strip().upper()
+        if not ticker:
+            raise APIError("Missing 'ticker' parameter (e.g. ?ticker=AAPL)")
+        window_size = parse_window(request.args.get('window'))
+        analysis = parse_date_range(request.args, capm_regression)
+
+        data_version, last_modified = analysis.get_data_version()
+        etag = make_etag(data_version, 'rolling', ticker, window_size)
+
+        def build_payload():
+            try:
+                rolling_analysis_df = analysis.calculate_rol_analysis_ols(ticker, window_size=window_size)
+            except Exception as e:
+                raise APIError(f"Could not calculate the rolling analysis of {ticker}: {e}", status=422)
+
+            payload = {'data_version': data_version, 'ticker': ticker, 'window': window_size,
+                       'dates': [str(date) for date in rolling_analysis_df.index]}
+            for column in ['Alpha', 'Beta', 'R2']:
+                payload[column] = [clean_value(float(value)) for value in rolling_analysis_df[column]]
+            return payload
+
+        return conditional_response(etag, last_modified, build_payload)
+
+    #Metrics table as a file (streamed in chunks of tickers)
+    #GET /api/export/metrics?tickers=AAPL,MSFT&method=ols&format=csv (or universe=1 instead of tickers)
+    @server.route('/api/export/metrics')
+    def api_export_metrics():
+        from exporter import iter_dataframe_chunks, iter_metrics_frames, metrics_export_columns, stream_export
+
+        tickers = parse_export_tickers(request.args, screener)
+        method = parse_method(request.args.get('method'))
+        export_format = parse_format(request.args.get('format'))
+        analysis = parse_date_range(request.args, capm_regression)
+        columns = metrics_export_columns(method)
+
+        if method == 'ols' and request.args.get('universe') in ('1', 'true') and analysis is capm_regression:
+            #The universe metrics of the whole history are already calculated (vectorized) by the screener
+            frames = iter_dataframe_chunks(screener.get_index().metrics_df, columns)
+        else:
+            frames = iter_metrics_frames(analysis, tickers, method)
+        return export_response(stream_export(frames, columns, export_format), export_format, f'capm_metrics_{method}')
+
+    #Rolling Alpha, Beta and R2 as a file (one row per ticker and date, streamed ticker by ticker)
+    #GET /api/export/rolling?tickers=AAPL,MSFT&window=12&format=parquet (or universe=1 instead of tickers)
+    @server.route('/api/export/rolling')
+    def api_export_rolling():
+        from exporter import ROLLING_EXPORT_COLUMNS, iter_rolling_frames, stream_export
+
+        tickers = parse_export_tickers(request.args, screener)
+        window_size = parse_window(request.args.get('window'))
+        export_format = parse_format(request.args.get('format'))
+        analysis = parse_date_range(request.args, capm_regression)
+
+        frames = iter_rolling_frames(analysis, tickers, window_size)
+        return export_response(stream_export(frames, ROLLING_EXPORT_COLUMNS, export_format), export_format,
+                               f'capm_rolling_{window_size}m')
+
+    #Monte Carlo simulation of the returns implied by the CAPM: distribution, VaR and CVaR over each horizon
+    #GET /api/simulation?tickers=AAPL,MSFT&paths=100000&horizons=1,12&method=bootstrap&seed=0
+    #(hist=1 adds the histogram of each ticker and horizon)
+    @server.route('/api/simulation')
+    def api_simulation():
+        tickers = parse_tickers(request.args.get('tickers'))
+        n_paths, horizons, method, seed = parse_simulation(request.args)
+        include_histograms = request.args.get('hist') in ('1', 'true')
+        analysis = parse_date_range(request.args, capm_regression)
+        data_version, last_modified = analysis.get_data_version()
+        etag = make_etag(data_version, 'simulation', ','.join(tickers), n_paths, horizons, method, seed, include_histograms)
+
+        def build_payload():
+            try:
+                summary_df, histograms, errors = analysis.simulate_returns(tickers, n_paths=n_paths, horizons=horizons,
+                                                                           method=method, seed=seed)
+            except ValueError as e:
+                raise APIError(str(e), status=422)
+            rows = [{column: clean_value(value) for column, value in row.items()}
+                    for row in summary_df.to_dict(orient='records')]
+            payload = {'data_version': data_version, 'paths': n_paths, 'horizons': horizons, 'method': method,
+                       'seed': seed, 'simulation': rows, 'errors': errors}
+            if include_histograms:
+                payload['histograms'] = {str(horizon): {ticker: {'returns': [round(float(value), 4) for value in histogram.index],
+                                                                 'share': [round(float(value), 4) for value in histogram.values]}
+                                                        for ticker, histogram in horizon_histograms.items()}
+                                         for horizon, horizon_histograms in histograms.items()}
+            return payload
+
+        return conditional_response(etag, last_modified, build_payload)
+
+    if screener is None:
+        return server
+
+    #Tickers of the universe filtered and ranked by their metrics
+    #GET /api/screen?beta_max=0.8&sharpe_min=1&sort=sharpe&order=desc&limit=20
+    @server.route('/api/screen')
+    def api_screen():
+        filters, sort_by, ascending, limit = parse_screen(request.args)
+        data_version, last_modified = capm_regression.get_data_version()
+        etag = make_etag(data_version, 'screen', sorted(filters.items()), sort_by, ascending, limit)
+
+        def build_payload():
+            results_df = screener.screen(filters, sort_by, ascending, limit)
+            metrics = [{column: clean_value(value) for column, value in row.items()}
+                       for row in results_df.to_dict(orient='records')]
+            return {'data_version': data_version, 'count': len(metrics), 'metrics': metrics, 'errors': screener.errors}
+
+        return conditional_response(etag, last_modified, build_payload)
+
+    if sector_analyzer is None:
+        return server
+
+    #Sector (or industry) Betas, Alphas and dispersion of the Betas of their tickers
+    #GET /api/sectors?level=sector&weighting=cap (returns=1 adds the monthly excess returns of each sector)
+    @server.route('/api/sectors')
+    def api_sectors():
+        level, weighting, include_returns = parse_sectors(request.args)
+        data_version, last_modified = capm_regression.get_data_version()
+        etag = make_etag(data_version, 'sectors', level, weighting, include_returns)
+
+        def build_payload():
+            try:
+                sector_df, sector_returns_df = sector_analyzer.sector_view(level, weighting)
+            except ValueError as e:
+                raise APIError(str(e))
+            sectors = [{column: clean_value(value) for column, value in row.items()}
+                       for row in sector_df.reset_index().to_dict(orient='records')]
+            payload = {'data_version': data_version, 'level': level, 'weighting': weighting, 'sectors': sectors}
+            if include_returns:
+                dates = [str(date) for date in sector_returns_df.index]
+                payload['returns'] = {'dates': dates, **{group: [clean_value(value) for value in sector_returns_df[group]]
+                                                          for group in sector_returns_df.columns}}
+            return payload
+
+        return conditional_response(etag, last_modified, build_payload)
+
+    return server
@@ -1,30 +1,35 @@
-from dash import Dash, html, dcc, Input, Output, State
-import plotly.express as px
+from dash import Dash, html, dcc, Input, Output, State, MATCH, ALL, ClientsideFunction
 import pandas as pd
-import plotly.graph_objects as go
 from dash.exceptions import PreventUpdate
-from ticker_analyzer import TickerReturns
+from ticker_analyzer import TickerReturns, CAPM_METRIC_COLUMNS, ROLLING_WINDOW_SIZES
+from api import register_api, MAX_SIMULATION_PATHS
+from panel_analyzer import rolling_capm_panel, DOWNSIDE_COLUMNS
+from screener import UniverseScreener, SCREEN_COLUMNS
+from robust_regression import ROBUST_METHODS
+from memory_budget import budgeted_dict, track_memory
+from figures import colors, TABLE_INFERENCE_COLUMNS, create_scatter_plot, create_metrics_table, create_metric_bar_charts, create_rolling_figures, create_sector_beta_chart, create_simulation_chart
+from sectors import SectorAnalyzer, ticker_metadata, SECTOR_LEVELS
+from simulation import DEFAULT_PATHS, DEFAULT_HORIZONS
+from ticker_search import TickerSearchIndex
+from warmup import WarmUp, warmup_enabled
+from functools import lru_cache
 import json
+import threading
+import weakref
+
+#plotly.express (and the statsmodels/yfinance used by ticker_analyzer) are slow to import,
+#so they are only imported inside the callbacks and figures.py functions that build figures (first use)
 
 #Creating instance for CAPMRegression
 capm_regression = TickerReturns()
 
-index_name = "SP500"
-
 app = Dash(__name__)
 
-colors = {
-    'background': '#F3F4F4',
-    'text': '#464747',
-    'button':'#324B4C',
-    'title':'#a73a00',
-    'trendline':'#e66e2d',
-    'scatter_points':'#00adbc',
-    'line_color_table':'black',
-    'fill_color_col_table':'#1c884c',
-    'fill_color_table':'#5bbe7d'
+#Screener over the metrics of every S&P 500 ticker (built on first use, rebuilt when the data changes)
+screener = UniverseScreener(capm_regression, lambda: [option['value'] for option in get_all_tickers()])
 
-}
+#Sector and industry views of the same universe, grouped by the GICS metadata of the ticker store
+sector_analyzer = SectorAnalyzer(screener, lambda: get_ticker_metadata())
 
 #Defining dictionaries for each different text 
 text_styles = {
@@ -100,8 +105,20 @@ text_styles = {
 }
 
 
-#Fetching tickers form the JSON file
-def get_all_tickers():
+#Options of the regression used for the metrics table (robust methods keep the outlier months, see robust_regression.py)
+REGRESSION_METHODS = {
+    'ols': 'OLS (outliers removed with IQR)',
+    'huber': 'Huber (robust, all months)',
+    'theil-sen': 'Theil-Sen (robust, all months)',
+}
+
+#Horizons (months) offered by the Monte Carlo simulation
+SIMULATION_HORIZONS = [1, 3, 12, 36, 60]
+
+#Fetching tickers form the JSON file (ticker store, each ticker also has its GICS sector and industry)
+#The file is only read once (first page load), not when the file is imported
+@lru_cache(maxsize=None)
+def load_ticker_store():
     try:
         with open('capm-scatter-plot/data/sp500_tickers.json', 'r') as f:
             ticker_options = json.load(f)
@@ -112,193 +129,431 @@ def get_all_tickers():
         fallback_tickers_mag_7 = ["AAPL","MSFT","TSLA","GOOG","AMZN","NVDA","META"]
         return [{'label': ticker, 'value': ticker} for ticker in fallback_tickers_mag_7]
 
-ticker_options = get_all_tickers()
-ticker_list = capm_regression.set_ticker_list(ticker_options)
+#Dropdown options (only the label and the value of each ticker)
+@lru_cache(maxsize=None)
+def get_all_tickers():
+    return [{'label': option['label'], 'value': option['value']} for option in load_ticker_store()]
+
+#Search index of the ticker dropdown (symbols and company names), built on the first search
+@lru_cache(maxsize=None)
+def get_ticker_search_index():
+    return TickerSearchIndex(load_ticker_store())
+
+#Sector, industry and market cap of each ticker (see sectors.py)
+@lru_cache(maxsize=None)
+def get_ticker_metadata():
+    return ticker_metadata(load_ticker_store())
+
+#Message shown instead of the sector view when no ticker of the store has a sector (None when it has sectors)
+def sector_view_unavailable():
+    if get_ticker_metadata()['sector'].notna().any():
+        return None
+    return ("The sector view is not available: the tickers have no sector. "
+            "Run python -m capm metadata to fill in the sectors and industries of the ticker store.")
+
+#Warm start: the SP500, the T-Bill yield and the hot tickers (CAPM_HOT_TICKERS) are loaded in a background thread
+#It starts with the first request to the worker (e.g. the readiness probe of the load balancer),
+#or right away when app.py is run directly; CAPM_WARMUP=0 disables it
+warmup = WarmUp(capm_regression, preload=[load_ticker_store, get_ticker_search_index], enabled=warmup_enabled(),
+                screener=screener)
+app.server.before_request(warmup.start)
+
+#JSON endpoints (/api/capm, /api/rolling, /api/simulation, /api/screen, /api/sectors, /api/ready) sharing the results calculated by the webapp
+register_api(app.server, capm_regression, screener, sector_analyzer, warmup)
 
 #Editting the layout of the app
-app.layout = html.Div(style={'backgroundColor': colors['background']}, children=[
-    html.H1('Risk-Return Analysis of Stocks',style=text_styles['title']),
-
-    dcc.Markdown('''
-    **Purpose and Objective**
-    This WebApp uses the yFinance, Plotly, Dash and OLS APIs, allowing the user to analyze the risk-return relationship of any stocks within the S&P 500. The program will calculate the Betas,
-                 Jensen's Alphas (using the OLS best-fitting line module), R2 (of the best-fitting line), Sharpe Ratio, Treynor Ratio and Rolling CAPM Analysis (Rolling Beta, Rolling Alpha and
-                 Rolling R2). This provides the user a comprehensive understanding and a clear visualization of assets' risk, and their relationship with the S&P 500.
+#Layout is a function so it is only built when a page is loaded (Dash calls it for each page load)
+def serve_layout():
+    sector_message = sector_view_unavailable()
+    return html.Div(style={'backgroundColor': colors['background']}, children=[
+        html.H1('Risk-Return Analysis of Stocks',style=text_styles['title']),
+
+        dcc.Markdown('''
+        **Purpose and Objective**
+        This WebApp uses the yFinance, Plotly, Dash and OLS APIs, allowing the user to analyze the risk-return relationship of any stocks within the S&P 500. The program will calculate the Betas,
+                     Jensen's Alphas (using the OLS best-fitting line module), R2 (of the best-fitting line), Sharpe Ratio, Treynor Ratio and Rolling CAPM Analysis (Rolling Beta, Rolling Alpha and
+                     Rolling R2). This provides the user a comprehensive understanding and a clear visualization of assets' risk, and their relationship with the S&P 500.
                  
-    **Analysis Tool**
-    This program uses CAPM as the basis for the analysis. CAPM (Capital Asset Pricing Model) is a financial model developed to evaluate an asset's price, it involves calculating an asset's 
-                 price based on the risk relationship (volatility) with a particular market. While this application uses CAPM for analysis, the analytical tools provided by the program
-                 go further into analyzing any particular stocks (ie Rolling CAPM)
-
-    **Rolling CAPM Analysis**
-    Rolling CAPM calculates the key CAPM parameters (Beta, Alpha, and R-squared) over sequential time periods using a moving window of data. Rather than using the entire historical 
-                 dataset to calculate a single Beta value, Rolling CAPM uses a fixed-size window (typically 12, 24, or 36 months) that "rolls" forward through time.                      
-                 ''',style=text_styles['markdown']),
-
-    #Dropdown option so user can select tickers
-    html.Div([
-        html.Label("Select which assets (SP500 stocks) you want to add:", style=text_styles['markdown']),
-        dcc.Dropdown(
-            id="ticker-dropdown",
-            options=ticker_options,
-            multi=True,
-            placeholder="Select tickers",
-            style=text_styles['dropdown']),
-            ],
-            style={'marginBottom':'20px'}
+        **Analysis Tool**
+        This program uses CAPM as the basis for the analysis. CAPM (Capital Asset Pricing Model) is a financial model developed to evaluate an asset's price, it involves calculating an asset's 
+                     price based on the risk relationship (volatility) with a particular market. While this application uses CAPM for analysis, the analytical tools provided by the program
+                     go further into analyzing any particular stocks (ie Rolling CAPM)
+
+        **Rolling CAPM Analysis**
+        Rolling CAPM calculates the key CAPM parameters (Beta, Alpha, and R-squared) over sequential time periods using a moving window of data. Rather than using the entire historical 
+                     dataset to calculate a single Beta value, Rolling CAPM uses a fixed-size window (typically 12, 24, or 36 months) that "rolls" forward through time.                      
+                     ''',style=text_styles['markdown']),
+
+        #Dropdown option so user can select tickers
+        #The page has no options: they are searched on the server as the user types (see update_ticker_options)
+        html.Div([
+            html.Label("Select which assets (SP500 stocks) you want to add:", style=text_styles['markdown']),
+            dcc.Dropdown(
+                id="ticker-dropdown",
+                options=[],
+                multi=True,
+                placeholder="Type a symbol or company name",
+                style=text_styles['dropdown']),
+                ],
+                style={'marginBottom':'20px'}
+                ),
+
+        #Screener: selecting tickers by their metrics (e.g. Beta < 0.8 and Sharpe Ratio > 1)
+        html.Div([
+            html.Label("Or screen the S&P 500 by their metrics (leave empty for no limit):", style=text_styles['markdown']),
+            html.Div([
+                html.Div([
+                    html.Label(column, style=text_styles['label']),
+                    html.Div([
+                        dcc.Input(id={'type': 'screener-min-input', 'metric': name}, type='number', placeholder='min', style={'width': '70px'}),
+                        dcc.Input(id={'type': 'screener-max-input', 'metric': name}, type='number', placeholder='max', style={'width': '70px'}),
+                    ]),
+                ], style={'margin': '0px 10px 10px 0px', 'textAlign': 'center'})
+                for name, column in SCREEN_COLUMNS.items()
+            ], style={'display': 'flex', 'flexWrap': 'wrap', 'justifyContent': 'center'}),
+            html.Div([
+                html.Label("Rank by: ", style=text_styles['label']),
+                dcc.Dropdown(
+                    id='screener-sort-dropdown',
+                    options=[{'label': column, 'value': name} for name, column in SCREEN_COLUMNS.items()],
+                    value='sharpe',
+                    clearable=False,
+                    style={'width': '250px'}),
+                dcc.RadioItems(
+                    id='screener-order-radio',
+                    options=[{'label': 'Highest first', 'value': 'desc'}, {'label': 'Lowest first', 'value': 'asc'}],
+                    value='desc',
+                    inline=True,
+                    style={'margin': '0px 15px'}),
+                html.Label("Top: ", style=text_styles['label']),
+                dcc.Input(id='screener-limit-input', type='number', min=1, max=100, step=1, value=20, style={'width': '60px'}),
+            ], style={'display': 'flex', 'justifyContent': 'center', 'alignItems': 'center'}),
+            html.Div([
+                html.Button('Screen S&P 500', id='run-screener-button', style=text_styles['button']),
+                html.Button('Use Screened Tickers', id='use-screener-results-button', style={**text_styles['button'], 'marginLeft': '10px'}),
+            ], style={'textAlign': 'center'}),
+            dcc.Store(id='screener-results-store', data=[]),
+            dcc.Loading(html.Div(id='screener-results-container')),
+        ], style={'marginBottom': '20px'}),
+
+        #Sector view: Betas of the sectors (or industries) of the S&P 500 and the dispersion of the Betas of their tickers
+        #Hidden when no ticker of the store has a sector (every ticker would be in one "Unknown" group)
+        html.Div(sector_message, style=text_styles['markdown'] if sector_message else {'display': 'none'}),
+        html.Div([
+            html.Label("Or compare the sectors of the S&P 500:", style=text_styles['markdown']),
+            html.Div([
+                dcc.RadioItems(
+                    id='sector-level-radio',
+                    options=[{'label': level.capitalize(), 'value': level} for level in SECTOR_LEVELS],
+                    value='sector',
+                    inline=True,
+                    style={'margin': '0px 15px'}),
+                dcc.RadioItems(
+                    id='sector-weighting-radio',
+                    options=[{'label': 'Equal-weighted', 'value': 'equal'}, {'label': 'Cap-weighted', 'value': 'cap'}],
+                    value='equal',
+                    inline=True,
+                    style={'margin': '0px 15px'}),
+                html.Button('Compare Sectors', id='run-sectors-button', style=text_styles['button']),
+            ], style={'display': 'flex', 'justifyContent': 'center', 'alignItems': 'center'}),
+            dcc.Loading(html.Div(id='sectors-container')),
+        ], style={'display': 'none'} if sector_message else {'marginBottom': '20px'}),
+
+        #Regression used for the Betas and Alphas of the table
+        html.Div([
+            html.Label("How should Beta and Alpha be estimated?", style=text_styles['question']),
+            dcc.RadioItems(
+                id='regression-method-radio',
+                options=[{'label': label, 'value': method} for method, label in REGRESSION_METHODS.items()],
+                value='ols', #Default value
+                inline=True,
+                style=text_styles['radio']
+            ),
+        ], style={'textAlign': 'center', 'marginBottom': '10px'}),
+
+        #Period of the analysis, sliced from the history already downloaded (no new download)
+        html.Div([
+            html.Label("Analysis period (leave empty for the whole history)", style=text_styles['question']),
+            dcc.DatePickerRange(
+                id='date-range-picker',
+                clearable=True,
+                display_format='YYYY-MM-DD',
+                start_date_placeholder_text='Start',
+                end_date_placeholder_text='End',
             ),
+        ], style={'textAlign': 'center', 'marginBottom': '10px'}),
 
-    #Run Analysis Button
-    html.Div([
-        html.Button('Run Analysis', id='run-analysis-button',style=text_styles['button']),
-            ],style={'textAlign':'center'}),
+        #Run Analysis Button
+        html.Div([
+            html.Button('Run Analysis', id='run-analysis-button',style=text_styles['button']),
+                ],style={'textAlign':'center'}),
 
-    #Loading Message
-    html.Div(id='loading-message', style={'color': colors['text'], 'marginTop': '10px'}),
+        #Loading Message
+        html.Div(id='loading-message', style={'color': colors['text'], 'marginTop': '10px'}),
 
-    #Once Analysis runs, user will be able to select with scatter plots they want to see...
-    #...instead of showing all scatter plots at once
+        #Once Analysis runs, user will be able to select with scatter plots they want to see...
+        #...instead of showing all scatter plots at once
     
-    # Scatter Plot Controls - Initially hidden
-    html.Div([
-        html.Hr(),
-        html.H3('Scatter Plot Visualization Options', style=text_styles['subtitle']),
-        
-        # First radio item - whether to display scatter plots
+        # Scatter Plot Controls - Initially hidden
         html.Div([
-            html.Label("Would you like to see scatter plots?", style=text_styles['question']),
+            html.Hr(),
+            html.H3('Scatter Plot Visualization Options', style=text_styles['subtitle']),
+        
+            # First radio item - whether to display scatter plots
             html.Div([
-                dcc.RadioItems(
-                    id='show-scatter-radio',
-                    options=[
-                        {'label': 'Yes, show scatter plots', 'value': 'yes'},
-                        {'label': 'No, hide scatter plots', 'value': 'no'}
-                    ],
-                    value='no', #Default value
-                    style=text_styles['radio']
-                ),
-            ],style={'display': 'flex', 'justifyContent': 'center', 'width': '100%'}),
-        ], style={'marginBottom': '15px', 'textAlign': 'center', 'width': '100%'}),
+                html.Label("Would you like to see scatter plots?", style=text_styles['question']),
+                html.Div([
+                    dcc.RadioItems(
+                        id='show-scatter-radio',
+                        options=[
+                            {'label': 'Yes, show scatter plots', 'value': 'yes'},
+                            {'label': 'No, hide scatter plots', 'value': 'no'}
+                        ],
+                        value='no', #Default value
+                        style=text_styles['radio']
+                    ),
+                ],style={'display': 'flex', 'justifyContent': 'center', 'width': '100%'}),
+            ], style={'marginBottom': '15px', 'textAlign': 'center', 'width': '100%'}),
         
-        # Second radio item - which scatter plots to show (initially hidden)
-        html.Div([
+            # Second radio item - which scatter plots to show (initially hidden)
             html.Div([
-                html.Label("Select which ticker's scatter plots to display:", style=text_styles['question'])
-            ], style={'textAlign': 'center', 'width': '100%', 'marginBottom': '10px'}),
+                html.Div([
+                    html.Label("Select which ticker's scatter plots to display:", style=text_styles['question'])
+                ], style={'textAlign': 'center', 'width': '100%', 'marginBottom': '10px'}),
             
-            # Checklist instead of radio buttons for multi-selection
-            html.Div([
-                dcc.Checklist(
-                    id='ticker-scatter-checklist',
-                    options=[],  # Will be populated dynamically
-                    value=[],    # No default selections
-                    style={
-                        'backgroundColor': colors['background'],
-                        'fontSize': '16px',
-                        'lineHeight': '1.4',
-                        'display': 'flex',
-                        'flexWrap': 'wrap',
-                        'justifyContent': 'center'
-                    },
-                    labelStyle={'margin': '0px 15px 5px 0px', 'display': 'inline-block', 'white-space': 'nowrap'}
-                )
-            ], style={'width': '100%', 'display': 'flex', 'justifyContent': 'center'}),
+                # Checklist instead of radio buttons for multi-selection
+                html.Div([
+                    dcc.Checklist(
+                        id='ticker-scatter-checklist',
+                        options=[],  # Will be populated dynamically
+                        value=[],    # No default selections
+                        style={
+                            'backgroundColor': colors['background'],
+                            'fontSize': '16px',
+                            'lineHeight': '1.4',
+                            'display': 'flex',
+                            'flexWrap': 'wrap',
+                            'justifyContent': 'center'
+                        },
+                        labelStyle={'margin': '0px 15px 5px 0px', 'display': 'inline-block', 'white-space': 'nowrap'}
+                    )
+                ], style={'width': '100%', 'display': 'flex', 'justifyContent': 'center'}),
             
-            # Button in its own centered div
-            html.Div([
-                html.Button('Display Selected Scatter Plots', 
-                        id='display-scatter-button', 
-                        style=text_styles['button'])
-            ], style={'width': '100%', 'display': 'flex', 'justifyContent': 'center', 'marginTop': '15px'})
-        ], id='ticker-scatter-container', style={'display': 'none', 'marginBottom': '15px', 'width': '100%'}),
+                # Button in its own centered div
+                html.Div([
+                    html.Button('Display Selected Scatter Plots', 
+                            id='display-scatter-button', 
+                            style=text_styles['button'])
+                ], style={'width': '100%', 'display': 'flex', 'justifyContent': 'center', 'marginTop': '15px'})
+            ], id='ticker-scatter-container', style={'display': 'none', 'marginBottom': '15px', 'width': '100%'}),
         
-        # Container for the selected scatter plot
-        html.Div(id='selected-scatter-container')
+            # Container for the selected scatter plot
+            html.Div(id='selected-scatter-container')
         
-    ], id='scatter-controls', style={'display': 'none'}),
+        ], id='scatter-controls', style={'display': 'none'}),
     
-    #Adding the rolling beta for a given stock
-    html.Div([
-        html.Hr(),
-        html.H3('Rolling CAPM Analysis', style=text_styles['subtitle']),
+        #Adding the rolling beta for a given stock
+        html.Div([
+            html.Hr(),
+            html.H3('Rolling CAPM Analysis', style=text_styles['subtitle']),
+
+            #Radio buttons for the user to select whether to see the rolling capms or not
+            html.Div([
+                html.Label("Would you like to see the Rolling CAPM?", style=text_styles['question']),
+                html.Div([
+                    dcc.RadioItems(
+                        id='show-rolling-capm-radio',
+                        options=[
+                            {'label': 'Yes, show Rolling CAPM', 'value': 'yes'},
+                            {'label': 'No, hide Rolling CAPM', 'value': 'no'}
+                        ],
+                        value='no', #Default value
+                        style=text_styles['radio']
+                    ),
+                ],style={'display': 'flex', 'justifyContent': 'center', 'width': '100%'}),
+            ], style={'marginBottom': '15px', 'textAlign': 'center', 'width': '100%'}),
+
+            #Checklist buttons for the user to select which stocks they want to see the rolling betas 
+            # (in case they selected yes before)
+            html.Div([
+                html.Div([
+                    html.Label("Select which ticker's Rolling CAPM to display:\n (Notice this will produce rolling beta, alpha and R2, so selecting more than one might be confusing!)", style=text_styles['question'])
+                ], style={'textAlign': 'center', 'width': '100%', 'marginBottom': '10px'}),
+            
+                #Checklist for multi-selection
+                html.Div([
+                    dcc.Checklist(
+                        id='rolling-capm-ticker-checklist',
+                        options=[],  # Will be populated dynamically - meaning this information will be filed later on
+                        value=[],    # No default selections
+                        style={
+                            'backgroundColor': colors['background'],
+                            'fontSize': '16px',
+                            'lineHeight': '1.4',
+                            'display': 'flex',
+                            'flexWrap': 'wrap',
+                            'justifyContent': 'center'
+                        },
+                        labelStyle={'margin': '0px 15px 5px 0px', 'display': 'inline-block', 'white-space': 'nowrap'}
+                    )
+                ], style={'width': '100%', 'display': 'flex', 'justifyContent': 'center'}),
+
+                #Slider for the user to select the window size
+                html.Div([
+                    html.Label("Select rolling window size (months):", style=text_styles['question']),
+                    dcc.Slider(
+                        id='window-size-slider',
+                        min=ROLLING_WINDOW_SIZES[0],
+                        max=ROLLING_WINDOW_SIZES[-1],
+                        step=ROLLING_WINDOW_SIZES[1] - ROLLING_WINDOW_SIZES[0],
+                        value=12,
+                        marks={i: f'{i}m' for i in range(6, 37, 6)},
+                    ),
+                ], style={'marginBottom': '20px', 'width': '80%', 'margin': '0 auto'}),
+
+                #Other estimators that can be shown together with the fixed window
+                html.Div([
+                    html.Label("Also show (updated month by month, no fixed window):", style=text_styles['question']),
+                    dcc.Checklist(
+                        id='rolling-estimators-checklist',
+                        options=[
+                            {'label': 'EWMA (recent months weigh more)', 'value': 'ewma'},
+                            {'label': 'Expanding window (all months since the start)', 'value': 'expanding'}
+                        ],
+                        value=[],
+                        inline=True,
+                        style=text_styles['radio']
+                    ),
+                    html.Label("EWMA half-life (months): ", style=text_styles['label']),
+                    dcc.Input(id='ewma-halflife-input', type='number', min=1, max=120, step=1, value=12),
+                ], style={'width': '100%', 'textAlign': 'center', 'marginTop': '15px'}),
+        
+
+                #Aligning button to the center
+                html.Div([
+                    html.Button('Generate Rolling Analysis', 
+                            id='generate-rolling-capm-button', 
+                            style=text_styles['button'])
+                ], style={'width': '100%', 'display': 'flex', 'justifyContent': 'center', 'marginTop': '15px'}),
+
+                #Heatmap of the rolling metric of many tickers at once (one row per ticker)
+                html.Div([
+                    html.Label("Rolling heatmap: compare the Rolling CAPM of all analyzed tickers (or the whole S&P 500) in one chart", style=text_styles['question']),
+                    dcc.RadioItems(
+                        id='heatmap-metric-radio',
+                        options=[{'label': metric, 'value': metric} for metric in ['Beta', 'Alpha', 'R2']],
+                        value='Beta',
+                        inline=True,
+                        style=text_styles['radio']
+                    ),
+                    dcc.Checklist(
+                        id='heatmap-universe-checklist',
+                        options=[{'label': 'Use every S&P 500 ticker (instead of the analyzed tickers)', 'value': 'universe'}],
+                        value=[],
+                        style=text_styles['radio']
+                    ),
+                    html.Button('Generate Rolling Heatmap',
+                            id='generate-heatmap-button',
+                            style=text_styles['button'])
+                ], style={'width': '100%', 'textAlign': 'center', 'marginTop': '25px'})
+            ], id='rolling-capm-controls-container', style={'display': 'none', 'marginBottom': '15px', 'width': '100%'}),
+
+            #Loading indicator - show to user that rolling analyses are loading
+            html.Div(html.Div(id='rolling-capm-loading', style={'textAlign': 'center', 'marginTop': '10px'})),
+        
+            #Container with all rolling betas info
+            html.Div(id='rolling-capm-chart-container'),
 
-        #Radio buttons for the user to select whether to see the rolling capms or not
+            #Container with the rolling heatmap
+            dcc.Loading(html.Div(id='rolling-heatmap-container')),
+        
+            # Container for the selected scatter plot
+            html.Div(id='selected-rolling-container'),
+
+    ], id='rolling-capm-section', style={'display': 'none'}),
+
+        #Monte Carlo simulation of the analyzed tickers (returns implied by the CAPM, VaR and CVaR), shown after the analysis
         html.Div([
-            html.Label("Would you like to see the Rolling CAPM?", style=text_styles['question']),
+            html.Hr(),
+            html.H3('Monte Carlo Simulation', style=text_styles['subtitle']),
+            html.Label("Simulate the returns implied by the CAPM (Beta x SP500 + risk of the ticker itself) and their Value at Risk:", style=text_styles['question']),
             html.Div([
                 dcc.RadioItems(
-                    id='show-rolling-capm-radio',
+                    id='simulation-method-radio',
                     options=[
-                        {'label': 'Yes, show Rolling CAPM', 'value': 'yes'},
-                        {'label': 'No, hide Rolling CAPM', 'value': 'no'}
+                        {'label': 'Bootstrap (months of the SP500 history)', 'value': 'bootstrap'},
+                        {'label': 'Normal distribution fitted to the SP500', 'value': 'normal'}
                     ],
-                    value='no', #Default value
+                    value='bootstrap',
+                    inline=True,
                     style=text_styles['radio']
                 ),
-            ],style={'display': 'flex', 'justifyContent': 'center', 'width': '100%'}),
-        ], style={'marginBottom': '15px', 'textAlign': 'center', 'width': '100%'}),
-
-        #Checklist buttons for the user to select which stocks they want to see the rolling betas 
-        # (in case they selected yes before)
-        html.Div([
-            html.Div([
-                html.Label("Select which ticker's Rolling CAPM to display:\n (Notice this will produce rolling beta, alpha and R2, so selecting more than one might be confusing!)", style=text_styles['question'])
-            ], style={'textAlign': 'center', 'width': '100%', 'marginBottom': '10px'}),
-            
-            #Checklist for multi-selection
-            html.Div([
                 dcc.Checklist(
-                    id='rolling-capm-ticker-checklist',
-                    options=[],  # Will be populated dynamically - meaning this information will be filed later on
-                    value=[],    # No default selections
-                    style={
-                        'backgroundColor': colors['background'],
-                        'fontSize': '16px',
-                        'lineHeight': '1.4',
-                        'display': 'flex',
-                        'flexWrap': 'wrap',
-                        'justifyContent': 'center'
-                    },
-                    labelStyle={'margin': '0px 15px 5px 0px', 'display': 'inline-block', 'white-space': 'nowrap'}
-                )
-            ], style={'width': '100%', 'display': 'flex', 'justifyContent': 'center'}),
-
-            #Slider for the user to select the window size
-            html.Div([
-                html.Label("Select rolling window size (months):", style=text_styles['question']),
-                dcc.Slider(
-                    id='window-size-slider',
-                    min=6,
-                    max=36,
-                    step=3,
-                    value=12,
-                    marks={i: f'{i}m' for i in range(6, 37, 6)},
+                    id='simulation-horizons-checklist',
+                    options=[{'label': f'{horizon} month{"s" if horizon > 1 else ""}', 'value': horizon} for horizon in SIMULATION_HORIZONS],
+                    value=DEFAULT_HORIZONS,
+                    inline=True,
+                    style=text_styles['radio']
                 ),
-            ], style={'marginBottom': '20px', 'width': '80%', 'margin': '0 auto'}),
-        
+                html.Label("Paths: ", style=text_styles['label']),
+                dcc.Input(id='simulation-paths-input', type='number', min=1000, max=MAX_SIMULATION_PATHS, step=1000, value=DEFAULT_PATHS),
+                html.Div([
+                    html.Button('Run Simulation', id='run-simulation-button', style=text_styles['button'])
+                ], style={'width': '100%', 'display': 'flex', 'justifyContent': 'center', 'marginTop': '15px'}),
+            ], style={'width': '100%', 'textAlign': 'center'}),
+            dcc.Loading(html.Div(id='simulation-container')),
+        ], id='simulation-section', style={'display': 'none'}),
+    
+        #Download links of the analyzed tickers (filled after the analysis runs)
+        html.Div(id='export-links-container', style={'textAlign': 'center', 'marginTop': '20px'}),
+
+        #Tickers and period of the last analysis of this page (kept in the browser, so every session has its own)
+        dcc.Store(id='analysis-store'),
+
+        # Output Container for tables and analytics
+        html.Div(id='output-container', style={'color': colors['text'], 'marginTop': '20px'})
+    ])
+
+app.layout = serve_layout
+
+#Scatter plots figures of each analysis period (period -> {ticker: figure}), kept as an attribute of the Dash app instance
+#A figure only depends on the ticker and the period, so it is shared by every session analyzing that period
+#(what a session analyzed is in its analysis-store, never on the server)
+#The figures are part of the memory budget (CAPM_MEMORY_BUDGET_MB): dropped figures are built again when needed
+#The figures of a period go away with the period (capm_regression.with_date_range keeps the last ones)
+app.scatter_plots_dicts = weakref.WeakKeyDictionary()
+scatter_plots_lock = threading.Lock()
+
+#Figures of the scatter plots of one analysis period (ticker -> figure)
+def get_scatter_plots(analysis):
+    with scatter_plots_lock:
+        scatter_plots = app.scatter_plots_dicts.get(analysis)
+        if scatter_plots is None:
+            scatter_plots = app.scatter_plots_dicts[analysis] = budgeted_dict(capm_regression.memory_budget)
+        return scatter_plots
+
+#Returns of the period of the last analysis of a session (capm_regression itself for the whole history,
+#a view sliced from its cached series otherwise, see TickerReturns.with_date_range)
+#analysis_data: content of the analysis-store of the session (None before the first analysis)
+def session_analysis(analysis_data):
+    analysis_data = analysis_data or {}
+    return capm_regression.with_date_range(analysis_data.get('start_date'), analysis_data.get('end_date'))
+
+#Scatter plot of one ticker from the cached excess returns and metrics of the analyzed period
+def build_scatter_plot(analysis, each_ticker):
+    #Excess Returns function in ticker_analyzer file will fetch the monthly returns of the ticker and the risk free rate dataframes
+    #It will then calculate the excess return for any given interval (month) and return a dataframe with all of them (also handles nan values)
+    ticker_excess_returns_df = analysis.ticker_excess_returns_df(each_ticker)
+    sp500_excess_returns_df = pd.DataFrame({'SP500 Excess Returns (%)':analysis.get_sp500_excess_returns_df()})
 
-            #Aligning button to the center
-            html.Div([
-                html.Button('Generate Rolling Analysis', 
-                        id='generate-rolling-capm-button', 
-                        style=text_styles['button'])
-            ], style={'width': '100%', 'display': 'flex', 'justifyContent': 'center', 'marginTop': '15px'})
-        ], id='rolling-capm-controls-container', style={'display': 'none', 'marginBottom': '15px', 'width': '100%'}),
-
-        #Loading indicator - show to user that rolling analyses are loading
-        html.Div(html.Div(id='rolling-capm-loading', style={'textAlign': 'center', 'marginTop': '10px'})),
-        
-        #Container with all rolling betas info
-        html.Div(id='rolling-capm-chart-container'),
-        
-        # Container for the selected scatter plot
-        html.Div(id='selected-rolling-container'),
+    #Mean because returns on S&P500 are relatively stable over time (compared to other equity markets)
+    sp500_expected_returns, rf = analysis.get_market_expectations()
 
-], id='rolling-capm-section', style={'display': 'none'}),
-    
-    # Output Container for tables and analytics
-    html.Div(id='output-container', style={'color': colors['text'], 'marginTop': '20px'})
-])
+    #Beta, Alpha, R2, Treynor and Sharpe Ratio of the ticker
+    metrics = analysis.calculate_capm_metrics(each_ticker, ticker_excess_returns_df)
+
+    return create_scatter_plot(each_ticker, ticker_excess_returns_df, sp500_excess_returns_df,
+                               metrics, sp500_expected_returns, rf)
 
 #Callback for the Run Analysis Button - this is what allows the webApp to be interactive
 @app.callback(
@@ -306,18 +561,24 @@ app.layout = html.Div(style={'backgroundColor': colors['background']}, children=
      Output('output-container', 'children'), #Container of all the scatter plots and information
      Output('scatter-controls', 'style'), #Controls regarding the visualization of the scatter plots
      Output('ticker-scatter-checklist', 'options'),  # Changed from radio to checklist
-     Output('ticker-scatter-checklist', 'value')], #If answer is yes, user will select the tickers he wanst to see
+     Output('ticker-scatter-checklist', 'value'), #If answer is yes, user will select the tickers he wanst to see
+     Output('analysis-store', 'data')], #Tickers and period of this analysis, read by the next callbacks of the session
     #When the user clicks it will run
     [Input('run-analysis-button','n_clicks')],
     #State parameter allos me to access the current value of components within the ticker-dropdown
     #Dash will retrieve the current value of the component with id 'ticker-dropdown'
-    [State('ticker-dropdown', 'value')],
+    [State('ticker-dropdown', 'value'),
+     State('regression-method-radio', 'value'),
+     State('date-range-picker', 'start_date'),
+     State('date-range-picker', 'end_date'),
+     State('analysis-store', 'data')], #previous analysis of this session
     prevent_initial_call = True
 )
 
-#The two parameter of the function (n_clicks, selected_tickers), correspond IN ORDER to the inputs and states in the callback decorator
-#So if I added another input or state in the callback and added a third argument here, it would correspond to that one
-def update_output_analysis(n_clicks,selected_tickers):
+#The parameters of the function (n_clicks, selected_tickers, regression_method, start_date, end_date, previous_analysis), correspond IN ORDER to the inputs and states in the callback decorator
+#So if I added another input or state in the callback and added another argument here, it would correspond to that one
+@track_memory
+def update_output_analysis(n_clicks,selected_tickers, regression_method='ols', start_date=None, end_date=None, previous_analysis=None):
     if n_clicks is None:
         raise PreventUpdate
     
@@ -327,294 +588,76 @@ def update_output_analysis(n_clicks,selected_tickers):
             html.Div("Please select tickers using the dropdown above before running the analysis", style=text_styles['subtitle']),
             {'display': 'none'},
             [],
-            []
+            [],
+            None
         )
-    
-    #List with all the tickets inside the S&P 500
-    capm_regression.set_ticker_list(ticker_options)
-    
-    #Fetching excess returns of sp500
-    sp500_excess_returns_df = pd.DataFrame({'SP500 Excess Returns (%)':capm_regression.get_sp500_excess_returns_df()})
-    
-    #List that will contain all scatter plots for output
-    all_scatter_plots = {}
 
-    #Mean because returns on S&P500 are relatively stable over time (compared to other equity markets)
-    sp500_monthly_returns = capm_regression.get_sp500_monthly_returns()
-    sp500_monthly_returns = sp500_monthly_returns.dropna()
-    sp500_expected_returns = sp500_monthly_returns.mean()
+    #List with all the tickets inside the S&P 500
+    capm_regression.set_ticker_list(get_all_tickers())
 
-    risk_free_rate = capm_regression.get_monthly_tbill_yield()
-    risk_free_rate = risk_free_rate.dropna()
-    rf = risk_free_rate.mean()
+    #Period of the analysis (the whole history when both dates are empty)
+    try:
+        analysis = capm_regression.with_date_range(start_date, end_date)
+    except ValueError as e:
+        return(
+            html.Div(f"Invalid analysis period: {e}", style=text_styles['subtitle']),
+            html.Div(),
+            {'display': 'none'},
+            [],
+            [],
+            previous_analysis
+        )
+    analysis_data = {'tickers': list(selected_tickers), 'start_date': start_date, 'end_date': end_date}
+
+    #Comparing the new selection with the previous analysis of this session (a new period starts from scratch)
+    #Only the added tickers are calculated (and the ones whose figure was dropped by the memory budget or never
+    #built in this period); figures and metrics are cached by ticker, so other sessions reuse them
+    previous_analysis = previous_analysis or {}
+    if session_analysis(previous_analysis) is analysis:
+        previous_tickers = previous_analysis.get('tickers') or []
+    else:
+        previous_tickers = []
+    all_scatter_plots = get_scatter_plots(analysis)
+    added_tickers = [ticker for ticker in selected_tickers if ticker not in previous_tickers or ticker not in all_scatter_plots]
+    removed_tickers = [ticker for ticker in previous_tickers if ticker not in selected_tickers]
 
-    #DataFram that will contain all betas, alphas, R2 and Treynor Ratio of selected stocks
-    stocks_info = pd.DataFrame(columns = ['Ticker','Beta','Monthly Expected Returns (%)', 'Alpha (%)','R2','Treynor Ratio (%)','Sharpe Ratio', 'Annual Alpha (%)'])
-    
     #Running the Analysis from the ticker_analyzer file
     #Each iteration will generate a scatter plot for a given ticker with the S&P 500
-    for each_ticker in selected_tickers:
-        #Showing loading message
-        loading_message = f'Creating Plot with {each_ticker}'
-        html.Div(loading_message)
-
-        #Excess Returns function in ticker_analyzer file will fetch the monthly returns of the ticker and the risk free rate dataframes
-        #It will then calculate the excess return for any given interval (month) and return a dataframe with all of them (also handles nan values)
-        ticker_excess_returns_df = capm_regression.ticker_excess_returns_df(each_ticker)
-        
-        #SP500 will do the same as explained above
-        ticker_sp500_excess_returns = pd.concat([ticker_excess_returns_df,sp500_excess_returns_df],axis=1)
-        
-        #Doing a Scatter Plot for each ticker - using OLS for the trendline regression
-        #This regression line will create the beta (slope) and the alpha (y-intercept)
-        scatter_fig = px.scatter(
-            ticker_sp500_excess_returns,
-            x=f"{index_name} Excess Returns (%)",
-            y=f"{each_ticker} Excess Returns (%)", 
-            title=f'Scatter Plot of Monthly Excess Returns for {each_ticker} versus the {index_name}',
-            trendline="ols"
-            )
-        
-        #Fetching information from the trendline to add in the legend
-        #Getting results of the trendline done with scatter_fig plot
-        trendline_results = px.get_trendline_results(scatter_fig)
-        
-        #Trendline_results is a dataframe
-        model_results = trendline_results.iloc[0]["px_fit_results"]
-
-        #Fecthing beta, alpha and rsquared (found with ols regression line)
-        beta = model_results.params[1]
-        alpha = model_results.params[0]
-        r_squared = model_results.rsquared
-
-        #Rounding each information
-        beta = round(beta,3)
-        alpha_rounded = round(alpha,3)
-        r_squared = round(r_squared,3)
-
-        #Making Alpha annualized
-        annual_alpha = alpha*12
-        annual_alpha = round(annual_alpha,3)
-        
-
-        #CAPM formula is: E[rA] = rf + βA × (E[rm] - rf)
-        #rf and E[rm] are the same for all assets, so calculated before for loop
-        expected_returns = rf + beta*(sp500_expected_returns-rf)
-
-        #Making Expected Returns in %
-        expected_returns = expected_returns*100
-        expected_returns = round(expected_returns,3)
-
-        #Treynor Ratio = (Portfolio Return - Risk-Free Rate) / Portfolio Beta
-        #Average excess return of each asset / Asset Beta
-        mean_excess_returns = ticker_excess_returns_df.mean()
-        treynor_ratio = mean_excess_returns/beta
-
-        #Data is in monthly timeframe, so I need to make it annualized
-        treynor_ratio = treynor_ratio*12
-        treynor_ratio = round(treynor_ratio,3)
-
-        #Sharpe Ratio = (Portfolio Return - Risk-Free Rate) / Standard deviation of portfolio's excess returns
-        std_dev_excess_returns = ticker_excess_returns_df.std()
-        #Data is in monthly timeframe, so I need to make it annualized
-        #Multiplying by sqrt(12) because sharpe ratio uses std deviation (has to be sqrt of time)
-        sharpe_ratio = (mean_excess_returns/std_dev_excess_returns)*(12**0.5)
-        sharpe_ratio = round(sharpe_ratio,3)
-
-        #Saving the Beta, Alpha, R2, Treynor and Sharpe Ratio of each ticker to the dataframe
-        stocks_info.loc[each_ticker] = [each_ticker, beta, expected_returns, alpha_rounded, r_squared, treynor_ratio,sharpe_ratio, annual_alpha]
- 
-        #Updating the points of the scatter plot to match the color of the entire page
-        scatter_fig.update_traces(
-                selector=dict(type='scatter', mode='markers'), 
-                marker=dict(
-                color=colors['scatter_points'],
-                size=8,
-                opacity=0.7,
-                line=dict(width=1,color=colors['text'])            
-                ),showlegend=True,   
-            name=f'{each_ticker} vs. {index_name} Excess Returns'  
-        )
-
-        #Adding annotation Expected Returns in the top left corner of the scatter plot
-        scatter_fig.add_annotation(
-        x=-8, 
-        y=17.5,   
-        text=f"{each_ticker} Expected Returns: {expected_returns}<br>Risk-Free Rate: {rf:.2%}<br>S&P500 Expected Returns: {sp500_expected_returns:.2%}",
-        showarrow=False,
-        align="left",
-        font=dict(color=colors['text'])
-        )
-
-        #Modifying the color of the trendline to make it more aesthetic
-        scatter_fig.update_traces(
-                selector=dict(type='scatter', mode='lines'), 
-                line=dict(
-                color=colors['trendline'],        
-                width=2.5,             
-            ),
-            showlegend=True,        
-            name=f"Best-Fitting Line: Beta(β)={beta:.3f}; Alpha(α)={alpha_rounded:.3f}; R²={r_squared:.3f}"
-        )
-        
-        #Modifying Appearance of the Plot
-        scatter_fig.update_layout(
-            plot_bgcolor=colors['background'],
-            paper_bgcolor=colors['background'],
-            font_color=colors['text'],
-            title_x=0.5
-        )
-        
-        #Creating scatter plot with DCC graph
-        scatter_plot=dcc.Graph(figure=scatter_fig)
+    for each_ticker in added_tickers:
+        #Appending each scatter plot to the dictionary of scatter plots (built once per period)
+        if all_scatter_plots.get(each_ticker) is None:
+            all_scatter_plots[each_ticker] = build_scatter_plot(analysis, each_ticker)
+
+    #DataFrame that will contain all betas, alphas, R2 and Treynor Ratio of selected stocks
+    #Built from the cached rows, in the order of the selection
+    #With a robust method, the rows come from the robust regression of all selected tickers (one batch)
+    if regression_method in ROBUST_METHODS:
+        metrics_rows = analysis.calculate_robust_metrics(selected_tickers, regression_method)
+    else:
+        metrics_rows = [analysis.calculate_capm_metrics(each_ticker) for each_ticker in selected_tickers]
+    stocks_info = pd.DataFrame(metrics_rows, columns=CAPM_METRIC_COLUMNS, index=selected_tickers)
 
-        #Appending each scatter plot to the list of scatter plots
-        all_scatter_plots[each_ticker] = scatter_fig
+    #Downside risk (Downside / Upside Beta, Sortino Ratio, Max Drawdown, Calmar Ratio), one vectorized pass
+    downside = analysis.calculate_downside_risk(selected_tickers)
+    downside_df = pd.DataFrame.from_dict(downside, orient='index')
+    stocks_info = stocks_info.join(downside_df.reindex(columns=DOWNSIDE_COLUMNS))
 
+    #Significance of the OLS Beta and Alpha (t-stats, classical and Newey-West p-values), one vectorized pass
+    if regression_method not in ROBUST_METHODS:
+        inference = analysis.calculate_capm_inference(selected_tickers)
+        inference_df = pd.DataFrame.from_dict(inference, orient='index')
+        stocks_info = stocks_info.join(inference_df.reindex(columns=TABLE_INFERENCE_COLUMNS))
 
-        #Adding each figure to the webapp
-        html.Div([
-            html.Div(f'Scatter Plot of Monthly Excess Returns for {each_ticker} versus the {index_name}',style=text_styles['subtitle']),
-            scatter_plot
-        ])
-    
-   
-    #Creating DataTable with all the information inside the dataframe stocks_info apart from the annualized alpha
-    stocks_table = go.Figure(data=[go.Table(
-        header=dict(values=list(stocks_info.columns),
-                    line_color=colors['line_color_table'],
-                    fill_color=colors['fill_color_col_table'],
-                    align='center',
-                    height = 30),
-        cells=dict(values=[stocks_info.index,stocks_info['Beta'],stocks_info['Monthly Expected Returns (%)'],stocks_info['Alpha (%)'],stocks_info['R2'],stocks_info['Treynor Ratio (%)'],stocks_info['Sharpe Ratio'],stocks_info['Annual Alpha (%)']],
-                   fill_color=colors['fill_color_table'],
-                   line_color=colors['line_color_table'],
-                   align='center',
-                   height = 30),
-                   columnwidth=[0.3, 0.3, 0.3])
-        ])
-    
-    table_height = 100 + (len(selected_tickers) * 30)
-
-    stocks_table.update_layout(
-        paper_bgcolor=colors['background'],
-        font_color=colors['text'],
-        width=750,  
-        height=table_height,  # Keep height small too
-        margin=dict(l=5, r=5, t=5, b=10),  # Minimal margins
-        autosize=False
-    )
-    
-    #Bar chart with all (Jensen's) Alphas for comparison
-    alpha_fig = px.bar(stocks_info,
-                       x = 'Ticker',
-                       y = 'Annual Alpha (%)',
-                       title= 'Jensen\'s Alpha for each Ticker',
-                       labels= {'Annual Alpha (%)': 'Jensen\'s Alpha (%)'},
-                       text = 'Annual Alpha (%)',
-                       color='Annual Alpha (%)',
-                       color_continuous_scale=[
-                            (0.0, '#891f00'),   # Red for negative values
-                            (0.5, "white"), # White for zero
-                            (1.0, "#5bbe7d")  # Green for positive values
-                        ],
-                       color_continuous_midpoint=0)
-    
-    alpha_fig.add_shape(
-                        type='line',
-                        x0=0,
-                        x1=len(stocks_info),
-                        y0=0,
-                        y1=0,
-                        line=dict(color='black', width=1.5, dash='dash')
-                    )
-    
-    alpha_fig.update_traces(texttemplate='%{text:.3f}%', textposition='outside')
-    
-    alpha_fig.update_layout(
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        font_color=colors['text'],
-        title_x=0.5,
-        coloraxis_showscale=False,
-    )
+    #DataTable with all the information inside the dataframe stocks_info (see figures.py)
+    stocks_table = create_metrics_table(stocks_info)
 
+    #Bar charts with all (Jensen's) Alphas, Treynor and Sharpe Ratios for comparison
+    alpha_fig, treynor_fig, sharpe_fig = create_metric_bar_charts(stocks_info)
     alpha_bar_chart = dcc.Graph(figure=alpha_fig)
-
-    #Creating bar chart with treynor ratios of selected stocks
-    treynor_fig = px.bar(stocks_info,
-                         x = 'Ticker',
-                         y= 'Treynor Ratio (%)',
-                         title= 'Treynor Ratio for each Ticker',
-                        text = 'Treynor Ratio (%)',
-                        color='Treynor Ratio (%)',
-                        color_continuous_scale=[
-                                (0.0, '#891f00'),   # Red for negative values
-                                (0.5, "white"), # White for zero
-                                (1.0, "#5bbe7d")  # Green for positive values
-                            ],
-                        color_continuous_midpoint=0)
-    
-    treynor_fig.add_shape(
-                    type='line',
-                    x0=0,
-                    x1=len(stocks_info),
-                    y0=0,
-                    y1=0,
-                    line=dict(color='black', width=1.5, dash='dash')
-                )
-    
-    treynor_fig.update_traces(texttemplate='%{text:.3f}%', textposition='outside')
-
-    treynor_fig.update_layout(
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        font_color=colors['text'],
-        title_x=0.5,
-        coloraxis_showscale=False,
-    )
-    
     treynor_bar_chart = dcc.Graph(figure=treynor_fig)
-
-    #Creating bar chart with sharpe ratios of selected stocks
-    sharpe_fig = px.bar(stocks_info,
-                         x = 'Ticker',
-                         y= 'Sharpe Ratio',
-                         title= 'Sharpe Ratio for each Ticker',
-                        text = 'Sharpe Ratio',
-                        color='Sharpe Ratio',
-                        color_continuous_scale=[
-                                (0.0, '#891f00'),   # Red for negative values
-                                (0.5, "white"), # White for zero
-                                (1.0, "#5bbe7d")  # Green for positive values
-                            ],
-                        color_continuous_midpoint=0)
-    
-    sharpe_fig.add_shape(
-                    type='line',
-                    x0=0,
-                    x1=len(stocks_info),
-                    y0=0,
-                    y1=0,
-                    line=dict(color='black', width=1.5, dash='dash')
-                )
-    
-    sharpe_fig.update_traces(texttemplate='%{text:.3f}', textposition='outside')
-
-    sharpe_fig.update_layout(
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        font_color=colors['text'],
-        title_x=0.5,
-        coloraxis_showscale=False,
-    )
-    
     sharpe_bar_chart = dcc.Graph(figure=sharpe_fig)
 
-    #Saving the dictionary of scatter plots figures as an attribute of the Dash app instance
-    # This needs to be serialized so we'll save scatter plot IDs instead
-    app.scatter_plots_dict = all_scatter_plots
-    print(f"Stored {len(all_scatter_plots)} scatter plots with keys: {list(all_scatter_plots.keys())}")
+    print(f"Computed {len(added_tickers)} new tickers, dropped {len(removed_tickers)} from the previous analysis of the session")
 
 
 
@@ -638,7 +681,7 @@ def update_output_analysis(n_clicks,selected_tickers):
                 deviation from the expected performance using CAPM as a benchmark.''',
                 style=text_styles['markdown']),
 
-            html.Div("Dataset with all Betas, Alphas and R2 of selected tickers:", style=text_styles['subtitle']),
+            html.Div(f"Dataset with all Betas, Alphas and R2 of selected tickers ({REGRESSION_METHODS.get(regression_method, REGRESSION_METHODS['ols'])}):", style=text_styles['subtitle']),
             html.Div([dcc.Graph(figure=stocks_table)],style={ #Output container (only data table part)
                 'display': 'flex',
                 'justifyContent': 'center',  
@@ -705,9 +748,115 @@ def update_output_analysis(n_clicks,selected_tickers):
         
         ticker_checklist_options,
         
-        []  # No default selections for the checklist
+        [],  # No default selections for the checklist
+
+        analysis_data
     ]
 
+#Callback for the screener: filtering and ranking the universe by the metrics (see screener.py)
+@app.callback(
+    [Output('screener-results-container', 'children'),
+     Output('screener-results-store', 'data')],
+    [Input('run-screener-button', 'n_clicks')],
+    [State({'type': 'screener-min-input', 'metric': ALL}, 'value'),
+     State({'type': 'screener-max-input', 'metric': ALL}, 'value'),
+     State('screener-sort-dropdown', 'value'),
+     State('screener-order-radio', 'value'),
+     State('screener-limit-input', 'value')],
+    prevent_initial_call=True
+)
+@track_memory
+def run_screener(n_clicks, min_values, max_values, sort_name, order, limit):
+    import plotly.graph_objects as go
+
+    #Inputs are in the same order as SCREEN_COLUMNS
+    filters = {column: (low, high) for column, low, high in zip(SCREEN_COLUMNS.values(), min_values, max_values)
+               if low is not None or high is not None}
+    results_df = screener.screen(filters, SCREEN_COLUMNS[sort_name], order == 'asc', limit or 20)
+
+    if results_df.empty:
+        return html.Div("No ticker matches the screen", style=text_styles['subtitle']), []
+
+    results_table = go.Figure(data=[go.Table(
+        header=dict(values=list(results_df.columns),
+                    line_color=colors['line_color_table'],
+                    fill_color=colors['fill_color_col_table'],
+                    align='center',
+                    height=30),
+        cells=dict(values=[results_df[column] for column in results_df.columns],
+                   fill_color=colors['fill_color_table'],
+                   line_color=colors['line_color_table'],
+                   align='center',
+                   height=30))
+    ])
+    results_table.update_layout(
+        paper_bgcolor=colors['background'],
+        font_color=colors['text'],
+        width=750,
+        height=100 + len(results_df) * 30,
+        margin=dict(l=5, r=5, t=5, b=10),
+        autosize=False
+    )
+
+    return html.Div([
+        html.Div(f"{len(results_df)} tickers match the screen", style=text_styles['subtitle']),
+        html.Div([dcc.Graph(figure=results_table)], style={'display': 'flex', 'justifyContent': 'center', 'width': '100%'}),
+    ]), list(results_df['Ticker'])
+
+#Callback of the sector view (whole universe, grouped by sector or industry)
+@app.callback(
+    Output('sectors-container', 'children'),
+    [Input('run-sectors-button', 'n_clicks')],
+    [State('sector-level-radio', 'value'),
+     State('sector-weighting-radio', 'value')],
+    prevent_initial_call=True
+)
+@track_memory
+def run_sector_view(n_clicks, level, weighting):
+    try:
+        sector_df, _ = sector_analyzer.sector_view(level, weighting)
+    except ValueError as e:
+        return html.Div(str(e), style=text_styles['subtitle'])
+
+    #Table with the name of the group as the first column (see figures.create_metrics_table)
+    level_name = sector_df.index.name
+    sector_table = create_metrics_table(sector_df.reset_index().set_index(level_name, drop=False))
+    sector_beta_fig = create_sector_beta_chart(sector_df, level_name)
+
+    return html.Div([
+        html.Div(f"{len(sector_df)} {level_name.lower()} groups, {int(sector_df['Tickers'].sum())} tickers ({weighting}-weighted returns)",
+                 style=text_styles['subtitle']),
+        html.Div([dcc.Graph(figure=sector_table)], style={'display': 'flex', 'justifyContent': 'center', 'width': '100%'}),
+        dcc.Graph(figure=sector_beta_fig),
+    ])
+
+#Options of the ticker dropdown: the best matches of the text typed (at most MAX_SEARCH_RESULTS tickers)
+#The selected tickers are always kept in the options, or the dropdown could not show them
+#(the value also changes when the screened tickers are used)
+@app.callback(
+    Output('ticker-dropdown', 'options'),
+    [Input('ticker-dropdown', 'search_value'),
+     Input('ticker-dropdown', 'value')],
+    prevent_initial_call=True
+)
+def update_ticker_options(search_value, selected_tickers):
+    search_index = get_ticker_search_index()
+    selected_options = search_index.get_options(selected_tickers)
+    selected = set(selected_tickers or [])
+    return selected_options + [option for option in search_index.search(search_value) if option['value'] not in selected]
+
+#Callback to use the screened tickers as the selection of the analysis
+@app.callback(
+    Output('ticker-dropdown', 'value'),
+    [Input('use-screener-results-button', 'n_clicks')],
+    [State('screener-results-store', 'data')],
+    prevent_initial_call=True
+)
+def use_screener_results(n_clicks, screened_tickers):
+    if not screened_tickers:
+        raise PreventUpdate
+    return screened_tickers
+
 # Callback to show/hide the ticker selection based on the yes/no radio button
 @app.callback(
     Output('ticker-scatter-container', 'style'),
@@ -725,31 +874,34 @@ def toggle_ticker_selection(show_scatter):
     Output('selected-scatter-container', 'children'),
     [Input('display-scatter-button', 'n_clicks')],
     [State('ticker-scatter-checklist', 'value'),
-     State('show-scatter-radio', 'value')],
+     State('show-scatter-radio', 'value'),
+     State('analysis-store', 'data')],
     prevent_initial_call=True
 )
 
-def display_selected_scatter_plots(n_clicks, selected_tickers, show_scatter):
+@track_memory
+def display_selected_scatter_plots(n_clicks, selected_tickers, show_scatter, analysis_data=None):
     print(f"Display function called with: n_clicks={n_clicks}, selected_tickers={selected_tickers}, show_scatter={show_scatter}")
     
-    if not n_clicks or show_scatter != 'yes' or not selected_tickers:
+    if not n_clicks or show_scatter != 'yes' or not selected_tickers or not analysis_data:
         print("Early return: conditions not met")
         return []
 
     scatter_plots = []
-    print(f"Scatter plots dict exists: {'scatter_plots_dict' in dir(app)}")
-    if hasattr(app, 'scatter_plots_dict'):
-        print(f"Available tickers: {list(app.scatter_plots_dict.keys())}")
+    #Figures of the period analyzed by this session
+    analysis = session_analysis(analysis_data)
+    all_scatter_plots = get_scatter_plots(analysis)
     
     # Loop through each selected ticker and add its scatter plot
     for ticker in selected_tickers:
         try:
-            if not hasattr(app, 'scatter_plots_dict'):
-                print(f"No scatter_plots_dict found on app object")
-                scatter_plots.append(html.Div(f"Error: No scatter plots dictionary available", style=text_styles['subtitle']))
-                continue
-                
-            scatter_fig = app.scatter_plots_dict.get(ticker)
+            scatter_fig = all_scatter_plots.get(ticker)
+            #Figures dropped by the memory budget are built again (only for the tickers analyzed by this session)
+            if scatter_fig is None and ticker in analysis_data['tickers']:
+                scatter_fig = build_scatter_plot(analysis, ticker)
+                all_scatter_plots[ticker] = scatter_fig
+            elif ticker not in analysis_data['tickers']:
+                scatter_fig = None
             print(f"For ticker {ticker}, found figure: {scatter_fig is not None}")
             
             if scatter_fig is not None:
@@ -767,6 +919,41 @@ def display_selected_scatter_plots(n_clicks, selected_tickers, show_scatter):
     print(f"Returning {len(scatter_plots)} scatter plot divs")
     return scatter_plots
 
+#Download links of the metrics table and the rolling analysis of the analyzed tickers
+#The files are streamed by the /api/export endpoints (see exporter.py), nothing is built in the browser
+#The window slider is only read here: moving it updates the rolling links in the browser (rolling.export_links)
+@app.callback(
+    Output('export-links-container', 'children'),
+    [Input('ticker-scatter-checklist', 'options'),
+     Input('regression-method-radio', 'value')],
+    [State('window-size-slider', 'value'),
+     State('date-range-picker', 'start_date'),
+     State('date-range-picker', 'end_date')],
+    prevent_initial_call=True
+)
+
+def update_export_links(analyzed_ticker_options, regression_method, window_size, start_date=None, end_date=None):
+    from urllib.parse import urlencode
+
+    if not analyzed_ticker_options:
+        return []
+    tickers = ','.join(option['value'] for option in analyzed_ticker_options)
+    #Same period as the analysis
+    period = {key: value for key, value in [('start', start_date), ('end', end_date)] if value}
+
+    links = []
+    for label, endpoint, params in [
+        ('Metrics', 'metrics', {'method': regression_method}),
+        (f'Rolling CAPM ({window_size}m)', 'rolling', {'window': window_size}),
+    ]:
+        for export_format in ['csv', 'parquet']:
+            query = urlencode({'tickers': tickers, **params, **period, 'format': export_format})
+            link_id = {'type': f'{endpoint}-export-link', 'format': export_format}
+            links.append(html.A(f'{label} ({export_format.upper()})', id=link_id, href=f'/api/export/{endpoint}?{query}',
+                                style={'color': colors['text'], 'margin': '0px 10px'}))
+
+    return [html.Label("Download the results: ", style=text_styles['label'])] + links
+
 #Callback to show/hide the rolling beta analyses based on yes/no radio button
 @app.callback(
     Output('rolling-capm-controls-container','style'),
@@ -806,18 +993,25 @@ def show_rolling_beta_section(n_clicks, selected_tickers):
      Output('rolling-capm-loading', 'children')],#loading message also
     [Input('generate-rolling-capm-button', 'n_clicks')],#when the user clicks to run, it will run (input)
     [State('rolling-capm-ticker-checklist', 'value'),#values will depend on the checklist of the rolling beta checklist
-     State('window-size-slider', 'value')],#window size slider for user to select the window
+     State('window-size-slider', 'value'),#window size slider for user to select the window
+     State('rolling-estimators-checklist', 'value'),#extra estimators (EWMA, expanding window) shown with the fixed window
+     State('ewma-halflife-input', 'value'),
+     State('analysis-store', 'data')],#period of the last analysis of this session
     prevent_initial_call=True
 )
 
-def generate_rolling_capm_charts(n_clicks,selected_tickers, window_size):
+@track_memory
+def generate_rolling_capm_charts(n_clicks,selected_tickers, window_size, estimators=None, halflife=12, analysis_data=None):
     print(f"Display function called with: n_clicks={n_clicks}, selected_tickers={selected_tickers}, window_size={window_size}")
 
     #Do not return anything if the user does not click on the run analysis or 
     #if the user clicks and there is nothing in the checklist
     if n_clicks is None or not selected_tickers:
         return [], ''
-    
+
+    halflife = halflife or 12
+    analysis = session_analysis(analysis_data)
+
     #Showing loading message
     loading_message = f'Calculating rolling CAPM metrics for {len(selected_tickers)} tickers...'
     
@@ -828,118 +1022,43 @@ def generate_rolling_capm_charts(n_clicks,selected_tickers, window_size):
 
     for each_ticker in selected_tickers:
         try:
-            rolling_analysis_df = capm_regression.calculate_rol_analysis_ols(ticker=each_ticker,window_size=window_size)
+            #Rolling analysis of every window size of the slider (one pass), sent to the browser with the charts
+            #so moving the slider afterwards swaps the data clientside (see assets/rolling_windows.js)
+            #Over the period of the last analysis
+            rolling_windows = analysis.calculate_rol_analysis_windows(each_ticker)
+            rolling_analysis_df = rolling_windows[window_size]
             #This df will have three columns (Beta, Alpha, R2), with the date as the index
 
-            #creating the rolling beta graph
-            rol_beta_fig = px.line(
-                rolling_analysis_df,
-                x=rolling_analysis_df.index,
-                y='Beta',
-                title=f'Rolling Beta for {each_ticker} (Window: {window_size} months)',
-                labels={'Beta': 'Beta', 'date': 'Date'}
-            )
-
-            # Add a horizontal line at beta = 1 for reference
-            rol_beta_fig.add_shape(
-                type='line',
-                x0=rolling_analysis_df.index.min(),
-                x1=rolling_analysis_df.index.max(),
-                y0=1,
-                y1=1,
-                line=dict(color='black', width=1.5, dash='dash')
-            )
-
-            #Update layout for aesthetic purposes
-            rol_beta_fig.update_layout(
-                plot_bgcolor=colors['background'],
-                paper_bgcolor=colors['background'],
-                font_color=colors['text'],
-                title_x=0.5,
-                height=400,
-                xaxis_title="Date",
-                yaxis_title="Beta Value",
-            )
-
-            #Adding Rolling Alpha Graph
-            rol_alpha_fig = px.line(
-                rolling_analysis_df,
-                x=rolling_analysis_df.index,
-                y='Alpha',
-                title=f'Rolling Alpha for {each_ticker} (Window: {window_size} months)',
-                labels={'Alpha': 'Alpha', 'date': 'Date'}
-            )
-
-            # Add a horizontal line at beta = 1 for reference
-            rol_alpha_fig.add_shape(
-                type='line',
-                x0=rolling_analysis_df.index.min(),
-                x1=rolling_analysis_df.index.max(),
-                y0=1,
-                y1=1,
-                line=dict(color='black', width=1.5, dash='dash')
-            )
-
-            #Update layout for aesthetic purposes
-            rol_alpha_fig.update_layout(
-                plot_bgcolor=colors['background'],
-                paper_bgcolor=colors['background'],
-                font_color=colors['text'],
-                title_x=0.5,
-                height=400,
-                xaxis_title="Date",
-                yaxis_title="Alpha Value",
-            )
-
-            #Adding Rolling R2 Graph
-            rol_r2_fig = px.line(
-                rolling_analysis_df,
-                x=rolling_analysis_df.index,
-                y='R2',
-                title=f'Rolling R2 for {each_ticker} (Window: {window_size} months)',
-                labels={'R2': 'R2', 'date': 'Date'}
-            )
+            #Other estimators selected by the user are shown as extra lines in the same charts
+            estimators_dfs = {f'{window_size}m window': rolling_analysis_df}
+            if 'ewma' in (estimators or []):
+                estimators_dfs[f'EWMA (half-life {halflife}m)'] = analysis.calculate_online_analysis(each_ticker, halflife=halflife)
+            if 'expanding' in (estimators or []):
+                estimators_dfs['Expanding'] = analysis.calculate_online_analysis(each_ticker)
 
-            # Add a horizontal line at beta = 1 for reference
-            rol_r2_fig.add_shape(
-                type='line',
-                x0=rolling_analysis_df.index.min(),
-                x1=rolling_analysis_df.index.max(),
-                y0=1,
-                y1=1,
-                line=dict(color='black', width=1.5, dash='dash')
-            )
+            #Rolling Beta, Alpha and R2 charts (see figures.py)
+            rol_beta_fig, rol_alpha_fig, rol_r2_fig = create_rolling_figures(each_ticker, estimators_dfs, window_size)
 
-            #Update layout for aesthetic purposes
-            rol_r2_fig.update_layout(
-                plot_bgcolor=colors['background'],
-                paper_bgcolor=colors['background'],
-                font_color=colors['text'],
-                title_x=0.5,
-                height=400,
-                xaxis_title="Date",
-                yaxis_title="Alpha Value",
-            )
-            
             #Adding to Rolling Beta Charts
             rolling_capm_charts.append(html.Div([
                 html.H4(f'Rolling CAPM Analysis for {each_ticker}', style=text_styles['subtitle']),
+                dcc.Store(id={'type': 'rolling-windows-store', 'ticker': each_ticker}, data=rolling_windows_store_data(rolling_windows)),
                 html.Div([
-                    dcc.Graph(figure=rol_beta_fig),
+                    dcc.Graph(id={'type': 'rolling-beta-graph', 'ticker': each_ticker}, figure=rol_beta_fig),
                     html.P([
                         html.Strong("Beta Interpretation: "), 
                         "Shows how the stock's sensitivity to market movements changes over time. - β > 1: More volatile than market; β < 1: Less volatile than market.",
                     ], style=text_styles['markdown'])
                 ]),
                 html.Div([
-                    dcc.Graph(figure=rol_alpha_fig),
+                    dcc.Graph(id={'type': 'rolling-alpha-graph', 'ticker': each_ticker}, figure=rol_alpha_fig),
                     html.P([
                         html.Strong("Alpha Interpretation: "), 
                         "Shows how the stock's risk-adjusted performance relative to CAPM changes over time. α > 0: Outperforming the market; α < 0: Underperforming the market.",
                     ], style=text_styles['markdown'])
                 ]),
                 html.Div([
-                    dcc.Graph(figure=rol_r2_fig),
+                    dcc.Graph(id={'type': 'rolling-r2-graph', 'ticker': each_ticker}, figure=rol_r2_fig),
                     html.P([
                         html.Strong("R-squared Interpretation:"), 
                         "Shows how well CAPM explains the stock's returns over time. Higher values indicate market movements (volatility) explain more of the stock's behavior.",
@@ -956,6 +1075,171 @@ def generate_rolling_capm_charts(n_clicks,selected_tickers, window_size):
             ]))
 
     return rolling_capm_charts, ''
-    
+
+#Compact form of the rolling analyses of all window sizes sent to the browser:
+#the dates once, and for each window size the values (4 decimals) of Beta, Alpha and R2
+#Values of a window of n months start at the n-th date
+def rolling_windows_store_data(rolling_windows):
+    longest_df = max(rolling_windows.values(), key=len)
+    first_window = min(rolling_windows)
+    dates = [str(date) for date in longest_df.index]
+    #Dates before the first complete window of the smallest size are not part of any result
+    dates = [None] * (first_window - 1) + dates
+
+    windows = {}
+    for window_size, rolling_analysis_df in rolling_windows.items():
+        windows[window_size] = {metric: [None if pd.isna(value) else round(float(value), 4) for value in rolling_analysis_df[metric]]
+                                for metric in ['Beta', 'Alpha', 'R2']}
+    return {'dates': dates, 'windows': windows}
+
+#Moving the window slider swaps the data of the rolling charts already shown (no server call)
+app.clientside_callback(
+    ClientsideFunction(namespace='rolling', function_name='swap_window'),
+    [Output({'type': 'rolling-beta-graph', 'ticker': MATCH}, 'figure'),
+     Output({'type': 'rolling-alpha-graph', 'ticker': MATCH}, 'figure'),
+     Output({'type': 'rolling-r2-graph', 'ticker': MATCH}, 'figure')],
+    [Input('window-size-slider', 'value')],
+    [State({'type': 'rolling-windows-store', 'ticker': MATCH}, 'data'),
+     State({'type': 'rolling-beta-graph', 'ticker': MATCH}, 'figure'),
+     State({'type': 'rolling-alpha-graph', 'ticker': MATCH}, 'figure'),
+     State({'type': 'rolling-r2-graph', 'ticker': MATCH}, 'figure')],
+    prevent_initial_call=True
+)
+
+#Window of the rolling download links, changed in the browser when the slider moves (no server call)
+app.clientside_callback(
+    ClientsideFunction(namespace='rolling', function_name='export_links'),
+    [Output({'type': 'rolling-export-link', 'format': ALL}, 'href'),
+     Output({'type': 'rolling-export-link', 'format': ALL}, 'children')],
+    [Input('window-size-slider', 'value')],
+    [State({'type': 'rolling-export-link', 'format': ALL}, 'href'),
+     State({'type': 'rolling-export-link', 'format': ALL}, 'children')],
+    prevent_initial_call=True
+)
+
+#Callback to draw the rolling heatmap (tickers x dates) of the selected metric
+#All tickers are calculated in one vectorized pass (panel_analyzer) and drawn as a single heatmap
+@app.callback(
+    Output('rolling-heatmap-container', 'children'),
+    [Input('generate-heatmap-button', 'n_clicks')],
+    [State('rolling-capm-ticker-checklist', 'options'), #all tickers of the analysis
+     State('heatmap-metric-radio', 'value'),
+     State('heatmap-universe-checklist', 'value'),
+     State('window-size-slider', 'value'),
+     State('analysis-store', 'data')],
+    prevent_initial_call=True
+)
+@track_memory
+def generate_rolling_heatmap(n_clicks, analyzed_ticker_options, metric, universe, window_size, analysis_data=None):
+    import plotly.graph_objects as go
+
+    if 'universe' in (universe or []):
+        tickers = [option['value'] for option in get_all_tickers()]
+    else:
+        tickers = [option['value'] for option in (analyzed_ticker_options or [])]
+
+    if not n_clicks or not tickers:
+        return html.Div("Run the analysis first (or select the whole S&P 500) to generate the heatmap", style=text_styles['subtitle'])
+
+    excess_returns_panel, excess_returns_sp500, errors = session_analysis(analysis_data).get_excess_returns_panel(tickers)
+    rolling_results = rolling_capm_panel(excess_returns_panel, excess_returns_sp500, window=window_size)
+
+    #Tickers as rows, sorted by their latest value so similar tickers are next to each other
+    metric_df = rolling_results[metric].dropna(how='all').T.dropna(how='all')
+    #Every ticker failed to fetch, or the window is longer than every history
+    if metric_df.empty:
+        message = f"No ticker has {window_size} months of data to generate the heatmap"
+        if errors:
+            message += f". Could not fetch {len(errors)} tickers: {', '.join(sorted(errors))}"
+        return html.Div(message, style=text_styles['subtitle'])
+    latest_values = metric_df.ffill(axis=1).iloc[:, -1]
+    metric_df = metric_df.loc[latest_values.sort_values().index]
+
+    if metric == 'R2':
+        colorscale = [(0.0, 'white'), (1.0, colors['fill_color_col_table'])]
+        zmid = None
+    else:
+        colorscale = [(0.0, '#891f00'), (0.5, 'white'), (1.0, '#5bbe7d')]
+        #Beta is compared to the market (beta = 1), alpha to zero
+        zmid = 1 if metric == 'Beta' else 0
+
+    heatmap_fig = go.Figure(data=go.Heatmap(
+        z=metric_df.to_numpy(),
+        x=[str(date) for date in metric_df.columns],
+        y=list(metric_df.index),
+        colorscale=colorscale,
+        zmid=zmid,
+        colorbar=dict(title=metric),
+        hovertemplate='%{y}<br>%{x}<br>' + metric + ': %{z:.3f}<extra></extra>'
+    ))
+
+    heatmap_fig.update_layout(
+        title=f'Rolling {metric} of {len(metric_df)} tickers (Window: {window_size} months)',
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        font_color=colors['text'],
+        title_x=0.5,
+        #One row of about 12px per ticker, so 500 tickers still fit on one screen when scrolling
+        height=min(max(400, 12 * len(metric_df) + 150), 6200),
+        xaxis_title="Date",
+        yaxis=dict(title="Ticker", dtick=1 if len(metric_df) <= 60 else None),
+    )
+
+    children = [html.H4(f'Rolling {metric} Heatmap', style=text_styles['subtitle']), dcc.Graph(figure=heatmap_fig)]
+    if errors:
+        children.append(html.P(f"Could not fetch {len(errors)} tickers: {', '.join(sorted(errors))}", style=text_styles['markdown']))
+    return html.Div(children)
+
+#Showing the simulation section once the analysis runs
+@app.callback(
+    Output('simulation-section', 'style'),
+    [Input('run-analysis-button', 'n_clicks')],
+    [State('ticker-dropdown', 'value')],
+    prevent_initial_call=True
+)
+def show_simulation_section(n_clicks, selected_tickers):
+    if n_clicks is None or not selected_tickers:
+        return {'display': 'none'}
+    return {'display': 'block'}
+
+#Callback of the Monte Carlo simulation of the analyzed tickers (see simulation.py)
+@app.callback(
+    Output('simulation-container', 'children'),
+    [Input('run-simulation-button', 'n_clicks')],
+    [State('rolling-capm-ticker-checklist', 'options'), #all tickers of the analysis
+     State('simulation-method-radio', 'value'),
+     State('simulation-horizons-checklist', 'value'),
+     State('simulation-paths-input', 'value'),
+     State('analysis-store', 'data')],
+    prevent_initial_call=True
+)
+@track_memory
+def run_simulation(n_clicks, analyzed_ticker_options, method, horizons, n_paths, analysis_data=None):
+    tickers = [option['value'] for option in (analyzed_ticker_options or [])]
+    if not n_clicks or not tickers:
+        return html.Div("Run the analysis first to simulate its tickers", style=text_styles['subtitle'])
+    if not horizons:
+        return html.Div("Select at least one horizon", style=text_styles['subtitle'])
+
+    #Same limits as the input (an empty input uses the default)
+    n_paths = min(max(int(n_paths or DEFAULT_PATHS), 1000), MAX_SIMULATION_PATHS)
+    try:
+        summary_df, histograms, errors = session_analysis(analysis_data).simulate_returns(tickers, n_paths=n_paths, horizons=horizons, method=method)
+    except ValueError as e:
+        return html.Div(f"Could not run the simulation: {e}", style=text_styles['subtitle'])
+
+    children = [
+        html.Div(f"{n_paths:,} paths ({method}), returns compounded over each horizon. VaR / CVaR: loss not exceeded "
+                 "in 95% (99%) of the paths / mean loss of the 5% (1%) worst paths", style=text_styles['markdown']),
+        html.Div([dcc.Graph(figure=create_metrics_table(summary_df))], style={'display': 'flex', 'justifyContent': 'center', 'width': '100%'}),
+    ]
+    for horizon in sorted(histograms):
+        horizon_df = summary_df[summary_df['Horizon (months)'] == horizon]
+        children.append(dcc.Graph(figure=create_simulation_chart(histograms[horizon], horizon_df, horizon)))
+    if errors:
+        children.append(html.P(f"Could not fetch {len(errors)} tickers: {', '.join(sorted(errors))}", style=text_styles['markdown']))
+    return html.Div(children)
+
 if __name__ == '__main__':
+    warmup.start()
     app.run_server(debug=True)
\ No newline at end of file
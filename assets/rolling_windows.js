@@ -0,0 +1,50 @@
+/* Clientside callbacks of the Rolling CAPM charts (and of their download links)
+   The rolling analysis of every window size is sent once (dcc.Store next to the charts of each ticker),
+   so moving the window slider only swaps the data of the fixed window line, without calling the server */
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    rolling: {
+        swap_window: function(windowSize, data, betaFigure, alphaFigure, r2Figure) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (!data || !data.windows[windowSize]) {
+                return [noUpdate, noUpdate, noUpdate];
+            }
+
+            const values = data.windows[windowSize];
+            //Values of a window of n months start at the n-th date
+            const dates = data.dates.slice(windowSize - 1);
+            const name = windowSize + 'm window';
+
+            function swap(figure, metric) {
+                //The fixed window is always the first line (EWMA and expanding lines are not changed)
+                const oldTrace = figure.data[0];
+                const trace = Object.assign({}, oldTrace, {
+                    x: dates,
+                    y: values[metric],
+                    name: name,
+                    legendgroup: name,
+                    hovertemplate: (oldTrace.hovertemplate || '').replace(oldTrace.name, name)
+                });
+                const title = Object.assign({}, figure.layout.title, {
+                    text: figure.layout.title.text.replace(/Window: \d+ months/, 'Window: ' + windowSize + ' months')
+                });
+                return Object.assign({}, figure, {
+                    data: [trace].concat(figure.data.slice(1)),
+                    layout: Object.assign({}, figure.layout, {title: title})
+                });
+            }
+
+            return [swap(betaFigure, 'Beta'), swap(alphaFigure, 'Alpha'), swap(r2Figure, 'R2')];
+        },
+
+        //Download links of the rolling analysis: same files with the window of the slider
+        export_links: function(windowSize, hrefs, labels) {
+            if (!windowSize || !hrefs || hrefs.length === 0) {
+                return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+            }
+            return [
+                hrefs.map(href => href.replace(/([?&]window=)\d+/, '$1' + windowSize)),
+                labels.map(label => label.replace(/\(\d+m\)/, '(' + windowSize + 'm)'))
+            ];
+        }
+    }
+});
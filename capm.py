@@ -0,0 +1,437 @@
+#Command-line entry point for running the CAPM analysis without the Dash webapp
+#Usage: python -m capm analyze --tickers AAPL MSFT --window 12 --out results.parquet
+#Only pandas/statsmodels/yfinance are imported (through ticker_analyzer), no Dash or Plotly
+import argparse
+import json
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from ticker_analyzer import TickerReturns, CAPM_METRIC_COLUMNS
+from data_providers import PROVIDERS, get_provider
+
+#File formats supported for the output files (chosen by the extension of --out)
+OUTPUT_FORMATS = ('.csv', '.parquet')
+
+#Import-time budget (seconds) of each entry point, checked by "python -m capm profile-imports"
+#(and by tests/test_import_budgets.py with CAPM_CHECK_IMPORT_TIME=1)
+#Heavy libraries (yfinance, statsmodels, plotly.express) must be imported lazily to stay under it
+#About twice the measured time (pandas alone takes ~0.45s, app ~0.8s), so a slower machine does not fail
+#while importing a heavy library eagerly (e.g. statsmodels adds ~1s) still does
+IMPORT_BUDGETS = {
+    'capm': 1.0,
+    'ticker_analyzer': 1.0,
+    'data_preprocessing': 1.0,
+    'app': 2.0,
+}
+
+#Libraries that must not be loaded when importing a module (module -> libraries)
+FORBIDDEN_IMPORTS = {
+    'capm': ['dash', 'plotly', 'yfinance', 'statsmodels'],
+    'ticker_analyzer': ['dash', 'plotly', 'yfinance', 'statsmodels'],
+    'data_preprocessing': ['dash', 'plotly', 'yfinance'],
+    'app': ['plotly.express', 'yfinance', 'statsmodels'],
+}
+
+
+#Reading tickers from a JSON file with the same format as data/sp500_tickers.json
+def load_tickers_file(path):
+    with open(path, 'r') as f:
+        ticker_options = json.load(f)
+    return [option['value'] if isinstance(option, dict) else option for option in ticker_options]
+
+
+#Path of the rolling series file, next to the metrics file (results.parquet -> results_rolling.parquet)
+def rolling_output_path(out_path):
+    out_path = Path(out_path)
+    return out_path.with_name(f"{out_path.stem}_rolling{out_path.suffix}")
+
+
+def write_frame(df, path):
+    path = Path(path)
+    if path.suffix == '.parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+#CAPM metrics and rolling analysis of one ticker (runs inside a worker thread)
+def analyze_ticker(capm_regression, ticker, window_size):
+    ticker_excess_returns = capm_regression.ticker_excess_returns_df(ticker)
+    metrics = capm_regression.calculate_capm_metrics(ticker, ticker_excess_returns)
+
+    rolling_analysis_df = capm_regression.calculate_rol_analysis_ols(ticker, window_size=window_size)
+    rolling_analysis_df = rolling_analysis_df.rename_axis('Date').reset_index()
+    rolling_analysis_df.insert(0, 'Ticker', ticker)
+
+    return metrics, rolling_analysis_df
+
+
+#Running the analysis of all tickers in parallel (fetching data is mostly waiting on the API)
+def run_analysis(tickers, window_size=12, workers=8, capm_regression=None, provider=None):
+    if capm_regression is None:
+        capm_regression = TickerReturns(provider)
+
+    #Fetching the SP500 and the risk free rate once, before the workers start using them
+    capm_regression.get_sp500_excess_returns_df()
+
+    all_metrics = {}
+    all_rolling = {}
+    errors = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(analyze_ticker, capm_regression, ticker, window_size): ticker for ticker in tickers}
+        for future in as_completed(futures):
+            ticker = futures[future]
+            try:
+                all_metrics[ticker], all_rolling[ticker] = future.result()
+            except Exception as e:
+                errors[ticker] = str(e)
+                print(f"Error analyzing {ticker}: {e}", file=sys.stderr)
+
+    #Keeping the order of the input tickers in the output files
+    done = [ticker for ticker in tickers if ticker in all_metrics]
+    metrics_df = pd.DataFrame([all_metrics[ticker] for ticker in done], columns=CAPM_METRIC_COLUMNS)
+    #Downside risk of all tickers in one vectorized pass (the excess returns are already cached)
+    downside = capm_regression.calculate_downside_risk(done, workers=workers)
+    metrics_df = metrics_df.join(pd.DataFrame([downside.get(ticker, {}) for ticker in done]))
+    if done:
+        rolling_df = pd.concat([all_rolling[ticker] for ticker in done], ignore_index=True)
+    else:
+        rolling_df = pd.DataFrame(columns=['Ticker', 'Date', 'Alpha', 'Beta', 'R2'])
+
+    return metrics_df, rolling_df, errors
+
+
+#Returns of the period given by --start and --end, sliced from the downloaded history (the whole history by default)
+#Raises ValueError when a date is invalid
+def period_returns(args):
+    capm_regression = TickerReturns(get_provider(args.provider))
+    return capm_regression.with_date_range(args.start, args.end)
+
+
+def command_analyze(args):
+    tickers = list(args.tickers or [])
+    if args.tickers_file:
+        tickers += load_tickers_file(args.tickers_file)
+    #Removing duplicates while keeping the order
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        print("No tickers given, use --tickers or --tickers-file", file=sys.stderr)
+        return 2
+
+    if Path(args.out).suffix not in OUTPUT_FORMATS:
+        print(f"Unsupported output format {args.out}, use one of {OUTPUT_FORMATS}", file=sys.stderr)
+        return 2
+
+    try:
+        capm_regression = period_returns(args)
+    except ValueError as e:
+        print(f"Invalid period: {e}", file=sys.stderr)
+        return 2
+
+    start = time.time()
+    metrics_df, rolling_df, errors = run_analysis(tickers, window_size=args.window, workers=args.workers,
+                                                  capm_regression=capm_regression)
+
+    metrics_path = write_frame(metrics_df, args.out)
+    rolling_path = write_frame(rolling_df, rolling_output_path(args.out))
+
+    print(f"Analyzed {len(metrics_df)}/{len(tickers)} tickers in {time.time() - start:.1f}s")
+    print(f"Saved metrics to {metrics_path} and rolling series to {rolling_path}")
+
+    return 1 if errors else 0
+
+
+#Static HTML report (metrics table, bar charts, scatter and rolling charts), see report.py
+def command_report(args):
+    from report import build_report
+
+    tickers = list(args.tickers or [])
+    if args.tickers_file:
+        tickers += load_tickers_file(args.tickers_file)
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        print("No tickers given, use --tickers or --tickers-file", file=sys.stderr)
+        return 2
+
+    try:
+        capm_regression = period_returns(args)
+    except ValueError as e:
+        print(f"Invalid period: {e}", file=sys.stderr)
+        return 2
+
+    title = 'CAPM Risk-Return Report'
+    if args.start or args.end:
+        title += f" ({args.start or 'start'} to {args.end or 'end'})"
+    output_path, errors = build_report(tickers, args.out, window_size=args.window, workers=args.workers,
+                                       capm_regression=capm_regression, scatter=not args.no_scatter,
+                                       rolling=not args.no_rolling, title=title)
+    for ticker, error in errors.items():
+        print(f"Error analyzing {ticker}: {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+#Monte Carlo simulation of the returns implied by the CAPM (see simulation.py), table written to --out
+def command_simulate(args):
+    tickers = list(args.tickers or [])
+    if args.tickers_file:
+        tickers += load_tickers_file(args.tickers_file)
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        print("No tickers given, use --tickers or --tickers-file", file=sys.stderr)
+        return 2
+
+    if args.out and Path(args.out).suffix not in OUTPUT_FORMATS:
+        print(f"Unsupported output format {args.out}, use one of {OUTPUT_FORMATS}", file=sys.stderr)
+        return 2
+
+    try:
+        capm_regression = period_returns(args)
+    except ValueError as e:
+        print(f"Invalid period: {e}", file=sys.stderr)
+        return 2
+
+    start = time.time()
+    try:
+        summary_df, _, errors = capm_regression.simulate_returns(tickers, n_paths=args.paths, horizons=args.horizons,
+                                                                  method=args.method, seed=args.seed, workers=args.workers)
+    except ValueError as e:
+        print(f"Could not run the simulation: {e}", file=sys.stderr)
+        return 2
+    for ticker, error in errors.items():
+        print(f"Error fetching {ticker}: {error}", file=sys.stderr)
+
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.max_rows', None):
+        print(summary_df.to_string(index=False))
+    simulated = len(set(tickers) & set(summary_df['Ticker']))
+    print(f"Simulated {args.paths} paths of {simulated}/{len(tickers)} tickers in {time.time() - start:.1f}s")
+    if args.out:
+        print(f"Saved the simulation to {write_frame(summary_df, args.out)}")
+    return 1 if errors else 0
+
+
+#Importing a module in a fresh interpreter and measuring the wall time of the import
+#Returns the import time, the heaviest imports (from python -X importtime) and the forbidden libraries loaded
+def profile_import(module, forbidden=()):
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(','.join(name for name in {list(forbidden)!r} if name in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True, cwd=Path(__file__).resolve().parent)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    #Last two lines printed by the code above (the module itself may print before them)
+    elapsed, loaded = result.stdout.split('\n')[-3:-1]
+
+    #Lines look like "import time:  self [us] | cumulative | imported package"
+    heaviest = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        heaviest.append((int(cumulative), name.rstrip()))
+    heaviest.sort(reverse=True)
+
+    return float(elapsed), heaviest, [name for name in loaded.split(',') if name]
+
+
+#Concurrent users on the webapp (see load_test.py), fails when a request has an error
+def command_load_test(args):
+    from load_test import run_load_test
+
+    tickers = list(args.tickers or [])
+    if args.tickers_file:
+        tickers += load_tickers_file(args.tickers_file)
+    tickers = list(dict.fromkeys(tickers)) or None
+
+    summary = run_load_test(users=args.users, iterations=args.iterations, tickers=tickers,
+                            tickers_per_user=args.tickers_per_user, window_size=args.window, url=args.url,
+                            seed=args.seed, quiet=not args.verbose)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Saved the report to {args.out}")
+    return 1 if summary['total']['errors'] else 0
+
+
+def command_profile_imports(args):
+    modules = args.modules or list(IMPORT_BUDGETS)
+    failed = False
+
+    for module in modules:
+        budget = args.budget if args.budget is not None else IMPORT_BUDGETS.get(module, 1.0)
+        #Best of a few runs, so a busy machine does not make the check flaky
+        runs = [profile_import(module, FORBIDDEN_IMPORTS.get(module, ())) for _ in range(args.repeat)]
+        elapsed, heaviest, loaded = min(runs, key=lambda run: run[0])
+
+        status = 'OK' if elapsed <= budget and not loaded else 'FAIL'
+        failed = failed or status == 'FAIL'
+        print(f"{status} {module}: {elapsed:.3f}s (budget {budget:.2f}s)")
+        if loaded:
+            print(f"    forbidden imports loaded: {', '.join(loaded)}")
+        for cumulative, name in heaviest[:args.top]:
+            print(f"    {cumulative/1e6:.3f}s {name}")
+
+    return 1 if failed else 0
+
+
+#Downloading every ticker to one consolidated file (resumable, see DataPreprocessor.bulk_ingest)
+def command_ingest(args):
+    from data_preprocessing import DataPreprocessor
+
+    preprocessor = DataPreprocessor(get_provider(args.provider))
+    ticker_list = args.tickers if args.tickers else None
+    output_path, failed = preprocessor.bulk_ingest(ticker_list, tickers_path=args.tickers_file,
+                                                   output_path=args.out, workers=args.workers, refresh=args.refresh)
+    return 1 if failed else 0
+
+
+#Filling the sector, industry and market cap of the ticker store from the provider (see DataPreprocessor.fill_ticker_metadata)
+def command_metadata(args):
+    from data_preprocessing import DataPreprocessor
+
+    preprocessor = DataPreprocessor(get_provider(args.provider))
+    without_sector = preprocessor.fill_ticker_metadata(args.tickers_file, market_caps=args.market_caps, workers=args.workers)
+    return 1 if without_sector else 0
+
+
+#Creating or updating the streaming CAPM states of the tickers (saved in one JSON file)
+#Tickers that already have a state only add the months after their last update
+def command_states(args):
+    from capm_estimators import load_states, save_states
+
+    states = load_states(args.out) if Path(args.out).exists() else {}
+    tickers = list(dict.fromkeys(list(args.tickers or []) + (load_tickers_file(args.tickers_file) if args.tickers_file else [])))
+    #Without tickers, the tickers already saved are updated
+    tickers = tickers or list(states)
+
+    capm_regression = TickerReturns(get_provider(args.provider))
+    capm_regression.capm_states = states
+    sp500_expected_returns, rf = capm_regression.get_market_expectations()
+
+    #Same update as a refresh of the market data (only the months after the last update of each state)
+    errors = capm_regression.update_capm_states(tickers)
+    failed = bool(errors)
+    for ticker in tickers:
+        if ticker in errors:
+            continue
+        try:
+            metrics = states[ticker].metrics(sp500_expected_returns, rf)
+            print(f"{ticker}: Beta={metrics['Beta']:.3f} Alpha={metrics['Alpha (%)']:.3f}% "
+                  f"Sharpe={metrics['Sharpe Ratio']:.3f} (until {states[ticker].last_date}, {states[ticker].outliers} outliers)")
+        except Exception as e:
+            failed = True
+            print(f"Error updating {ticker}: {e}", file=sys.stderr)
+
+    save_states(states, args.out)
+    print(f"Saved {len(states)} states to {args.out}")
+    return 1 if failed else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m capm', description='CAPM Risk-Return Analysis (batch mode)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    analyze = subparsers.add_parser('analyze', help='calculate CAPM metrics and rolling series for a list of tickers')
+    analyze.add_argument('--tickers', nargs='+', help='tickers to analyze (e.g. AAPL MSFT)')
+    analyze.add_argument('--tickers-file', help='JSON file with tickers (same format as data/sp500_tickers.json)')
+    analyze.add_argument('--window', type=int, default=12, help='rolling window size in months (default: 12)')
+    analyze.add_argument('--workers', type=int, default=8, help='number of tickers analyzed in parallel (default: 8)')
+    analyze.add_argument('--out', required=True, help='output file for the metrics (.csv or .parquet)')
+    analyze.add_argument('--provider', choices=list(PROVIDERS), help='where the data comes from (default: CAPM_DATA_PROVIDER or yfinance)')
+    analyze.add_argument('--start', help='first month of the analysis (e.g. 2008, 2008-06 or 2008-06-15, default: whole history)')
+    analyze.add_argument('--end', help='last month of the analysis (e.g. 2012 means up to December 2012, default: whole history)')
+    analyze.set_defaults(func=command_analyze)
+
+    ingest = subparsers.add_parser('ingest', help='download all tickers to one consolidated Parquet file (resumable)')
+    ingest.add_argument('--tickers', nargs='+', help='tickers to download (default: every ticker in --tickers-file)')
+    ingest.add_argument('--tickers-file', default='data/sp500_tickers.json', help='JSON file with tickers (default: data/sp500_tickers.json)')
+    ingest.add_argument('--workers', type=int, default=8, help='number of tickers downloaded in parallel (default: 8)')
+    ingest.add_argument('--out', help='consolidated output file (default: data/sp500_monthly_20y.parquet)')
+    ingest.add_argument('--refresh', action='store_true', help='download every ticker again, even if the last run is from this month')
+    ingest.add_argument('--provider', choices=list(PROVIDERS), help='where the data comes from (default: CAPM_DATA_PROVIDER or yfinance)')
+    ingest.set_defaults(func=command_ingest)
+
+    states = subparsers.add_parser('states', help='create or update the streaming CAPM states of the tickers (JSON file)')
+    states.add_argument('--tickers', nargs='+', help='tickers to add or update (default: the tickers already in --out)')
+    states.add_argument('--tickers-file', help='JSON file with tickers (same format as data/sp500_tickers.json)')
+    states.add_argument('--out', default='capm_states.json', help='JSON file with the states (default: capm_states.json)')
+    states.add_argument('--provider', choices=list(PROVIDERS), help='where the data comes from (default: CAPM_DATA_PROVIDER or yfinance)')
+    states.set_defaults(func=command_states)
+
+    metadata = subparsers.add_parser('metadata', help='fill the sector, industry and market cap of the ticker store from the provider')
+    metadata.add_argument('--tickers-file', default='data/sp500_tickers.json', help='ticker store to fill (default: data/sp500_tickers.json)')
+    metadata.add_argument('--market-caps', action='store_true', help='also fill the market caps (needed for cap-weighted sectors)')
+    metadata.add_argument('--workers', type=int, default=8, help='number of tickers fetched in parallel (default: 8)')
+    metadata.add_argument('--provider', choices=list(PROVIDERS), help='where the data comes from (default: CAPM_DATA_PROVIDER or yfinance)')
+    metadata.set_defaults(func=command_metadata)
+
+    report = subparsers.add_parser('report', help='write a self-contained HTML report (works offline)')
+    report.add_argument('--tickers', nargs='+', help='tickers of the report (e.g. AAPL MSFT)')
+    report.add_argument('--tickers-file', help='JSON file with tickers (same format as data/sp500_tickers.json)')
+    report.add_argument('--window', type=int, default=12, help='rolling window size in months (default: 12)')
+    report.add_argument('--workers', type=int, help='processes building the figures (default: number of CPUs)')
+    report.add_argument('--out', default='capm_report.html', help='output HTML file (default: capm_report.html)')
+    report.add_argument('--no-scatter', action='store_true', help='do not include the scatter plot of each ticker')
+    report.add_argument('--no-rolling', action='store_true', help='do not include the rolling charts of each ticker')
+    report.add_argument('--provider', choices=list(PROVIDERS), help='where the data comes from (default: CAPM_DATA_PROVIDER or yfinance)')
+    report.add_argument('--start', help='first month of the report (default: whole history)')
+    report.add_argument('--end', help='last month of the report (default: whole history)')
+    report.set_defaults(func=command_report)
+
+    simulate = subparsers.add_parser('simulate', help='Monte Carlo simulation of the returns implied by the CAPM (VaR and CVaR)')
+    simulate.add_argument('--tickers', nargs='+', help='tickers to simulate (e.g. AAPL MSFT)')
+    simulate.add_argument('--tickers-file', help='JSON file with tickers (same format as data/sp500_tickers.json)')
+    simulate.add_argument('--paths', type=int, default=10000, help='simulated paths (default: 10000)')
+    simulate.add_argument('--horizons', type=int, nargs='+', default=[1, 12], help='horizons in months (default: 1 12)')
+    simulate.add_argument('--method', choices=['bootstrap', 'normal'], default='bootstrap',
+                          help='bootstrap of the SP500 months or normal distribution fitted to them (default: bootstrap)')
+    simulate.add_argument('--seed', type=int, default=0, help='seed of the random paths (default: 0)')
+    simulate.add_argument('--workers', type=int, help='processes simulating the paths (default: the shared pool, see CAPM_SIMULATION_WORKERS)')
+    simulate.add_argument('--out', help='output file for the simulation table (.csv or .parquet)')
+    simulate.add_argument('--provider', choices=list(PROVIDERS), help='where the data comes from (default: CAPM_DATA_PROVIDER or yfinance)')
+    simulate.add_argument('--start', help='first month used for the Betas and the SP500 draws (default: whole history)')
+    simulate.add_argument('--end', help='last month used for the Betas and the SP500 draws (default: whole history)')
+    simulate.set_defaults(func=command_simulate)
+
+    load_test = subparsers.add_parser('load-test', help='simulate concurrent users of the webapp and report latency and errors')
+    load_test.add_argument('--users', type=int, default=4, help='simulated users at the same time (default: 4)')
+    load_test.add_argument('--iterations', type=int, default=3, help='scenarios (analysis, scatter plots, rolling charts) run by each user (default: 3)')
+    load_test.add_argument('--tickers', nargs='+', help='tickers drawn by the users (default: the 7 largest tickers)')
+    load_test.add_argument('--tickers-file', help='JSON file with tickers (same format as data/sp500_tickers.json)')
+    load_test.add_argument('--tickers-per-user', type=int, default=3, help='tickers analyzed by each user in a scenario (default: 3)')
+    load_test.add_argument('--window', type=int, default=12, help='rolling window size in months (default: 12)')
+    load_test.add_argument('--url', help='webapp to test (default: started in this process with the synthetic provider)')
+    load_test.add_argument('--seed', type=int, default=0, help='seed of the tickers drawn by the users (default: 0)')
+    load_test.add_argument('--out', help='JSON file for the report')
+    load_test.add_argument('--verbose', action='store_true', help='show what the webapp prints during the test')
+    load_test.set_defaults(func=command_load_test)
+
+    profile = subparsers.add_parser('profile-imports', help='check the import time of the entry points against their budget')
+    profile.add_argument('modules', nargs='*', help=f'modules to check (default: {" ".join(IMPORT_BUDGETS)})')
+    profile.add_argument('--budget', type=float, help='budget in seconds for every module (overrides the defaults)')
+    profile.add_argument('--repeat', type=int, default=3, help='number of runs, the fastest one is used (default: 3)')
+    profile.add_argument('--top', type=int, default=5, help='number of heaviest imports to show (default: 5)')
+    profile.set_defaults(func=command_profile_imports)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,282 @@
+#Online (streaming) estimators of Beta, Alpha and R2
+#Instead of refitting a regression on every window, the estimator keeps running sums of the market
+#and ticker excess returns. Each new monthly bar updates every ticker in O(1):
+#- Expanding window: all months since the start have the same weight
+#- EWMA: older months weigh less, the weight halves every "halflife" months
+#The formulas are the same OLS formulas used in panel_analyzer, with weighted sums
+#CAPMState keeps the same kind of sums for one ticker in a serializable object, so the metrics can be
+#saved, merged and updated with new months without going through the whole history again
+#Its outliers are decided online (OUTLIER_STDS): removing outliers with the IQR of the whole history would change
+#which earlier months are kept every time a month is added
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+ESTIMATOR_METRICS = ['Beta', 'Alpha', 'R2']
+
+#Online outlier rule of CAPMState: a month further than OUTLIER_STDS standard deviations from the mean of the
+#months seen before it is left out (the bounds of the IQR rule, Q1 - 1.5 IQR and Q3 + 1.5 IQR, are 2.698 standard
+#deviations from the mean of normal returns). The rule applies once OUTLIER_MIN_MONTHS months were seen
+OUTLIER_STDS = 2.698
+OUTLIER_MIN_MONTHS = 12
+
+
+#Welford update of [count, mean, sum of squared deviations] with one value
+def welford_add(stats, value):
+    n, mean, m2 = stats
+    n += 1
+    delta = value - mean
+    mean += delta / n
+    return [n, mean, m2 + delta * (value - mean)]
+
+
+#Combining the [count, mean, sum of squared deviations] of two sets of values (parallel formula, Chan et al.)
+def welford_merge(stats, other):
+    n = stats[0] + other[0]
+    if not n:
+        return [0, 0.0, 0.0]
+    delta = other[1] - stats[1]
+    return [n, stats[1] + delta * other[0] / n, stats[2] + other[2] + delta ** 2 * stats[0] * other[0] / n]
+
+
+#Online outlier rule for one value, stats: [count, mean, sum of squared deviations] of the months seen
+#The months seen include the outliers clipped to the bounds: with only the months kept, a low first estimate
+#of the standard deviation would keep leaving out normal months, and with the raw outliers one crash would
+#hide the next ones
+#Returns whether the value is an outlier and the stats with the new month
+def check_outlier(value, stats):
+    n, mean, m2 = stats
+    clipped = value
+    if n >= OUTLIER_MIN_MONTHS and m2 > 0:
+        bound = OUTLIER_STDS * math.sqrt(m2 / (n - 1))
+        clipped = min(max(value, mean - bound), mean + bound)
+    return clipped != value, welford_add(stats, clipped)
+
+
+class OnlineCAPMEstimator:
+    #n_tickers: number of tickers updated together (one value per ticker in each update)
+    #halflife: EWMA half-life in months, None for the expanding window
+    #min_periods: months needed before an estimate is returned
+    def __init__(self, n_tickers, halflife=None, min_periods=12):
+        if halflife is not None and halflife <= 0:
+            raise ValueError("halflife must be positive")
+        self.halflife = halflife
+        self.decay = 0.5 ** (1 / halflife) if halflife else 1.0
+        self.min_periods = min_periods
+
+        self.count = np.zeros(n_tickers)
+        self.weight = np.zeros(n_tickers)
+        self.sum_x = np.zeros(n_tickers)
+        self.sum_y = np.zeros(n_tickers)
+        self.sum_xx = np.zeros(n_tickers)
+        self.sum_xy = np.zeros(n_tickers)
+        self.sum_yy = np.zeros(n_tickers)
+
+    @property
+    def mode(self):
+        return 'Expanding' if self.halflife is None else f'EWMA (half-life {self.halflife}m)'
+
+    #Adding one bar: market excess return (number) and the excess return of each ticker (array, NaN if missing)
+    def update(self, market_excess, tickers_excess):
+        y = np.asarray(tickers_excess, dtype=float)
+        valid = ~np.isnan(y) & (not np.isnan(market_excess))
+        x = np.where(valid, market_excess, 0.0)
+        y = np.where(valid, y, 0.0)
+        w = valid.astype(float)
+
+        #Older observations lose weight at every bar (decay is 1 for the expanding window)
+        for name, new_value in (('weight', w), ('sum_x', x), ('sum_y', y), ('sum_xx', x * x),
+                                ('sum_xy', x * y), ('sum_yy', y * y)):
+            stat = getattr(self, name)
+            stat *= self.decay
+            stat += new_value
+        self.count += w
+
+    #Current Beta, Alpha and R2 of every ticker (NaN until min_periods months were seen)
+    def estimates(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            covariance = self.sum_xy - self.sum_x * self.sum_y / self.weight
+            variance_x = self.sum_xx - self.sum_x ** 2 / self.weight
+            variance_y = self.sum_yy - self.sum_y ** 2 / self.weight
+
+            beta = covariance / variance_x
+            alpha = (self.sum_y - beta * self.sum_x) / self.weight
+            r_squared = covariance ** 2 / (variance_x * variance_y)
+
+        invalid = (self.count < self.min_periods) | ~(variance_x > 0)
+        results = {}
+        for metric, values in zip(ESTIMATOR_METRICS, (beta, alpha, r_squared)):
+            values[invalid] = np.nan
+            results[metric] = values
+        return results
+
+    #Feeding a whole panel (dates x tickers) bar by bar and keeping the estimates after each bar
+    #Returns a dictionary {'Beta': df, 'Alpha': df, 'R2': df}, each df is dates x tickers
+    def run(self, excess_returns_panel, market_excess_returns):
+        market = market_excess_returns.reindex(excess_returns_panel.index).to_numpy(dtype=float)
+        panel = excess_returns_panel.to_numpy(dtype=float)
+
+        history = {metric: np.empty(panel.shape) for metric in ESTIMATOR_METRICS}
+        for i in range(len(panel)):
+            self.update(market[i], panel[i])
+            for metric, values in self.estimates().items():
+                history[metric][i] = values
+
+        return {metric: pd.DataFrame(values, index=excess_returns_panel.index, columns=excess_returns_panel.columns)
+                for metric, values in history.items()}
+
+
+#Sufficient statistics of one ticker: everything needed to calculate its CAPM metrics
+#- Sums and cross-products of the market (x) and ticker (y) excess returns (months with both values)
+#- Welford running mean and variance of the ticker excess returns (for the Sharpe and Treynor Ratio)
+#- Statistics of the online outlier rule (scale_x, scale_y: see check_outlier) and the months it left out
+#  (outliers of the ticker leave every sum, outliers of the market only leave the regression)
+#Updating with a new month is O(1), two states of the same ticker (e.g. two periods) can be merged,
+#and to_dict/from_dict allow saving the state to JSON
+class CAPMState:
+    FIELDS = ['ticker', 'n', 'sum_x', 'sum_y', 'sum_xx', 'sum_xy', 'sum_yy', 'n_y', 'mean_y', 'm2_y',
+              'scale_x', 'scale_y', 'outliers', 'last_date']
+
+    def __init__(self, ticker, n=0, sum_x=0.0, sum_y=0.0, sum_xx=0.0, sum_xy=0.0, sum_yy=0.0,
+                 n_y=0, mean_y=0.0, m2_y=0.0, scale_x=None, scale_y=None, outliers=0, last_date=None):
+        self.ticker = ticker
+        self.n = n
+        self.sum_x = sum_x
+        self.sum_y = sum_y
+        self.sum_xx = sum_xx
+        self.sum_xy = sum_xy
+        self.sum_yy = sum_yy
+        self.n_y = n_y
+        self.mean_y = mean_y
+        self.m2_y = m2_y
+        self.scale_x = list(scale_x or [0, 0.0, 0.0])
+        self.scale_y = list(scale_y or [0, 0.0, 0.0])
+        self.outliers = outliers
+        self.last_date = last_date
+
+    def __repr__(self):
+        return f"CAPMState({self.ticker!r}, n={self.n}, last_date={self.last_date!r})"
+
+    #Adding one month of excess returns (in %), NaN values are ignored
+    #skip_outliers: months that are outliers of the months seen before are left out (see check_outlier)
+    def update(self, market_excess, ticker_excess, date=None, skip_outliers=True):
+        if ticker_excess is None or math.isnan(ticker_excess):
+            return self
+        if date is not None:
+            self.last_date = str(date)
+
+        if skip_outliers:
+            if market_excess is not None and not math.isnan(market_excess):
+                market_outlier, self.scale_x = check_outlier(market_excess, self.scale_x)
+                if market_outlier:
+                    market_excess = None
+            ticker_outlier, self.scale_y = check_outlier(ticker_excess, self.scale_y)
+            if ticker_outlier:
+                self.outliers += 1
+                return self
+
+        #Welford update of the mean and variance of the ticker excess returns
+        self.n_y += 1
+        delta = ticker_excess - self.mean_y
+        self.mean_y += delta / self.n_y
+        self.m2_y += delta * (ticker_excess - self.mean_y)
+
+        if market_excess is not None and not math.isnan(market_excess):
+            self.n += 1
+            self.sum_x += market_excess
+            self.sum_y += ticker_excess
+            self.sum_xx += market_excess * market_excess
+            self.sum_xy += market_excess * ticker_excess
+            self.sum_yy += ticker_excess * ticker_excess
+        return self
+
+    #Adding the months of two series (excess returns with their outliers, indexed by sorted dates)
+    #that are after self.last_date (the others were already added)
+    def update_from_series(self, ticker_excess_returns, market_excess_returns):
+        if self.last_date is not None and len(ticker_excess_returns):
+            #Same type as the dates of the index (dates or timestamps)
+            last_date = pd.Timestamp(self.last_date)
+            if not isinstance(ticker_excess_returns.index[0], pd.Timestamp):
+                last_date = last_date.date()
+            first = ticker_excess_returns.index.searchsorted(last_date, side='right')
+            ticker_excess_returns = ticker_excess_returns.iloc[first:]
+        ticker_excess_returns = ticker_excess_returns.dropna()
+        market_values = market_excess_returns.reindex(ticker_excess_returns.index).to_numpy(dtype=float)
+        for date, ticker_excess, market_excess in zip(ticker_excess_returns.index, ticker_excess_returns.to_numpy(dtype=float),
+                                                      market_values):
+            self.update(market_excess, ticker_excess, date)
+        return self
+
+    #Combining the statistics of two sets of months (e.g. two partitions of the history)
+    #Welford means and variances are combined with the parallel formula (Chan et al.)
+    def merge(self, other):
+        if other.ticker != self.ticker:
+            raise ValueError(f"Cannot merge the state of {other.ticker} into {self.ticker}")
+
+        merged = CAPMState(self.ticker)
+        merged.n = self.n + other.n
+        merged.outliers = self.outliers + other.outliers
+        for name in ('sum_x', 'sum_y', 'sum_xx', 'sum_xy', 'sum_yy'):
+            setattr(merged, name, getattr(self, name) + getattr(other, name))
+
+        merged.n_y, merged.mean_y, merged.m2_y = welford_merge([self.n_y, self.mean_y, self.m2_y],
+                                                               [other.n_y, other.mean_y, other.m2_y])
+        merged.scale_x = welford_merge(self.scale_x, other.scale_x)
+        merged.scale_y = welford_merge(self.scale_y, other.scale_y)
+
+        dates = [date for date in (self.last_date, other.last_date) if date is not None]
+        merged.last_date = max(dates) if dates else None
+        return merged
+
+    #CAPM metrics from the statistics (same formulas as TickerReturns.calculate_capm_metrics, not rounded)
+    #sp500_expected_returns and rf (monthly means) are only needed for the expected returns
+    def metrics(self, sp500_expected_returns=None, rf=None):
+        if self.n < 3 or self.n_y < 2:
+            raise ValueError(f"Not enough months to calculate the metrics of {self.ticker}")
+
+        covariance = self.sum_xy - self.sum_x * self.sum_y / self.n
+        variance_x = self.sum_xx - self.sum_x ** 2 / self.n
+        variance_y = self.sum_yy - self.sum_y ** 2 / self.n
+
+        beta = covariance / variance_x
+        alpha = (self.sum_y - beta * self.sum_x) / self.n
+        r_squared = covariance ** 2 / (variance_x * variance_y)
+
+        #Sample standard deviation (same as pandas .std())
+        std_dev_excess_returns = math.sqrt(self.m2_y / (self.n_y - 1))
+
+        metrics = {
+            'Ticker': self.ticker,
+            'Beta': beta,
+            'Alpha (%)': alpha,
+            'R2': r_squared,
+            'Treynor Ratio (%)': self.mean_y / beta * 12,
+            'Sharpe Ratio': self.mean_y / std_dev_excess_returns * (12 ** 0.5),
+            'Annual Alpha (%)': alpha * 12,
+        }
+        if sp500_expected_returns is not None and rf is not None:
+            metrics['Monthly Expected Returns (%)'] = (rf + beta * (sp500_expected_returns - rf)) * 100
+        return metrics
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in cls.FIELDS if name in data})
+
+
+#Saving and loading the states of many tickers ({ticker: state}) as one JSON file
+def save_states(states, path):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({ticker: state.to_dict() for ticker, state in states.items()}, f)
+    os.replace(tmp_path, path)
+
+
+def load_states(path):
+    with open(path, 'r') as f:
+        return {ticker: CAPMState.from_dict(data) for ticker, data in json.load(f).items()}
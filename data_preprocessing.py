@@ -1,15 +1,40 @@
 import pandas as pd
-import numpy as np
-import plotly as pl
-import dash as ds
-import yfinance as yf
 import time
 import json
+import hashlib
+import os
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from data_providers import get_provider
+
+#Columns kept for each symbol in the consolidated file (long format: one row per symbol and date)
+BULK_COLUMNS = ['Date', 'Symbol', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+
+#Checksum of a file (sha256), used to check that saved files were not changed or left incomplete
+def file_checksum(path):
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+#Writing to a temporary file first and then renaming it, so an interruption never leaves a half-written file
+def atomic_write_json(data, path):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
 
 #Class serves to save files if needed. In case the user prefers to use local files instead of fetching from API
 #Fetching a lot of data from the API can be inefficient, that is the reason for this file
 class DataPreprocessor:
-    def __init__(self):
+    #provider is where the data is downloaded from (see data_providers.py), yfinance by default
+    def __init__(self, provider=None):
+        self.provider = provider if provider is not None else get_provider()
         #Period and interval of all tickers will be the same for standardisation
         self.period = "20y"
         self.interval = "1mo"
@@ -26,9 +51,8 @@ class DataPreprocessor:
         #For loop to save monthly historical data of stocks individually
         for ticker_symbol in ticker_list:
             ticker_name = ticker_symbol
-            ticker_obj = yf.Ticker(ticker_symbol)
             pathname = f'historical_stock_data_{ticker_name}_monthly_{self.period}.csv'
-            hist_ticker = pd.DataFrame(ticker_obj.history(period=self.period,interval=self.interval))
+            hist_ticker = pd.DataFrame(self.provider.history(ticker_symbol,self.period,self.interval))
             hist_ticker.to_csv(pathname)
             
             print(f"Saved Monthly (20y) Historical Data of {ticker_name} to {pathname}.csv")
@@ -37,23 +61,25 @@ class DataPreprocessor:
     #Will use the SP500 for comparison (most accurate and efficient index data)
     def sp500_historical_data(self):
         index_ticker = self.index_ticker
-        index_obj = yf.Ticker(index_ticker)
         pathname = f'historical_stock_data_{index_ticker}_monthly_{self.period}.csv'
-        hist_ticker = pd.DataFrame(index_obj.history(period=self.period,interval=self.interval))
+        hist_ticker = pd.DataFrame(self.provider.history(index_ticker,self.period,self.interval))
         hist_ticker.to_csv(pathname)
         return pathname
     
     #Getting the historical 20y monthly yield of the tbill
     def tbill_historical_rates(self):
         tbill = self.tbill_30y_ticker
-        index_obj = yf.Ticker(tbill)
 
         pathname = f'yield_tbill_monthly_{self.period}.csv'
-        hist_ticker = pd.DataFrame(index_obj.history(period=self.period,interval=self.interval))
+        hist_ticker = pd.DataFrame(self.provider.history(tbill,self.period,self.interval))
         hist_ticker.to_csv(pathname)
         return pathname
     
-    def save_tickers_to_json(self):
+    #Saving the S&P 500 components to the ticker store (data/sp500_tickers.json)
+    #Each ticker keeps its company name (searched by the ticker dropdown, see ticker_search.py)
+    #and its GICS sector and sub-industry (used by the sector views, see sectors.py)
+    #market_caps: also saves the market cap of each ticker from the provider (needed for cap-weighted sectors)
+    def save_tickers_to_json(self, market_caps=False, workers=8):
         #Originally had wikipedia page (List of SP500 tickers) saved as html
         #This function converted this html file to a json file
         filepath = "capm-scatter-plot/data/sp500_components.html"
@@ -61,11 +87,25 @@ class DataPreprocessor:
 
         all_stocks = pd.read_html(filepath)[0]
         
-        #get value at rows i, column 0 (first column)
-        all_tickers = [all_stocks.iloc[i, 0] for i in range(len(all_stocks))]
+        #Symbol is the first column, the GICS columns are found by name (None if the table does not have them)
+        def column_values(name):
+            if name not in all_stocks.columns:
+                return [None] * len(all_stocks)
+            return [value if pd.notna(value) else None for value in all_stocks[name]]
+
+        all_tickers = list(all_stocks.iloc[:, 0])
+        names = column_values('Security')
+        sectors = column_values('GICS Sector')
+        industries = column_values('GICS Sub-Industry')
         
-        # Create dropdown options
-        ticker_options = [{'label': ticker, 'value': ticker} for ticker in all_tickers]
+        # Create dropdown options (with the metadata of each ticker)
+        ticker_options = [{'label': ticker, 'value': ticker, 'name': name, 'sector': sector, 'industry': industry}
+                          for ticker, name, sector, industry in zip(all_tickers, names, sectors, industries)]
+
+        if market_caps:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for option, market_cap in zip(ticker_options, executor.map(self.provider.market_cap, all_tickers)):
+                    option['market_cap'] = market_cap
 
         with open('capm-scatter-plot/data/sp500_tickers.json','w') as f:
             json.dump(ticker_options,f)
@@ -73,10 +113,147 @@ class DataPreprocessor:
         print("Tickers saved to sp500_tickers.json")
         return True
     
-    #Since files are already processed, not much is needed in this part
+    #Filling the sector, industry (and market cap with market_caps=True) of the tickers of a store that do not
+    #have them, from the provider. Used when the GICS table read by save_tickers_to_json is not available
+    #Values already in the store are kept, so it can be run again to fill only the tickers that failed
+    #Returns the number of tickers that still have no sector
+    def fill_ticker_metadata(self, tickers_path='data/sp500_tickers.json', market_caps=False, workers=8):
+        with open(tickers_path, 'r') as f:
+            ticker_options = [option if isinstance(option, dict) else {'label': option, 'value': option}
+                              for option in json.load(f)]
+
+        missing_sectors = [option for option in ticker_options if not option.get('sector') or not option.get('industry')]
+        missing_caps = [option for option in ticker_options if market_caps and option.get('market_cap') is None]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            symbols = [option['value'] for option in missing_sectors]
+            for option, (sector, industry) in zip(missing_sectors, executor.map(self.provider.sector_and_industry, symbols)):
+                option['sector'] = option.get('sector') or sector
+                option['industry'] = option.get('industry') or industry
+            symbols = [option['value'] for option in missing_caps]
+            for option, market_cap in zip(missing_caps, executor.map(self.provider.market_cap, symbols)):
+                option['market_cap'] = market_cap
+
+        atomic_write_json(ticker_options, tickers_path)
+        without_sector = [option['value'] for option in ticker_options if not option.get('sector')]
+        print(f"Filled the metadata of {len(missing_sectors) - len(without_sector)} tickers of {tickers_path}, "
+              f"{len(without_sector)} still have no sector")
+        return len(without_sector)
+
+    #Bulk download of many tickers (by default the whole S&P 500 list, the SP500 and the T-Bill yield)
+    #- Tickers are downloaded in parallel by a pool of workers
+    #- Each downloaded ticker is saved to its own part file and recorded in a manifest (with its checksum),
+    #  so an interrupted run continues where it stopped instead of starting from zero
+    #- The manifest records the run and the month its data must reach (the current month: the period ends today).
+    #  Only tickers completed by the same run are skipped, so a run from an earlier month (older data) or with
+    #  refresh=True downloads every ticker again
+    #- When every ticker is downloaded, all parts are consolidated into one Parquet file (long format),
+    #  which PanelFileProvider (data_providers.py) loads in one read
+    #Returns the path of the consolidated file and the tickers that failed (file is not written if any failed)
+    def bulk_ingest(self, ticker_list=None, tickers_path='data/sp500_tickers.json', output_path=None, workers=8,
+                    refresh=False):
+        if ticker_list is None:
+            with open(tickers_path, 'r') as f:
+                ticker_list = [option['value'] for option in json.load(f)]
+        #The SP500 and the T-Bill yield are always needed for the analysis
+        ticker_list = list(dict.fromkeys(list(ticker_list) + [self.index_ticker, self.tbill_30y_ticker]))
+
+        output_path = Path(output_path or f'data/sp500_monthly_{self.period}.parquet')
+        parts_dir = output_path.with_name(f'{output_path.stem}_parts')
+        manifest_path = output_path.with_name(f'{output_path.stem}_manifest.json')
+        parts_dir.mkdir(parents=True, exist_ok=True)
+
+        #Month the data of this run must reach (watermark of the run)
+        data_end = pd.Timestamp.today().to_period('M').start_time.date().isoformat()
+        run = {'started': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'data_end': data_end}
+        manifest = {'period': self.period, 'interval': self.interval, 'run': run, 'completed': {}}
+        if manifest_path.exists() and not refresh:
+            with open(manifest_path, 'r') as f:
+                saved_manifest = json.load(f)
+            #Parts downloaded with another period or interval, or before the month of this run, cannot be reused
+            saved_run = saved_manifest.get('run') or {}
+            if (saved_manifest.get('period') == self.period and saved_manifest.get('interval') == self.interval
+                    and saved_run.get('data_end', '') >= data_end):
+                manifest = saved_manifest
+
+        #Tickers already downloaded by this run (part file exists and has the checksum saved in the manifest)
+        completed = manifest['completed']
+        for ticker_symbol, part in list(completed.items()):
+            part_path = parts_dir / part['file']
+            if (part.get('run') != manifest['run']['started'] or not part_path.exists()
+                    or file_checksum(part_path) != part['sha256']):
+                del completed[ticker_symbol]
+
+        pending = [ticker_symbol for ticker_symbol in ticker_list if ticker_symbol not in completed]
+        print(f"Bulk ingest (run of {manifest['run']['started']}, data until {data_end}): "
+              f"{len(ticker_list) - len(pending)} tickers already downloaded, {len(pending)} to download")
 
-data = DataPreprocessor()
+        manifest_lock = threading.Lock()
+        failed = {}
+
+        def download(ticker_symbol):
+            hist_ticker = pd.DataFrame(self.provider.history(ticker_symbol, self.period, self.interval))
+            if hist_ticker.empty:
+                raise ValueError(f"No data returned for {ticker_symbol}")
+
+            hist_ticker = hist_ticker.rename_axis('Date').reset_index()
+            hist_ticker['Symbol'] = ticker_symbol
+            hist_ticker = hist_ticker[[column for column in BULK_COLUMNS if column in hist_ticker.columns]]
+
+            part_file = f"{ticker_symbol.replace(os.sep, '_')}.parquet"
+            part_path = parts_dir / part_file
+            tmp_path = parts_dir / f'{part_file}.tmp'
+            hist_ticker.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, part_path)
+
+            return {'file': part_file, 'sha256': file_checksum(part_path), 'rows': len(hist_ticker),
+                    'run': manifest['run']['started'], 'last_date': str(pd.Timestamp(hist_ticker['Date'].max()).date())}
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(download, ticker_symbol): ticker_symbol for ticker_symbol in pending}
+            for future in as_completed(futures):
+                ticker_symbol = futures[future]
+                try:
+                    part = future.result()
+                except Exception as e:
+                    failed[ticker_symbol] = str(e)
+                    print(f"Error downloading {ticker_symbol}: {e}")
+                    continue
+
+                #Saving the manifest after every ticker, so nothing downloaded is lost if the run stops
+                with manifest_lock:
+                    completed[ticker_symbol] = part
+                    atomic_write_json(manifest, manifest_path)
+
+        atomic_write_json(manifest, manifest_path)
+
+        if failed:
+            print(f"{len(failed)} tickers failed, run again to retry them: {sorted(failed)}")
+            return None, failed
+
+        #Consolidating all parts into a single file (one read for the app)
+        all_parts = [pd.read_parquet(parts_dir / completed[ticker_symbol]['file']) for ticker_symbol in ticker_list]
+        consolidated_df = pd.concat(all_parts, ignore_index=True)
+        consolidated_df['Symbol'] = consolidated_df['Symbol'].astype('category')
+
+        tmp_path = output_path.with_name(f'{output_path.name}.tmp')
+        consolidated_df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, output_path)
+
+        manifest['output'] = {
+            'file': output_path.name,
+            'sha256': file_checksum(output_path),
+            'rows': len(consolidated_df),
+            'symbols': len(ticker_list),
+        }
+        atomic_write_json(manifest, manifest_path)
+
+        print(f"Saved {len(ticker_list)} tickers ({len(consolidated_df)} rows) to {output_path}")
+        return output_path, failed
+
+    #Since files are already processed, not much is needed in this part
 
-all_tickers = data.save_tickers_to_json()
+#Only runs when the file is executed directly (python data_preprocessing.py), never on import
+if __name__ == '__main__':
+    data = DataPreprocessor()
 
-print(len(all_tickers))
\ No newline at end of file
+    data.save_tickers_to_json()
@@ -0,0 +1,348 @@
+#Data providers: where the price history of the tickers comes from
+#TickerReturns and DataPreprocessor only call provider.history(symbol, period, interval), which returns
+#a DataFrame indexed by date with (at least) a 'Close' column, the same format as yfinance
+#- YFinanceProvider: Yahoo Finance API (through the shared session in market_data)
+#- LocalFileProvider: CSV/Parquet files saved by DataPreprocessor (no network, disk speed)
+#- PanelFileProvider: consolidated file saved by DataPreprocessor.bulk_ingest (all tickers in one read)
+#- SyntheticProvider: generated prices (offline testing and demos)
+#The provider used by default is chosen with the CAPM_DATA_PROVIDER environment variable
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+#Timezone of the dates returned by yfinance (monthly bars start at midnight New York time)
+MARKET_TIMEZONE = 'America/New_York'
+
+#Sectors of the synthetic tickers (the 11 GICS sectors)
+GICS_SECTORS = ['Communication Services', 'Consumer Discretionary', 'Consumer Staples', 'Energy', 'Financials',
+                'Health Care', 'Industrials', 'Information Technology', 'Materials', 'Real Estate', 'Utilities']
+
+
+class DataProvider:
+    name = None
+    #Seconds a version is trusted without checking the data again (None: checking the version is cheap,
+    #e.g. the modification time of a file, so it is always checked)
+    VERSION_TTL = None
+
+    def history(self, symbol, period, interval):
+        raise NotImplementedError
+
+    #Cheap identifier of the version of the data of a symbol (without loading it)
+    #Results cached on disk are only reused while the version does not change
+    def data_version(self, symbol, period, interval):
+        raise NotImplementedError
+
+    #(time the version was checked, version) if it is still trusted (see VERSION_TTL), None otherwise
+    #Never loads the data
+    def known_version(self, symbol, period, interval):
+        return None
+
+    #Forgetting the data kept of a symbol, so the next history() or data_version() loads it again
+    def expire(self, symbol, period, interval):
+        pass
+
+    #Current market cap of a symbol (None when the provider does not know it), used to weight the sectors
+    def market_cap(self, symbol):
+        return None
+
+    #(sector, industry) of a symbol ((None, None) when the provider does not know them), used to group the sectors
+    def sector_and_industry(self, symbol):
+        return None, None
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+
+class YFinanceProvider(DataProvider):
+    name = 'yfinance'
+
+    #Seconds a history (and its version) is reused before it is fetched again
+    VERSION_TTL = 900
+
+    def __init__(self):
+        #Last history fetched of each (symbol, period, interval): (time.time(), version, dataframe)
+        #The version used in the key of a cached result and the data the result is calculated from
+        #come from the same download (finding the version does not download the history a second time)
+        self.fetched = {}
+        self.lock = threading.Lock()
+
+    def fetch(self, symbol, period, interval):
+        from market_data import get_market_data_client
+
+        historical_data = get_market_data_client().history(symbol, period, interval)
+        #Date of the last bar and hash of the prices: Yahoo Finance adds bars and revises the last one
+        #(the bar of the current month changes every day), so any change of the data changes the version
+        last_date = historical_data.index[-1].isoformat() if len(historical_data) else ''
+        content_hash = hashlib.sha1(pd.util.hash_pandas_object(historical_data, index=True).values.tobytes()).hexdigest()
+        fetched = (time.time(), f'yfinance:{last_date}:{content_hash[:16]}', historical_data)
+        with self.lock:
+            self.fetched[(symbol, period, interval)] = fetched
+        return fetched
+
+    def recent(self, symbol, period, interval):
+        with self.lock:
+            fetched = self.fetched.get((symbol, period, interval))
+        if fetched is None or time.time() - fetched[0] > self.VERSION_TTL:
+            return None
+        return fetched
+
+    def history(self, symbol, period, interval):
+        fetched = self.recent(symbol, period, interval) or self.fetch(symbol, period, interval)
+        return fetched[2].copy()
+
+    def known_version(self, symbol, period, interval):
+        fetched = self.recent(symbol, period, interval)
+        return fetched[:2] if fetched is not None else None
+
+    #Version of the last history fetched (fetched again when it is older than VERSION_TTL)
+    def data_version(self, symbol, period, interval):
+        fetched = self.recent(symbol, period, interval) or self.fetch(symbol, period, interval)
+        return fetched[1]
+
+    def expire(self, symbol, period, interval):
+        with self.lock:
+            self.fetched.pop((symbol, period, interval), None)
+
+    def market_cap(self, symbol):
+        from market_data import get_market_data_client
+
+        return get_market_data_client().market_cap(symbol)
+
+    def sector_and_industry(self, symbol):
+        from market_data import get_market_data_client
+
+        return get_market_data_client().sector_and_industry(symbol)
+
+
+#Reads the files written by DataPreprocessor:
+#historical_stock_data_{ticker}_monthly_{period}.csv for the stocks and the SP500
+#yield_tbill_monthly_{period}.csv for the T-Bill yield
+#A .parquet file with the same name is used instead of the CSV if it exists
+class LocalFileProvider(DataProvider):
+    name = 'local'
+
+    def __init__(self, directory='.', tbill_ticker='^TYX'):
+        self.directory = Path(directory)
+        self.tbill_ticker = tbill_ticker
+
+    def __repr__(self):
+        return f"{type(self).__name__}({str(self.directory)!r})"
+
+    def file_stem(self, symbol, period):
+        if symbol == self.tbill_ticker:
+            return f'yield_tbill_monthly_{period}'
+        return f'historical_stock_data_{symbol}_monthly_{period}'
+
+    def data_version(self, symbol, period, interval):
+        #Size and modification time of the file (changes when the preprocessor saves it again)
+        stem = self.file_stem(symbol, period)
+        for path in (self.directory / f'{stem}.parquet', self.directory / f'{stem}.csv'):
+            if path.exists():
+                stat = path.stat()
+                return f'local:{path.name}:{stat.st_size}:{stat.st_mtime_ns}'
+        return 'local:missing'
+
+    def history(self, symbol, period, interval):
+        #The preprocessor only saves monthly data
+        if interval != '1mo':
+            raise ValueError(f"Local files only have monthly data (interval '1mo'), got '{interval}'")
+
+        stem = self.file_stem(symbol, period)
+        parquet_path = self.directory / f'{stem}.parquet'
+        csv_path = self.directory / f'{stem}.csv'
+
+        if parquet_path.exists():
+            historical_data = pd.read_parquet(parquet_path)
+        elif csv_path.exists():
+            historical_data = pd.read_csv(csv_path, index_col=0)
+        else:
+            raise FileNotFoundError(f"No local data for {symbol}: {csv_path} does not exist")
+
+        #Dates are saved with their UTC offset (which changes with daylight saving time)
+        historical_data.index = pd.to_datetime(historical_data.index, utc=True).tz_convert(MARKET_TIMEZONE)
+        historical_data.index.name = 'Date'
+
+        return historical_data
+
+
+#Reads the single consolidated file written by DataPreprocessor.bulk_ingest
+#The whole file is loaded once (first request) and split by symbol, then every history() is a lookup
+#The file checksum is checked against the manifest written next to it
+class PanelFileProvider(DataProvider):
+    name = 'panel'
+
+    def __init__(self, path='data/sp500_monthly_20y.parquet', verify=True):
+        self.path = Path(path)
+        self.verify = verify
+        self.manifest = {}
+        self.frames = None
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({str(self.path)!r})"
+
+    def load(self):
+        with self.lock:
+            if self.frames is not None:
+                return self.frames
+
+            manifest_path = self.path.with_name(f'{self.path.stem}_manifest.json')
+            if manifest_path.exists():
+                with open(manifest_path, 'r') as f:
+                    self.manifest = json.load(f)
+
+            expected_checksum = self.manifest.get('output', {}).get('sha256')
+            if self.verify and expected_checksum:
+                checksum = hashlib.sha256()
+                with open(self.path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        checksum.update(chunk)
+                if checksum.hexdigest() != expected_checksum:
+                    raise ValueError(f"Checksum of {self.path} does not match its manifest, run the bulk ingest again")
+
+            panel_df = pd.read_parquet(self.path)
+            panel_df['Date'] = pd.to_datetime(panel_df['Date'], utc=True).dt.tz_convert(MARKET_TIMEZONE)
+
+            frames = {}
+            for symbol, symbol_df in panel_df.groupby('Symbol', observed=True, sort=False):
+                frames[str(symbol)] = symbol_df.drop(columns='Symbol').set_index('Date')
+            self.frames = frames
+
+            return self.frames
+
+    def data_version(self, symbol, period, interval):
+        stat = self.path.stat()
+        return f'panel:{self.path.name}:{stat.st_size}:{stat.st_mtime_ns}'
+
+    def history(self, symbol, period, interval):
+        frames = self.load()
+
+        #The file only has the period and interval it was downloaded with
+        for setting, value in (('period', period), ('interval', interval)):
+            if self.manifest.get(setting, value) != value:
+                raise ValueError(f"{self.path} has {setting} '{self.manifest[setting]}', got '{value}'")
+
+        if symbol not in frames:
+            raise KeyError(f"No data for {symbol} in {self.path}")
+        #Copy because callers add columns to the frame they get
+        return frames[symbol].copy()
+
+
+#Generated prices, the same symbol always gives the same data (seeded by the symbol name)
+#Stocks follow the CAPM: returns = rf + beta*(market returns - rf) + noise, with a different beta per symbol
+class SyntheticProvider(DataProvider):
+    name = 'synthetic'
+
+    #Frequencies of the intervals supported and number of bars per year
+    FREQUENCIES = {'1mo': ('MS', 12), '1wk': ('W-MON', 52), '1d': ('B', 252)}
+
+    def __init__(self, seed=0, index_ticker='^GSPC', tbill_ticker='^TYX', end=None):
+        self.seed = seed
+        self.index_ticker = index_ticker
+        self.tbill_ticker = tbill_ticker
+        #Last bar is the first day of the current month (like the monthly data from yfinance)
+        self.end = pd.Timestamp(end) if end is not None else pd.Timestamp(date.today().replace(day=1))
+
+    def __repr__(self):
+        return f"{type(self).__name__}(seed={self.seed})"
+
+    def data_version(self, symbol, period, interval):
+        return f'synthetic:{self.seed}:{self.end.date().isoformat()}'
+
+    def dates(self, period, interval):
+        if interval not in self.FREQUENCIES:
+            raise ValueError(f"Unsupported interval '{interval}', use one of {list(self.FREQUENCIES)}")
+        match = re.fullmatch(r'(\d+)(y|mo)', period)
+        if match is None:
+            raise ValueError(f"Unsupported period '{period}', use e.g. '20y' or '6mo'")
+
+        amount, unit = int(match.group(1)), match.group(2)
+        start = self.end - (pd.DateOffset(years=amount) if unit == 'y' else pd.DateOffset(months=amount))
+        frequency = self.FREQUENCIES[interval][0]
+        return pd.date_range(start, self.end, freq=frequency, tz=MARKET_TIMEZONE, name='Date')
+
+    def random_generator(self, symbol):
+        return np.random.default_rng([self.seed, zlib.crc32(symbol.encode())])
+
+    #Between about 5 and 500 billion (lognormal, like the spread of the S&P 500)
+    def market_cap(self, symbol):
+        rng = np.random.default_rng([self.seed, zlib.crc32(symbol.encode()), 1])
+        return float(np.exp(rng.normal(np.log(35e9), 1.0)))
+
+    #One of the 11 GICS sectors and one of 3 industries inside it (random, same for the same symbol)
+    def sector_and_industry(self, symbol):
+        rng = np.random.default_rng([self.seed, zlib.crc32(symbol.encode()), 2])
+        sector = str(rng.choice(GICS_SECTORS))
+        return sector, f'{sector} {rng.integers(1, 4)}'
+
+    def market_returns(self, n_bars, bars_per_year):
+        rng = self.random_generator(self.index_ticker)
+        return rng.normal(0.08 / bars_per_year, 0.15 / np.sqrt(bars_per_year), n_bars)
+
+    def tbill_yield(self, n_bars):
+        rng = self.random_generator(self.tbill_ticker)
+        #Yield in % (like ^TYX), random walk kept between 1% and 7%
+        return np.clip(4 + np.cumsum(rng.normal(0, 0.08, n_bars)), 1, 7)
+
+    def history(self, symbol, period, interval):
+        dates = self.dates(period, interval)
+        bars_per_year = self.FREQUENCIES[interval][1]
+        n_bars = len(dates)
+
+        if symbol == self.tbill_ticker:
+            close = self.tbill_yield(n_bars)
+        else:
+            market_returns = self.market_returns(n_bars, bars_per_year)
+            if symbol == self.index_ticker:
+                returns = market_returns
+            else:
+                rng = self.random_generator(symbol)
+                beta = rng.uniform(0.4, 1.8)
+                risk_free = self.tbill_yield(n_bars) / 100 / bars_per_year
+                noise = rng.normal(0, rng.uniform(0.15, 0.35) / np.sqrt(bars_per_year), n_bars)
+                returns = risk_free + beta * (market_returns - risk_free) + noise
+            close = 100 * np.cumprod(1 + returns)
+
+        return pd.DataFrame({
+            'Open': close,
+            'High': close,
+            'Low': close,
+            'Close': close,
+            'Volume': 0,
+        }, index=dates)
+
+
+PROVIDERS = {
+    YFinanceProvider.name: YFinanceProvider,
+    LocalFileProvider.name: LocalFileProvider,
+    PanelFileProvider.name: PanelFileProvider,
+    SyntheticProvider.name: SyntheticProvider,
+}
+
+
+#Provider chosen by configuration:
+#CAPM_DATA_PROVIDER = yfinance (default) | local | panel | synthetic
+#CAPM_DATA_DIR = directory of the local files (default: current directory)
+#CAPM_PANEL_PATH = consolidated file of the panel provider (default: data/sp500_monthly_20y.parquet)
+#CAPM_SYNTHETIC_SEED = seed of the synthetic data (default: 0)
+def get_provider(name=None):
+    name = name or os.environ.get('CAPM_DATA_PROVIDER', YFinanceProvider.name)
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown data provider '{name}', use one of {list(PROVIDERS)}")
+
+    if name == LocalFileProvider.name:
+        return LocalFileProvider(os.environ.get('CAPM_DATA_DIR', '.'))
+    if name == PanelFileProvider.name:
+        return PanelFileProvider(os.environ.get('CAPM_PANEL_PATH', 'data/sp500_monthly_20y.parquet'))
+    if name == SyntheticProvider.name:
+        return SyntheticProvider(seed=int(os.environ.get('CAPM_SYNTHETIC_SEED', 0)))
+    return PROVIDERS[name]()
@@ -0,0 +1,159 @@
+#Export of the metrics table and the rolling analyses as CSV or Parquet files
+#The files are generated from the cached results (TickerReturns memos and the disk cache) and streamed:
+#the rows are produced in chunks (a few tickers at a time) and each chunk is written out before the next
+#one is calculated, so exporting the whole universe never holds the full file in memory
+#- CSV: header once, then each chunk as text
+#- Parquet: one row group per chunk (pyarrow ParquetWriter writing to a buffer that is emptied after each chunk)
+import io
+
+import pandas as pd
+
+#Formats: name -> (MIME type, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+}
+
+#Columns of the rolling export (one row per ticker and date)
+ROLLING_EXPORT_COLUMNS = ['Ticker', 'Date', 'Alpha', 'Beta', 'R2']
+
+#Tickers per chunk of the metrics export
+METRICS_CHUNK_SIZE = 100
+
+
+#Columns of the metrics export (the significance columns only exist for OLS)
+def metrics_export_columns(method='ols'):
+    from ticker_analyzer import CAPM_METRIC_COLUMNS
+    from panel_analyzer import DOWNSIDE_COLUMNS, INFERENCE_COLUMNS
+
+    return CAPM_METRIC_COLUMNS + DOWNSIDE_COLUMNS + (INFERENCE_COLUMNS if method == 'ols' else [])
+
+
+#Rows of the metrics table, chunk by chunk (dataframes with the metrics_export_columns)
+#Tickers that cannot be calculated are skipped (the file has already started when they fail)
+def iter_metrics_frames(capm_regression, tickers, method='ols', chunk_size=METRICS_CHUNK_SIZE):
+    columns = metrics_export_columns(method)
+    for start in range(0, len(tickers), chunk_size):
+        chunk_tickers = tickers[start:start + chunk_size]
+        if method == 'ols':
+            rows = []
+            for ticker in chunk_tickers:
+                try:
+                    rows.append(capm_regression.calculate_capm_metrics(ticker))
+                except Exception as e:
+                    print(f"Export skipped {ticker}: {e}")
+            inference = capm_regression.calculate_capm_inference([row['Ticker'] for row in rows])
+            rows = [{**row, **inference.get(row['Ticker'], {})} for row in rows]
+        else:
+            try:
+                rows = capm_regression.calculate_robust_metrics(chunk_tickers, method)
+            except Exception as e:
+                print(f"Export skipped {', '.join(chunk_tickers)}: {e}")
+                continue
+        downside = capm_regression.calculate_downside_risk([row['Ticker'] for row in rows])
+        rows = [{**row, **downside.get(row['Ticker'], {})} for row in rows]
+        yield pd.DataFrame(rows, columns=columns)
+
+
+#Metrics already calculated for the universe (e.g. the screener index), split in chunks
+def iter_dataframe_chunks(metrics_df, columns, chunk_size=METRICS_CHUNK_SIZE):
+    for start in range(0, len(metrics_df), chunk_size):
+        yield metrics_df.iloc[start:start + chunk_size].reindex(columns=columns)
+
+
+#Rolling Alpha, Beta and R2 of each ticker (one dataframe per ticker, long format)
+def iter_rolling_frames(capm_regression, tickers, window_size=12):
+    for ticker in tickers:
+        try:
+            rolling_analysis_df = capm_regression.calculate_rol_analysis_ols(ticker, window_size=window_size)
+        except Exception as e:
+            print(f"Export skipped {ticker}: {e}")
+            continue
+        rolling_df = rolling_analysis_df[['Alpha', 'Beta', 'R2']].astype(float)
+        rolling_df.insert(0, 'Date', [str(date) for date in rolling_analysis_df.index])
+        rolling_df.insert(0, 'Ticker', ticker)
+        yield rolling_df.reset_index(drop=True)[ROLLING_EXPORT_COLUMNS]
+
+
+def stream_csv(frames, columns):
+    header = True
+    for frame in frames:
+        yield frame.reindex(columns=columns).to_csv(index=False, header=header)
+        header = False
+    if header:
+        #No rows: only the header
+        yield pd.DataFrame(columns=columns).to_csv(index=False)
+
+
+#File-like object that keeps what pyarrow writes until it is taken with drain()
+class ChunkSink(io.RawIOBase):
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+#Text columns of the exports (every other column is a float64 metric)
+TEXT_COLUMNS = ['Ticker', 'Date']
+
+
+#Schema of a Parquet export, fixed before the first chunk: a chunk whose types pandas infers differently
+#(e.g. an all-NaN column read as object) is cast to it instead of failing halfway through the download
+def export_schema(columns):
+    import pyarrow as pa
+
+    return pa.schema([(column, pa.string() if column in TEXT_COLUMNS else pa.float64()) for column in columns])
+
+
+#Chunk with the columns and types of the schema (missing columns are empty, non-numeric metrics are null)
+def cast_frame(frame, columns):
+    frame = frame.reindex(columns=columns)
+    cast = {}
+    for column in columns:
+        if column in TEXT_COLUMNS:
+            cast[column] = [None if pd.isna(value) else str(value) for value in frame[column]]
+        else:
+            cast[column] = pd.to_numeric(frame[column], errors='coerce').astype('float64')
+    return pd.DataFrame(cast, index=frame.index)
+
+
+#columns: the same columns and types are used for every chunk (see export_schema)
+def stream_parquet(frames, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = ChunkSink()
+    schema = export_schema(columns)
+    writer = pq.ParquetWriter(sink, schema)
+    for frame in frames:
+        writer.write_table(pa.Table.from_pandas(cast_frame(frame, columns), schema=schema, preserve_index=False))
+        yield sink.drain()
+
+    #Without rows the file only has the columns (no row groups)
+    writer.close()
+    yield sink.drain()
+
+
+#Chunks (str or bytes) of the file in the given format
+def stream_export(frames, columns, export_format='csv'):
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}', use one of {list(EXPORT_FORMATS)}")
+    if export_format == 'csv':
+        return stream_csv(frames, columns)
+    return stream_parquet(frames, columns)
@@ -0,0 +1,283 @@
+#Figures of the analysis (scatter plots, metrics table, bar charts and rolling charts)
+#Shared by the webapp (app.py) and the static report (report.py), so both show the same charts
+#plotly is slow to import, so it is imported inside the functions (first figure built)
+import threading
+
+import pandas as pd
+
+from ticker_analyzer import CAPM_METRIC_COLUMNS
+
+index_name = "SP500"
+
+#Significance columns added to the metrics table with OLS (the API returns all of panel_analyzer.INFERENCE_COLUMNS)
+#NW = Newey-West standard errors (robust to heteroskedasticity and autocorrelation of the residuals)
+TABLE_INFERENCE_COLUMNS = ['Beta t', 'Beta p', 'Beta NW p', 'Alpha t', 'Alpha p', 'Alpha NW p']
+
+colors = {
+    'background': '#F3F4F4',
+    'text': '#464747',
+    'button':'#324B4C',
+    'title':'#a73a00',
+    'trendline':'#e66e2d',
+    'scatter_points':'#00adbc',
+    'line_color_table':'black',
+    'fill_color_col_table':'#1c884c',
+    'fill_color_table':'#5bbe7d'
+
+}
+
+#plotly.express builds its default template on the first figure, which is not thread-safe (sessions of the webapp
+#building their first figures at the same time can fail), so the first figures of each kind are built under a lock
+plotly_express_lock = threading.Lock()
+plotly_express_ready = False
+
+def load_plotly_express():
+    global plotly_express_ready
+    import plotly.express as px
+
+    if not plotly_express_ready:
+        with plotly_express_lock:
+            if not plotly_express_ready:
+                px.scatter(x=[0, 1], y=[0, 1])
+                px.line(x=[0, 1], y=[0, 1])
+                px.bar(x=[0, 1], y=[0, 1], color=[0, 1])
+                plotly_express_ready = True
+    return px
+
+#Creating the scatter plot of the excess returns of a ticker versus the SP500 with the best-fitting line
+def create_scatter_plot(each_ticker, ticker_excess_returns_df, sp500_excess_returns_df, metrics, sp500_expected_returns, rf):
+    px = load_plotly_express()
+
+    #SP500 will do the same as explained above
+    ticker_sp500_excess_returns = pd.concat([ticker_excess_returns_df,sp500_excess_returns_df],axis=1)
+
+    #Doing a Scatter Plot for each ticker - using OLS for the trendline regression
+    #This regression line will create the beta (slope) and the alpha (y-intercept)
+    scatter_fig = px.scatter(
+        ticker_sp500_excess_returns,
+        x=f"{index_name} Excess Returns (%)",
+        y=f"{each_ticker} Excess Returns (%)", 
+        title=f'Scatter Plot of Monthly Excess Returns for {each_ticker} versus the {index_name}',
+        trendline="ols"
+        )
+
+    #Updating the points of the scatter plot to match the color of the entire page
+    scatter_fig.update_traces(
+            selector=dict(type='scatter', mode='markers'), 
+            marker=dict(
+            color=colors['scatter_points'],
+            size=8,
+            opacity=0.7,
+            line=dict(width=1,color=colors['text'])            
+            ),showlegend=True,   
+        name=f'{each_ticker} vs. {index_name} Excess Returns'  
+    )
+
+    #Adding annotation Expected Returns in the top left corner of the scatter plot
+    scatter_fig.add_annotation(
+    x=-8, 
+    y=17.5,   
+    text=f"{each_ticker} Expected Returns: {metrics['Monthly Expected Returns (%)']}<br>Risk-Free Rate: {rf:.2%}<br>S&P500 Expected Returns: {sp500_expected_returns:.2%}",
+    showarrow=False,
+    align="left",
+    font=dict(color=colors['text'])
+    )
+
+    #Modifying the color of the trendline to make it more aesthetic
+    scatter_fig.update_traces(
+            selector=dict(type='scatter', mode='lines'), 
+            line=dict(
+            color=colors['trendline'],        
+            width=2.5,             
+        ),
+        showlegend=True,        
+        name=f"Best-Fitting Line: Beta(β)={metrics['Beta']:.3f}; Alpha(α)={metrics['Alpha (%)']:.3f}; R²={metrics['R2']:.3f}"
+    )
+    
+    #Modifying Appearance of the Plot
+    scatter_fig.update_layout(
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        font_color=colors['text'],
+        title_x=0.5
+    )
+
+    return scatter_fig
+
+
+#Diverging colors of the bar charts: red for negative values, white for zero and green for positive values
+BAR_COLOR_SCALE = [
+    (0.0, '#891f00'),
+    (0.5, "white"),
+    (1.0, "#5bbe7d")
+]
+
+#Metrics table (one row per ticker, the first column is the ticker)
+#Columns after the CAPM_METRIC_COLUMNS (e.g. significance) make the table wider
+def create_metrics_table(stocks_info):
+    import plotly.graph_objects as go
+
+    #Creating DataTable with all the information inside the dataframe stocks_info
+    stocks_table = go.Figure(data=[go.Table(
+        header=dict(values=list(stocks_info.columns),
+                    line_color=colors['line_color_table'],
+                    fill_color=colors['fill_color_col_table'],
+                    align='center',
+                    height = 30),
+        cells=dict(values=[stocks_info.index] + [stocks_info[column] for column in stocks_info.columns[1:]],
+                   fill_color=colors['fill_color_table'],
+                   line_color=colors['line_color_table'],
+                   align='center',
+                   height = 30),
+                   columnwidth=[0.3, 0.3, 0.3])
+        ])
+
+    table_height = 100 + (len(stocks_info) * 30)
+
+    stocks_table.update_layout(
+        paper_bgcolor=colors['background'],
+        font_color=colors['text'],
+        width=750 + 80 * (len(stocks_info.columns) - len(CAPM_METRIC_COLUMNS)),
+        height=table_height,  # Keep height small too
+        margin=dict(l=5, r=5, t=5, b=10),  # Minimal margins
+        autosize=False
+    )
+    return stocks_table
+
+#Bar chart of one metric for every ticker (Jensen's Alpha, Treynor and Sharpe Ratio), with a dashed line at 0
+def create_bar_chart(stocks_info, column, title, texttemplate, labels=None):
+    px = load_plotly_express()
+
+    bar_fig = px.bar(stocks_info,
+                     x = 'Ticker',
+                     y = column,
+                     title= title,
+                     labels= labels or {},
+                     text = column,
+                     color=column,
+                     color_continuous_scale=BAR_COLOR_SCALE,
+                     color_continuous_midpoint=0)
+
+    bar_fig.add_shape(
+                    type='line',
+                    x0=0,
+                    x1=len(stocks_info),
+                    y0=0,
+                    y1=0,
+                    line=dict(color='black', width=1.5, dash='dash')
+                )
+
+    bar_fig.update_traces(texttemplate=texttemplate, textposition='outside')
+
+    bar_fig.update_layout(
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        font_color=colors['text'],
+        title_x=0.5,
+        coloraxis_showscale=False,
+    )
+    return bar_fig
+
+#Jensen's Alpha, Treynor Ratio and Sharpe Ratio bar charts of the metrics table
+def create_metric_bar_charts(stocks_info):
+    alpha_fig = create_bar_chart(stocks_info, 'Annual Alpha (%)', 'Jensen\'s Alpha for each Ticker', '%{text:.3f}%',
+                                 labels={'Annual Alpha (%)': 'Jensen\'s Alpha (%)'})
+    treynor_fig = create_bar_chart(stocks_info, 'Treynor Ratio (%)', 'Treynor Ratio for each Ticker', '%{text:.3f}%')
+    sharpe_fig = create_bar_chart(stocks_info, 'Sharpe Ratio', 'Sharpe Ratio for each Ticker', '%{text:.3f}')
+    return alpha_fig, treynor_fig, sharpe_fig
+
+#Beta of each sector (regression of the sector returns) next to the mean Beta of its tickers,
+#with the standard deviation of the Betas of the tickers as error bars (dispersion inside the sector)
+def create_sector_beta_chart(sector_df, level='Sector'):
+    import plotly.graph_objects as go
+
+    sector_df = sector_df.sort_values('Beta')
+    beta_fig = go.Figure([
+        go.Bar(x=sector_df.index, y=sector_df['Beta'], name=f'{level} Beta',
+               marker_color=colors['fill_color_col_table'], text=sector_df['Beta'], texttemplate='%{text:.2f}'),
+        go.Scatter(x=sector_df.index, y=sector_df['Mean Beta'], name='Mean Beta of the tickers (± std)', mode='markers',
+                   marker=dict(color=colors['trendline'], size=9),
+                   error_y=dict(type='data', array=sector_df['Beta Std'], color=colors['trendline'])),
+    ])
+    beta_fig.add_hline(y=1, line=dict(color='black', width=1.5, dash='dash'))
+    beta_fig.update_layout(
+        title=f'Beta of each {level} versus the {index_name}',
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        font_color=colors['text'],
+        title_x=0.5,
+        yaxis_title='Beta',
+        legend=dict(orientation='h', y=-0.3),
+    )
+    return beta_fig
+
+#Simulated distribution of the returns of each ticker over one horizon (one line per ticker, see simulation.py)
+#histograms: {ticker: share of the paths (%) per bin, indexed by the return of the bin}, summary_df: rows of the horizon
+def create_simulation_chart(histograms, summary_df, horizon):
+    import plotly.graph_objects as go
+
+    simulation_fig = go.Figure([
+        go.Scatter(x=histogram.index, y=histogram.values, name=ticker, mode='lines', line_shape='spline',
+                   line=dict(dash='dash' if ticker == index_name else 'solid'))
+        for ticker, histogram in histograms.items()
+    ])
+    #5% worst paths of the first ticker (VaR 95)
+    first_ticker = next((ticker for ticker in histograms if ticker != index_name), index_name)
+    var_95 = summary_df.loc[summary_df['Ticker'] == first_ticker, 'VaR 95 (%)']
+    if len(var_95):
+        simulation_fig.add_vline(x=-var_95.iloc[0], line=dict(color=colors['title'], width=1.5, dash='dot'),
+                                 annotation_text=f'{first_ticker} VaR 95%')
+    simulation_fig.update_layout(
+        title=f'Simulated returns over {horizon} month{"s" if horizon > 1 else ""}',
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        font_color=colors['text'],
+        title_x=0.5,
+        xaxis_title='Total return over the horizon (%)',
+        yaxis_title='Share of the paths (%)',
+    )
+    return simulation_fig
+
+#Rolling Beta, Alpha and R2 charts of one ticker
+#estimators_dfs: {name: df with Beta, Alpha and R2} (the fixed window first, then e.g. EWMA and expanding window)
+#Returns the three figures (Beta, Alpha, R2); the first line of each is the fixed window (swapped by the slider)
+def create_rolling_figures(each_ticker, estimators_dfs, window_size):
+    px = load_plotly_express()
+
+    figures = []
+    for metric in ['Beta', 'Alpha', 'R2']:
+        #One column per estimator
+        metric_df = pd.DataFrame({name: estimator_df[metric] for name, estimator_df in estimators_dfs.items()})
+
+        rolling_fig = px.line(
+            metric_df,
+            x=metric_df.index,
+            y=list(metric_df.columns),
+            title=f'Rolling {metric} for {each_ticker} (Window: {window_size} months)',
+            labels={'value': metric, 'variable': 'Estimator', 'date': 'Date'}
+        )
+
+        # Add a horizontal line at 1 for reference
+        rolling_fig.add_shape(
+            type='line',
+            x0=metric_df.index.min(),
+            x1=metric_df.index.max(),
+            y0=1,
+            y1=1,
+            line=dict(color='black', width=1.5, dash='dash')
+        )
+
+        #Update layout for aesthetic purposes
+        rolling_fig.update_layout(
+            plot_bgcolor=colors['background'],
+            paper_bgcolor=colors['background'],
+            font_color=colors['text'],
+            title_x=0.5,
+            height=400,
+            xaxis_title="Date",
+            yaxis_title=f"{metric} Value",
+            showlegend=len(estimators_dfs) > 1,
+        )
+        figures.append(rolling_fig)
+
+    return figures
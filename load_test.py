@@ -0,0 +1,279 @@
+#Load test of the webapp: N simulated users analyzing tickers at the same time
+#Each user repeats the scenario of the browser, sending the same requests to the Dash callback endpoint
+#(/_dash-update-component):
+#  1. Run Analysis (update_output_analysis) with a few random tickers
+#  2. Show the scatter plots of those tickers (display_selected_scatter_plots)
+#  3. Generate their rolling CAPM charts (generate_rolling_capm_charts)
+#Like a browser tab, each user keeps the values its callbacks returned (e.g. the analysis-store of its last analysis)
+#and sends them back as the states of the next requests, so every user is a separate session
+#Users analyze different periods (USER_START_DATES) at the same time
+#Every response is checked (HTTP status, one figure per ticker, no figure of a ticker the user did not select and no
+#month before the start of its period, so a user receiving the results of another user counts as an error), and the
+#report has the throughput, the p50/p95/p99 latency and the error rate of each step
+#By default the webapp runs in this process (threaded server like the development server) with the synthetic
+#data provider, so nothing is downloaded; --url tests a server that is already running
+#Usage: python -m capm load-test --users 8 --iterations 5
+import contextlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.error
+from datetime import date
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+#Tickers drawn by the simulated users when no list is given (any symbol works with the synthetic provider)
+DEFAULT_TICKERS = ["AAPL", "MSFT", "TSLA", "GOOG", "AMZN", "NVDA", "META"]
+
+#Percentiles of the latency in the report
+LATENCY_PERCENTILES = [50, 95, 99]
+
+#Start of the analysis period of each user (the users take them in turn, None: the whole history)
+USER_START_DATES = [None, '2015-01-01', '2020-01-01']
+
+
+#Steps of the scenario: name, component of the callback output, values sent for its inputs and states
+#and the number of figures expected per ticker in the response
+#(values are functions of the tickers of the user, the window size and the start of its period)
+SCENARIO_STEPS = [
+    ('analysis', 'output-container', lambda tickers, window, start_date: {
+        'run-analysis-button.n_clicks': 1,
+        'ticker-dropdown.value': tickers,
+        'regression-method-radio.value': 'ols',
+        'date-range-picker.start_date': start_date,
+        'date-range-picker.end_date': None,
+    }, 0),
+    ('scatter', 'selected-scatter-container', lambda tickers, window, start_date: {
+        'display-scatter-button.n_clicks': 1,
+        'ticker-scatter-checklist.value': tickers,
+        'show-scatter-radio.value': 'yes',
+    }, 1),
+    ('rolling', 'rolling-capm-chart-container', lambda tickers, window, start_date: {
+        'generate-rolling-capm-button.n_clicks': 1,
+        'rolling-capm-ticker-checklist.value': tickers,
+        'window-size-slider.value': window,
+        'rolling-estimators-checklist.value': [],
+        'ewma-halflife-input.value': 12,
+    }, 3),
+]
+
+
+def post_json(url, payload, timeout=120):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status, response.read()
+
+
+def get_json(url, timeout=120):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+#Outputs of a callback from its output string ("id.prop" or "..id1.prop1...id2.prop2.." when there are several)
+def parse_outputs(output):
+    if output.startswith('..'):
+        outputs = output[2:-2].split('...')
+    else:
+        outputs = [output]
+    parsed = []
+    for each_output in outputs:
+        component_id, prop = each_output.rsplit('.', 1)
+        parsed.append({'id': component_id, 'property': prop})
+    return parsed if output.startswith('..') else parsed[0]
+
+
+#Callback whose output includes the component (from the list of /_dash-dependencies)
+def find_callback(dependencies, component_id):
+    for dependency in dependencies:
+        outputs = parse_outputs(dependency['output'])
+        if component_id in [output['id'] for output in (outputs if isinstance(outputs, list) else [outputs])]:
+            return dependency
+    raise ValueError(f"No callback updates '{component_id}'")
+
+
+#Body of the request sent by the browser when the input of the callback changes
+def build_payload(dependency, values):
+    def with_values(items):
+        return [{**item, 'value': values.get(f"{item['id']}.{item['property']}")} for item in items]
+
+    return {
+        'output': dependency['output'],
+        'outputs': parse_outputs(dependency['output']),
+        'inputs': with_values(dependency['inputs']),
+        'state': with_values(dependency.get('state', [])),
+        'changedPropIds': [f"{item['id']}.{item['property']}" for item in dependency['inputs']],
+    }
+
+
+#Number of dcc.Graph components in the response of a callback
+def count_graphs(value):
+    if isinstance(value, dict):
+        own = 1 if value.get('type') == 'Graph' and value.get('namespace') == 'dash_core_components' else 0
+        return own + sum(count_graphs(item) for item in value.values())
+    if isinstance(value, list):
+        return sum(count_graphs(item) for item in value)
+    return 0
+
+
+#Figures in the response of a callback (dicts with the data and the layout of a plotly figure)
+def find_figures(value):
+    if isinstance(value, dict):
+        own = [value] if isinstance(value.get('data'), list) and isinstance(value.get('layout'), dict) else []
+        return own + [figure for item in value.values() for figure in find_figures(item)]
+    if isinstance(value, list):
+        return [figure for item in value for figure in find_figures(item)]
+    return []
+
+
+#Tickers of the pool named by the figures of a response that are not tickers of the user (results of another session)
+def foreign_tickers(response, tickers, ticker_pool):
+    titles = [figure['layout'].get('title') for figure in find_figures(response)]
+    titles = [title.get('text') if isinstance(title, dict) else title for title in titles if title]
+    return sorted({ticker for ticker in ticker_pool if ticker not in tickers
+                   for title in titles if f' {ticker} ' in f' {title} '})
+
+
+#Whether a figure of the response has data from before the start of the period of the user (another session):
+#dates before the start (rolling charts), or more points than months since the start (scatter plots)
+def outside_period(response, start_date):
+    if start_date is None:
+        return False
+    start = date.fromisoformat(start_date)
+    months = (date.today().year - start.year) * 12 + date.today().month - start.month + 1
+    for figure in find_figures(response):
+        for trace in figure['data']:
+            x = trace.get('x') or []
+            if any(isinstance(value, str) and value[:10] < start_date for value in x):
+                return True
+            if trace.get('mode') == 'markers' and len(x) > months:
+                return True
+    return False
+
+
+#Values of the components returned by a callback ("id.prop" -> value), kept by the browser for the next requests
+def response_values(response):
+    return {f'{component_id}.{prop}': value for component_id, props in response.items() for prop, value in props.items()}
+
+
+#One simulated user (one browser tab): runs the scenario "iterations" times with random tickers
+#Returns a list of (step, seconds, error or None)
+def run_user(base_url, callbacks, ticker_pool, tickers_per_user, window_size, iterations, seed, start_date=None):
+    rng = random.Random(seed)
+    results = []
+    #Values returned by the callbacks so far (sent back as states, like the components of the page)
+    page_values = {}
+    for _ in range(iterations):
+        tickers = rng.sample(ticker_pool, min(tickers_per_user, len(ticker_pool)))
+        for name, component_id, get_values, figures_per_ticker in SCENARIO_STEPS:
+            payload = build_payload(callbacks[name], {**page_values, **get_values(tickers, window_size, start_date)})
+            start = time.perf_counter()
+            error = None
+            try:
+                status, body = post_json(f'{base_url}/_dash-update-component', payload)
+                response = json.loads(body)['response']
+                page_values.update(response_values(response))
+                #Every figure expected for the tickers of this user must be in the response, and only those
+                expected = figures_per_ticker * len(tickers)
+                others = foreign_tickers(response, tickers, ticker_pool)
+                if others:
+                    error = f"received figures of {', '.join(others)} (another session)"
+                elif outside_period(response, start_date):
+                    error = f"received figures from before {start_date} (another session)"
+                elif expected and count_graphs(response) != expected:
+                    error = f"expected {expected} figures, got {count_graphs(response)}"
+            except urllib.error.HTTPError as e:
+                error = f"HTTP {e.code}"
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            results.append((name, time.perf_counter() - start, error))
+    return results
+
+
+#Throughput, latency percentiles (ms) and errors of each step and of all requests
+def summarize(results, wall_seconds):
+    summary = {}
+    for name in [step[0] for step in SCENARIO_STEPS] + ['total']:
+        step_results = [result for result in results if name in (result[0], 'total')]
+        latencies = np.array([seconds for _, seconds, _ in step_results]) * 1000
+        errors = [error for _, _, error in step_results if error is not None]
+        summary[name] = {
+            'requests': len(step_results),
+            'throughput_per_s': round(len(step_results) / wall_seconds, 2) if wall_seconds else None,
+            **{f'p{percentile}_ms': round(float(np.percentile(latencies, percentile)), 1) if len(latencies) else None
+               for percentile in LATENCY_PERCENTILES},
+            'errors': len(errors),
+            'error_rate': round(len(errors) / len(step_results), 4) if step_results else 0.0,
+            #A few examples of the errors (the same error is usually repeated)
+            'error_examples': sorted(set(errors))[:3],
+        }
+    return summary
+
+
+def print_summary(summary, users, wall_seconds):
+    print(f"{users} users, {summary['total']['requests']} requests in {wall_seconds:.1f}s")
+    header = f"{'step':<10}{'requests':>10}{'req/s':>9}" + ''.join(f"{f'p{p} ms':>11}" for p in LATENCY_PERCENTILES) + f"{'errors':>9}"
+    print(header)
+    for name, stats in summary.items():
+        print(f"{name:<10}{stats['requests']:>10}{stats['throughput_per_s']:>9}"
+              + ''.join(f"{stats[f'p{p}_ms']:>11}" for p in LATENCY_PERCENTILES)
+              + f"{stats['error_rate']:>9.1%}")
+        for error in stats['error_examples']:
+            print(f"    {error}")
+
+
+#Webapp served by a thread of this process (like the development server: one thread per request)
+#Returns the base URL and the server (shutdown() stops it)
+def start_local_server():
+    from werkzeug.serving import make_server
+    import app
+
+    #Request logs of werkzeug would hide the report
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app.app.server, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+#users: simulated users running at the same time, each one running the scenario "iterations" times
+#url: server to test (default: the webapp started in this process with the synthetic provider)
+#quiet: hides what the callbacks print while the test runs (only with the local server)
+def run_load_test(users=4, iterations=3, tickers=None, tickers_per_user=3, window_size=12, url=None,
+                  seed=0, quiet=True):
+    server = None
+    if url is None:
+        #Offline data unless another provider is configured
+        os.environ.setdefault('CAPM_DATA_PROVIDER', 'synthetic')
+        url, server = start_local_server()
+    url = url.rstrip('/')
+
+    try:
+        #Loading the page once, like the browser, before asking for the callbacks
+        urllib.request.urlopen(url + '/', timeout=120).read()
+        dependencies = get_json(url + '/_dash-dependencies')
+        callbacks = {name: find_callback(dependencies, component_id) for name, component_id, _, _ in SCENARIO_STEPS}
+
+        with contextlib.ExitStack() as stack:
+            if quiet and server is not None:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=users) as executor:
+                futures = [executor.submit(run_user, url, callbacks, tickers or DEFAULT_TICKERS, tickers_per_user,
+                                           window_size, iterations, seed + user,
+                                           USER_START_DATES[user % len(USER_START_DATES)]) for user in range(users)]
+                results = [result for future in futures for result in future.result()]
+            wall_seconds = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    summary = summarize(results, wall_seconds)
+    summary['config'] = {'users': users, 'iterations': iterations, 'tickers_per_user': tickers_per_user,
+                         'window_size': window_size, 'url': url, 'seconds': round(wall_seconds, 2)}
+    print_summary({name: stats for name, stats in summary.items() if name != 'config'}, users, wall_seconds)
+    return summary
@@ -0,0 +1,167 @@
+#Shared HTTP layer used to fetch market data (yfinance) for the whole process
+#- One connection-pooled session is reused by every request (no new connection per ticker)
+#- A token bucket limits how many requests per second are sent to the API
+#- Rate-limited (429) and server errors are retried with exponential backoff
+#- Callers asking for the same symbol at the same time share one in-flight request
+#The session works with any URL, so it can be pointed to a local stub server for testing
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+#Status codes that are worth retrying (rate limited or temporary server errors)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+#Token bucket rate limiter: "rate" tokens are added per second, up to "capacity" tokens
+#Each request takes one token, so short bursts are allowed but the average rate is limited
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    #Blocks until a token is available
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class RateLimitedSession(requests.Session):
+    def __init__(self, rate=2.0, burst=5, max_retries=5, backoff_factor=0.5, max_backoff=30.0, pool_size=20):
+        super().__init__()
+        self.rate_limiter = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+
+        #Retries are done in request() (so every retry also waits for a token), not by urllib3
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    #Waiting time before the next attempt: Retry-After header if the server sent one,
+    #otherwise exponential backoff (0.5s, 1s, 2s, ...) with some jitter so clients do not retry together
+    def backoff_time(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        backoff = self.backoff_factor * (2 ** attempt)
+        return min(backoff * random.uniform(0.5, 1.0), self.max_backoff)
+
+    def request(self, method, url, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self.backoff_time(attempt))
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                time.sleep(self.backoff_time(attempt, response))
+                response.close()
+            attempt += 1
+
+
+#Fetches price history through the shared session
+#Concurrent calls for the same (symbol, period, interval) wait for the same request instead of sending their own
+class MarketDataClient:
+    def __init__(self, session=None):
+        self.session = session if session is not None else RateLimitedSession()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def history(self, symbol, period, interval):
+        key = (symbol, period, interval)
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self.in_flight[key] = future
+
+        #Other callers just wait for the result of the first one
+        if not is_owner:
+            return future.result().copy()
+
+        try:
+            historical_data = self.fetch_history(symbol, period, interval)
+            future.set_result(historical_data)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+        return historical_data.copy()
+
+    def fetch_history(self, symbol, period, interval):
+        import yfinance as yf
+
+        ticker_info = yf.Ticker(symbol, session=self.session)
+        return ticker_info.history(period=period, interval=interval)
+
+    #Market cap from the latest quote (None if Yahoo Finance does not have it)
+    def market_cap(self, symbol):
+        import yfinance as yf
+
+        try:
+            return yf.Ticker(symbol, session=self.session).fast_info['marketCap']
+        except Exception as e:
+            print(f"No market cap for {symbol}: {e}")
+            return None
+
+    #Sector and industry from the profile of the company ((None, None) if Yahoo Finance does not have them)
+    #Yahoo Finance uses its own names, close to the GICS sectors and industries
+    def sector_and_industry(self, symbol):
+        import yfinance as yf
+
+        try:
+            info = yf.Ticker(symbol, session=self.session).info
+        except Exception as e:
+            print(f"No sector for {symbol}: {e}")
+            return None, None
+        return info.get('sector') or None, info.get('industry') or None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+#Client shared by the whole process (webapp, API, command line and preprocessor)
+#Limits can be changed with the CAPM_RATE_LIMIT (requests per second), CAPM_RATE_BURST,
+#CAPM_MAX_RETRIES and CAPM_POOL_SIZE environment variables
+def get_market_data_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            session = RateLimitedSession(
+                rate=float(os.environ.get('CAPM_RATE_LIMIT', 2.0)),
+                burst=int(os.environ.get('CAPM_RATE_BURST', 5)),
+                max_retries=int(os.environ.get('CAPM_MAX_RETRIES', 5)),
+                pool_size=int(os.environ.get('CAPM_POOL_SIZE', 20)),
+            )
+            _client = MarketDataClient(session)
+        return _client
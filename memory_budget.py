@@ -0,0 +1,173 @@
+#Memory limits of the analysis process
+#- MemoryBudget: maximum size of the results kept in memory (excess returns, rolling analyses, figures).
+#  Every cache that is part of the budget is a BudgetedDict, when the total goes over the budget the
+#  least recently used entries (of any cache) are dropped, and they are calculated again when needed
+#- Return panels can be stored as float32 (half the memory of float64, ~7 significant digits,
+#  calculations still upcast to float64)
+#- track_memory: peak memory allocated by a callback (tracemalloc), to find which one needs the budget
+import functools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+#Storage types of the return panels
+RETURNS_DTYPES = ['float64', 'float32']
+
+
+#Approximate memory used by a value (pandas, NumPy, plotly figures and containers of them)
+def estimate_nbytes(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        memory = value.memory_usage(deep=True)
+        return int(memory.sum()) if isinstance(memory, pd.Series) else int(memory)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if hasattr(value, 'to_plotly_json'):
+        return estimate_nbytes(value.to_plotly_json())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_nbytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class MemoryBudget:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        #(cache, key) -> size, in order of use (least recently used first)
+        self.entries = OrderedDict()
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    def __repr__(self):
+        return f"MemoryBudget(max_bytes={self.max_bytes}, used_bytes={self.used_bytes})"
+
+    #Dictionary whose entries count against the budget
+    def cache(self):
+        return BudgetedDict(self)
+
+    def add(self, cache, key, size):
+        with self.lock:
+            self.remove(cache, key)
+            self.entries[(id(cache), key)] = (cache, size)
+            self.used_bytes += size
+            #Dropping the least recently used entries (never the one just added)
+            while self.used_bytes > self.max_bytes and len(self.entries) > 1:
+                (_, old_key), (old_cache, _) = next(iter(self.entries.items()))
+                old_cache.discard(old_key)
+                self.evictions += 1
+
+    def touch(self, cache, key):
+        with self.lock:
+            if (id(cache), key) in self.entries:
+                self.entries.move_to_end((id(cache), key))
+
+    def remove(self, cache, key):
+        with self.lock:
+            entry = self.entries.pop((id(cache), key), None)
+            if entry is not None:
+                self.used_bytes -= entry[1]
+
+
+#dict that reports its entries to a MemoryBudget, entries may disappear when the budget is full
+#(callers use one get(), which is atomic, and calculate the value again when it returns None:
+#"key in cache" followed by cache[key] can raise KeyError if another thread evicts the entry in between)
+class BudgetedDict(dict):
+    def __init__(self, budget):
+        super().__init__()
+        self.budget = budget
+
+    def __setitem__(self, key, value):
+        with self.budget.lock:
+            super().__setitem__(key, value)
+            self.budget.add(self, key, estimate_nbytes(value))
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.budget.touch(self, key)
+        return value
+
+    def get(self, key, default=None):
+        with self.budget.lock:
+            return self[key] if key in self else default
+
+    def __delitem__(self, key):
+        with self.budget.lock:
+            super().__delitem__(key)
+            self.budget.remove(self, key)
+
+    def pop(self, key, *default):
+        with self.budget.lock:
+            self.budget.remove(self, key)
+            return super().pop(key, *default)
+
+    #Removing an entry only if it is there (used by the budget when evicting)
+    def discard(self, key):
+        self.pop(key, None)
+
+    def clear(self):
+        with self.budget.lock:
+            for key in list(self):
+                self.budget.remove(self, key)
+            super().clear()
+
+
+#Cache that is part of the budget, or a plain dict when there is no budget
+def budgeted_dict(budget):
+    return budget.cache() if budget is not None else {}
+
+
+#Budget configured by the CAPM_MEMORY_BUDGET_MB environment variable (not set or empty: no budget)
+def get_memory_budget():
+    max_mb = os.environ.get('CAPM_MEMORY_BUDGET_MB')
+    if not max_mb:
+        return None
+    return MemoryBudget(int(float(max_mb) * 1024 * 1024))
+
+
+#Storage type of the return panels: CAPM_RETURNS_DTYPE = float64 (default) | float32
+def get_returns_dtype():
+    dtype = os.environ.get('CAPM_RETURNS_DTYPE') or 'float64'
+    if dtype not in RETURNS_DTYPES:
+        raise ValueError(f"Unknown returns dtype '{dtype}', use one of {RETURNS_DTYPES}")
+    return dtype
+
+
+#Last peak memory of each callback tracked (name -> dictionary)
+MEMORY_REPORTS = {}
+
+
+#Decorator reporting the time and the peak memory allocated while the function runs (tracemalloc)
+#Only active when CAPM_TRACE_MEMORY=1 (tracemalloc slows every allocation down)
+#Callbacks running at the same time share the same peak, so the numbers are exact with one worker thread
+def track_memory(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if os.environ.get('CAPM_TRACE_MEMORY') != '1':
+            return function(*args, **kwargs)
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        start_bytes, _ = tracemalloc.get_traced_memory()
+        start_time = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            end_bytes, peak_bytes = tracemalloc.get_traced_memory()
+            report = {
+                'seconds': round(time.perf_counter() - start_time, 3),
+                'peak_mb': round((peak_bytes - start_bytes) / 1024 / 1024, 2),
+                'retained_mb': round((end_bytes - start_bytes) / 1024 / 1024, 2),
+            }
+            MEMORY_REPORTS[function.__name__] = report
+            print(f"Memory of {function.__name__}: peak {report['peak_mb']} MB, retained {report['retained_mb']} MB "
+                  f"({report['seconds']}s)")
+
+    return wrapper
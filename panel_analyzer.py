@@ -0,0 +1,298 @@
+#Vectorized CAPM calculations over a panel of excess returns (dates x tickers)
+#Instead of running one regression per ticker, the sums needed by the OLS formulas are calculated
+#for every ticker at once with NumPy, so hundreds of tickers cost about the same as one
+#Only pandas/NumPy are used here (no statsmodels, no plotting; SciPy only for the p-values)
+import numpy as np
+import pandas as pd
+
+ROLLING_METRICS = ['Beta', 'Alpha', 'R2']
+
+#Significance of Alpha and Beta: classical OLS and Newey-West (HAC) standard errors, t-stats and p-values
+INFERENCE_COLUMNS = ['Beta SE', 'Beta t', 'Beta p', 'Alpha SE', 'Alpha t', 'Alpha p',
+                     'Beta NW SE', 'Beta NW t', 'Beta NW p', 'Alpha NW SE', 'Alpha NW t', 'Alpha NW p']
+
+#Downside risk: Betas of the down- and up-market months, Sortino Ratio, maximum drawdown and Calmar Ratio
+DOWNSIDE_COLUMNS = ['Downside Beta', 'Upside Beta', 'Sortino Ratio', 'Max Drawdown (%)', 'Calmar Ratio']
+
+
+#Aligning the panel of ticker excess returns with the market excess returns
+#Returns the tickers' values (dates x tickers), the market values (dates x 1) and the mask of valid pairs
+def align_panel(excess_returns_panel, market_excess_returns):
+    market = market_excess_returns.reindex(excess_returns_panel.index)
+    y = excess_returns_panel.to_numpy(dtype=float)
+    x = market.to_numpy(dtype=float)[:, None]
+    mask = ~np.isnan(y) & ~np.isnan(x)
+    return y, x, mask
+
+
+#Rolling sum over the first axis (window of the last "window" rows, including the current one)
+def rolling_sum(values, window):
+    cumulative = np.cumsum(values, axis=0)
+    rolling = cumulative.copy()
+    rolling[window:] -= cumulative[:-window]
+    return rolling
+
+
+#Rolling Beta, Alpha and R2 of every ticker in one pass
+#Months removed as outliers (NaN) are skipped, a window needs at least min_periods valid months
+#(default: two thirds of the window) to have a value
+#Returns a dictionary {'Beta': df, 'Alpha': df, 'R2': df}, each df is dates x tickers
+def rolling_capm_panel(excess_returns_panel, market_excess_returns, window=12, min_periods=None):
+    if min_periods is None:
+        min_periods = max(3, (2 * window) // 3)
+
+    y, x, mask = align_panel(excess_returns_panel, market_excess_returns)
+    x = np.where(mask, x, 0.0)
+    y = np.where(mask, y, 0.0)
+
+    n = rolling_sum(mask.astype(float), window)
+    sum_x = rolling_sum(x, window)
+    sum_y = rolling_sum(y, window)
+    sum_xx = rolling_sum(x * x, window)
+    sum_xy = rolling_sum(x * y, window)
+    sum_yy = rolling_sum(y * y, window)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = sum_xy - sum_x * sum_y / n
+        variance_x = sum_xx - sum_x ** 2 / n
+        variance_y = sum_yy - sum_y ** 2 / n
+
+        beta = covariance / variance_x
+        alpha = (sum_y - beta * sum_x) / n
+        r_squared = covariance ** 2 / (variance_x * variance_y)
+
+    invalid = (n < min_periods) | (variance_x <= 0)
+    results = {}
+    for metric, values in zip(ROLLING_METRICS, (beta, alpha, r_squared)):
+        values[invalid] = np.nan
+        results[metric] = pd.DataFrame(values, index=excess_returns_panel.index, columns=excess_returns_panel.columns)
+
+    return results
+
+
+#Rolling Beta, Alpha and R2 of one ticker for several window sizes in one pass
+#Same results as RollingOLS: months missing in either series are dropped, and a window needs "window" months
+#The cumulative sums are calculated once, then every window size is a difference of them
+#Returns a dictionary {window: df}, each df has the dates as index and columns Alpha, Beta and R2
+def rolling_capm_windows(ticker_excess_returns, market_excess_returns, windows):
+    combined_df = pd.DataFrame({'y': ticker_excess_returns, 'x': market_excess_returns}).dropna()
+    x = combined_df['x'].to_numpy(dtype=float)
+    y = combined_df['y'].to_numpy(dtype=float)
+
+    #One row of zeros first, so the sum of the rows i-window+1..i is cumulative[i+1] - cumulative[i+1-window]
+    cumulative = np.zeros((len(x) + 1, 5))
+    np.cumsum(np.column_stack([x, y, x * x, x * y, y * y]), axis=0, out=cumulative[1:])
+
+    results = {}
+    for window in windows:
+        if window > len(x):
+            results[window] = pd.DataFrame(columns=['Alpha', 'Beta', 'R2'], dtype=float)
+            continue
+
+        sum_x, sum_y, sum_xx, sum_xy, sum_yy = (cumulative[window:] - cumulative[:-window]).T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            covariance = sum_xy - sum_x * sum_y / window
+            variance_x = sum_xx - sum_x ** 2 / window
+            variance_y = sum_yy - sum_y ** 2 / window
+
+            beta = covariance / variance_x
+            alpha = (sum_y - beta * sum_x) / window
+            r_squared = covariance ** 2 / (variance_x * variance_y)
+
+        results[window] = pd.DataFrame({'Alpha': alpha, 'Beta': beta, 'R2': r_squared},
+                                       index=combined_df.index[window - 1:])
+    return results
+
+
+#Full-period CAPM metrics of every ticker of the panel in one pass (same values as
+#TickerReturns.calculate_capm_metrics, rounded the same way)
+#sp500_expected_returns and rf are the monthly means used for the expected returns
+#Returns a dataframe with one row per ticker and the columns of the metrics table
+def capm_metrics_panel(excess_returns_panel, market_excess_returns, sp500_expected_returns, rf):
+    from ticker_analyzer import CAPM_METRIC_COLUMNS
+
+    y, x, mask = align_panel(excess_returns_panel, market_excess_returns)
+    x = np.where(mask, x, 0.0)
+    y = np.where(mask, y, 0.0)
+
+    #Regression on the months where both the ticker and the market have a value
+    n = mask.sum(axis=0)
+    sum_x = x.sum(axis=0)
+    sum_y = y.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = (x * y).sum(axis=0) - sum_x * sum_y / n
+        variance_x = (x * x).sum(axis=0) - sum_x ** 2 / n
+        variance_y = (y * y).sum(axis=0) - sum_y ** 2 / n
+
+        beta = np.round(covariance / variance_x, 3)
+        alpha = (sum_y - covariance / variance_x * sum_x) / n
+        r_squared = covariance ** 2 / (variance_x * variance_y)
+
+        #Treynor and Sharpe Ratio use every month of the ticker (like the series in calculate_capm_metrics)
+        mean_excess_returns = excess_returns_panel.mean().to_numpy()
+        std_dev_excess_returns = excess_returns_panel.std().to_numpy()
+        treynor_ratio = mean_excess_returns / beta * 12
+        sharpe_ratio = mean_excess_returns / std_dev_excess_returns * (12 ** 0.5)
+
+    expected_returns = (rf + beta * (sp500_expected_returns - rf)) * 100
+
+    metrics_df = pd.DataFrame({
+        'Ticker': excess_returns_panel.columns,
+        'Beta': beta,
+        'Monthly Expected Returns (%)': expected_returns,
+        'Alpha (%)': alpha,
+        'R2': r_squared,
+        'Treynor Ratio (%)': treynor_ratio,
+        'Sharpe Ratio': sharpe_ratio,
+        'Annual Alpha (%)': alpha * 12,
+    }, index=excess_returns_panel.columns)[CAPM_METRIC_COLUMNS]
+
+    #Tickers with less than 3 common months cannot be regressed
+    metrics_df = metrics_df[(n >= 3) & (variance_x > 0)]
+    return metrics_df.round(3)
+
+
+#Standard errors, t-stats and p-values of Alpha and Beta of every ticker in one pass (closed form, no model objects)
+#- Classical OLS standard errors, p-values from the t distribution with n-2 degrees of freedom
+#- Newey-West (HAC) standard errors with Bartlett weights, robust to heteroskedasticity and autocorrelation,
+#  p-values from the normal distribution (same as statsmodels with cov_type='HAC')
+#max_lags: lags of the Newey-West estimator (default: floor(4*(n/100)^(2/9)) for a ticker with n months)
+#Returns a dataframe with one row per ticker and the INFERENCE_COLUMNS
+def capm_inference_panel(excess_returns_panel, market_excess_returns, max_lags=None):
+    from scipy import special
+
+    y, x, mask = align_panel(excess_returns_panel, market_excess_returns)
+    #Moving the valid months of each ticker to the top of its column (same as dropping the missing months),
+    #so the lags of the Newey-West estimator are consecutive valid months
+    order = np.argsort(~mask, axis=0, kind='stable')
+    mask = np.take_along_axis(mask, order, axis=0)
+    x = np.where(mask, np.take_along_axis(np.broadcast_to(x, y.shape), order, axis=0), 0.0)
+    y = np.where(mask, np.take_along_axis(y, order, axis=0), 0.0)
+
+    n = mask.sum(axis=0)
+    sum_x = x.sum(axis=0)
+    sum_xx = (x * x).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_x = sum_x / n
+        mean_y = y.sum(axis=0) / n
+        variance_x = sum_xx - sum_x * mean_x
+        beta = ((x * y).sum(axis=0) - sum_x * mean_y) / variance_x
+        alpha = mean_y - beta * mean_x
+
+        residuals = np.where(mask, y - alpha - beta * x, 0.0)
+        residual_variance = (residuals ** 2).sum(axis=0) / (n - 2)
+        se_beta = np.sqrt(residual_variance / variance_x)
+        se_alpha = np.sqrt(residual_variance * (1 / n + mean_x ** 2 / variance_x))
+
+        #Newey-West: (X'X)^-1 S (X'X)^-1 with X = [1, x], (X'X)^-1 = [[a, b], [b, d]]
+        determinant = n * sum_xx - sum_x ** 2
+        a, b, d = sum_xx / determinant, -sum_x / determinant, n / determinant
+
+    #S = sum of e_t^2 X_t'X_t plus the weighted autocovariances of e_t X_t for every lag
+    squared_residuals = residuals ** 2
+    s00 = squared_residuals.sum(axis=0)
+    s01 = (squared_residuals * x).sum(axis=0)
+    s11 = (squared_residuals * x * x).sum(axis=0)
+    if max_lags is None:
+        lags = np.floor(4 * (n / 100) ** (2 / 9)).astype(int)
+    else:
+        lags = np.full(n.shape, int(max_lags))
+    for lag in range(1, int(lags.max(initial=0)) + 1):
+        weight = np.where(lag <= lags, 1 - lag / (lags + 1), 0.0)
+        products = residuals[lag:] * residuals[:-lag]
+        s00 += weight * 2 * products.sum(axis=0)
+        s01 += weight * (products * (x[lag:] + x[:-lag])).sum(axis=0)
+        s11 += weight * 2 * (products * x[lag:] * x[:-lag]).sum(axis=0)
+
+    with np.errstate(invalid='ignore'):
+        se_alpha_nw = np.sqrt(a * a * s00 + 2 * a * b * s01 + b * b * s11)
+        se_beta_nw = np.sqrt(b * b * s00 + 2 * b * d * s01 + d * d * s11)
+
+        t_beta, t_alpha = beta / se_beta, alpha / se_alpha
+        t_beta_nw, t_alpha_nw = beta / se_beta_nw, alpha / se_alpha_nw
+        degrees_of_freedom = n - 2
+        inference = {
+            'Beta SE': se_beta,
+            'Beta t': t_beta,
+            'Beta p': 2 * special.stdtr(degrees_of_freedom, -np.abs(t_beta)),
+            'Alpha SE': se_alpha,
+            'Alpha t': t_alpha,
+            'Alpha p': 2 * special.stdtr(degrees_of_freedom, -np.abs(t_alpha)),
+            'Beta NW SE': se_beta_nw,
+            'Beta NW t': t_beta_nw,
+            'Beta NW p': 2 * special.ndtr(-np.abs(t_beta_nw)),
+            'Alpha NW SE': se_alpha_nw,
+            'Alpha NW t': t_alpha_nw,
+            'Alpha NW p': 2 * special.ndtr(-np.abs(t_alpha_nw)),
+        }
+
+    inference_df = pd.DataFrame(inference, index=excess_returns_panel.columns)[INFERENCE_COLUMNS]
+    #Tickers with less than 3 common months cannot be regressed
+    return inference_df[(n >= 3) & (variance_x > 0)]
+
+
+#Beta of every ticker on the months of the mask (closed form with the sums of the masked months only)
+#Columns with less than 3 months or no variance of the market are NaN
+def masked_beta(y, x, mask):
+    x = np.where(mask, x, 0.0)
+    y = np.where(mask, y, 0.0)
+    n = mask.sum(axis=0)
+    sum_x = x.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = (x * y).sum(axis=0) - sum_x * y.sum(axis=0) / n
+        variance_x = (x * x).sum(axis=0) - sum_x ** 2 / n
+        beta = covariance / variance_x
+    return np.where((n >= 3) & (variance_x > 0), beta, np.nan)
+
+
+#Largest fall of every column of a wealth panel from its previous peak (running maximum), e.g. -0.45 for -45%
+#wealth is the value after each month of 1 invested at the start, so the starting value 1 is the first peak
+#(a fall in the first month is a drawdown too)
+def max_drawdown(wealth):
+    wealth = np.vstack([np.ones((1, wealth.shape[1])), wealth])
+    peaks = np.maximum.accumulate(wealth, axis=0)
+    return (wealth / peaks - 1).min(axis=0)
+
+
+#Downside risk metrics of every ticker in one pass
+#- Downside / Upside Beta: regression on the months where the market excess return is negative / positive
+#  (same excess returns as Beta, so the outliers removed are the same)
+#- Sortino Ratio: annualized mean excess return over the downside deviation (root mean square of the
+#  negative excess returns, the target is the risk-free rate)
+#- Max Drawdown (%): largest fall of the value of the stock from a previous peak, from the total returns with
+#  every month (outliers are real losses here), missing months keep the value unchanged
+#- Calmar Ratio: annualized (compound) return over the absolute maximum drawdown
+#total_returns_panel: monthly total returns in decimals (dates x tickers, same tickers as the excess returns)
+#Returns a dataframe with one row per ticker and the DOWNSIDE_COLUMNS
+def downside_risk_panel(excess_returns_panel, market_excess_returns, total_returns_panel):
+    y, x, mask = align_panel(excess_returns_panel, market_excess_returns)
+    down_market = np.broadcast_to(x < 0, y.shape)
+    downside_beta = masked_beta(y, x, mask & down_market)
+    upside_beta = masked_beta(y, x, mask & ~down_market & np.broadcast_to(x > 0, y.shape))
+
+    #Sortino Ratio on every month of the ticker (like the Sharpe Ratio)
+    excess_returns = excess_returns_panel.to_numpy(dtype=float)
+    valid = ~np.isnan(excess_returns)
+    n = valid.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_excess_returns = np.where(valid, excess_returns, 0.0).sum(axis=0) / n
+        downside_deviation = np.sqrt((np.where(valid, np.minimum(excess_returns, 0.0), 0.0) ** 2).sum(axis=0) / n)
+        sortino_ratio = mean_excess_returns / downside_deviation * (12 ** 0.5)
+
+    total_returns = total_returns_panel.reindex(columns=excess_returns_panel.columns).to_numpy(dtype=float)
+    valid_total = ~np.isnan(total_returns)
+    n_total = valid_total.sum(axis=0)
+    wealth = np.cumprod(1 + np.where(valid_total, total_returns, 0.0), axis=0)
+    drawdown = max_drawdown(wealth)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annual_returns = wealth[-1] ** (12 / n_total) - 1 if len(wealth) else np.full(len(n_total), np.nan)
+        calmar_ratio = np.where(drawdown < 0, annual_returns / np.abs(drawdown), np.nan)
+
+    downside_df = pd.DataFrame({
+        'Downside Beta': downside_beta,
+        'Upside Beta': upside_beta,
+        'Sortino Ratio': sortino_ratio,
+        'Max Drawdown (%)': np.where(n_total > 0, drawdown * 100, np.nan),
+        'Calmar Ratio': np.where(n_total > 0, calmar_ratio, np.nan),
+    }, index=excess_returns_panel.columns)[DOWNSIDE_COLUMNS]
+    return downside_df.round(3)
@@ -0,0 +1,183 @@
+#Static HTML report of the CAPM analysis of a list of tickers (the results can be shared without running the webapp)
+#- Metrics table and Jensen's Alpha / Treynor / Sharpe bar charts of all tickers, scatter plot and rolling
+#  charts of each ticker (the same figures as the webapp, see figures.py)
+#- The data is calculated once in this process (vectorized metrics of all tickers, cached excess returns),
+#  the figures of each ticker are built by a process pool (building plotly figures is CPU-bound)
+#- plotly.js is embedded once at the top of the page and each figure only has its data and layout,
+#  so the file works offline and does not repeat the 3 MB library for every chart
+#- The same goes for the plotly template (colors, grids, fonts): the figures are built without it (copying
+#  the template is most of the time of building a figure) and the page adds it to every chart when drawn
+#- The page is written to disk section by section, as the workers finish
+#Usage: python -m capm report --tickers AAPL MSFT --out report.html
+import html
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date
+
+import pandas as pd
+
+from figures import (colors, index_name, TABLE_INFERENCE_COLUMNS, create_scatter_plot, create_metrics_table,
+                     create_metric_bar_charts, create_rolling_figures)
+from panel_analyzer import DOWNSIDE_COLUMNS
+from ticker_analyzer import TickerReturns, CAPM_METRIC_COLUMNS
+
+#Tickers per task sent to the process pool (fewer, larger tasks send the market data fewer times)
+REPORT_CHUNK_SIZE = 20
+
+#Decimals kept in the data of the figures (smaller file, same charts)
+REPORT_DECIMALS = 4
+
+
+#HTML of a figure without plotly.js (the page loads it once)
+def figure_html(fig):
+    return fig.to_html(full_html=False, include_plotlyjs=False, config={'displaylogo': False})
+
+
+#Building figures without a template (the page applies the template of the webapp to every chart)
+@contextmanager
+def without_template():
+    import plotly.io as pio
+
+    template = pio.templates.default
+    pio.templates.default = 'none'
+    try:
+        yield template
+    finally:
+        pio.templates.default = template
+
+
+#Sections of a chunk of tickers (runs in a worker process)
+#Each task has the data of one ticker, returns [(ticker, html of its section)]
+def build_ticker_sections(tasks):
+    with without_template():
+        return [build_ticker_section(task) for task in tasks]
+
+
+def build_ticker_section(task):
+    ticker = task['ticker']
+    parts = [f'<h2>{html.escape(ticker)}</h2>']
+    if task.get('excess_returns') is not None:
+        scatter_fig = create_scatter_plot(ticker, task['excess_returns'], task['sp500_excess_returns'],
+                                          task['metrics'], task['sp500_expected_returns'], task['rf'])
+        parts.append(figure_html(scatter_fig))
+    if task.get('rolling') is not None:
+        estimators_dfs = {f"{task['window_size']}m window": task['rolling']}
+        for rolling_fig in create_rolling_figures(ticker, estimators_dfs, task['window_size']):
+            parts.append(figure_html(rolling_fig))
+    return ticker, '<section class="ticker">' + '\n'.join(parts) + '</section>'
+
+
+#template: name of the plotly template added to the charts (the default template of the webapp)
+def page_header(title, tickers, template):
+    import plotly.io as pio
+    from plotly.offline import get_plotlyjs
+    from plotly.utils import PlotlyJSONEncoder
+
+    template_json = json.dumps(pio.templates[template].to_plotly_json(), cls=PlotlyJSONEncoder)
+    return f'''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{html.escape(title)}</title>
+<script type="text/javascript">{get_plotlyjs()}</script>
+<script type="text/javascript">
+//Template shared by every chart (added to the layouts built without one)
+var reportTemplate = {template_json};
+var plotlyNewPlot = Plotly.newPlot;
+Plotly.newPlot = function(graphDiv, data, layout, config) {{
+    layout = layout || {{}};
+    if (!layout.template || !layout.template.layout) {{ layout.template = reportTemplate; }}
+    return plotlyNewPlot.call(Plotly, graphDiv, data, layout, config);
+}};
+</script>
+<style>
+body {{ background-color: {colors['background']}; color: {colors['text']}; font-family: sans-serif; margin: 20px 60px; }}
+h1 {{ color: {colors['title']}; text-align: center; }}
+h2, h3 {{ text-align: center; }}
+.figure {{ display: flex; justify-content: center; }}
+section.ticker {{ border-top: 1px solid {colors['text']}; margin-top: 30px; }}
+</style>
+</head>
+<body>
+<h1>{html.escape(title)}</h1>
+<p style="text-align: center">{len(tickers)} tickers versus the {index_name}, generated on {date.today().isoformat()}</p>
+'''
+
+
+#Writing the report of the tickers to output_path
+#workers: processes building the figures (default: number of CPUs, 1 builds them in this process)
+#scatter / rolling: include the scatter plot / rolling charts of each ticker
+#Returns the path and the tickers that could not be analyzed ({ticker: error})
+def build_report(tickers, output_path='capm_report.html', window_size=12, workers=None, capm_regression=None,
+                 provider=None, scatter=True, rolling=True, chunk_size=REPORT_CHUNK_SIZE, title='CAPM Risk-Return Report'):
+    from panel_analyzer import rolling_capm_windows
+
+    if capm_regression is None:
+        capm_regression = TickerReturns(provider)
+    workers = workers or os.cpu_count() or 1
+    start = time.time()
+
+    #Metrics of all tickers in one vectorized pass (same numbers as the webapp table)
+    metrics_df, errors = capm_regression.calculate_universe_metrics(tickers)
+    excess_returns_panel, excess_returns_sp500, _ = capm_regression.get_excess_returns_panel(list(metrics_df.index))
+    sp500_expected_returns, rf = capm_regression.get_market_expectations()
+    analyzed_tickers = [ticker for ticker in tickers if ticker in metrics_df.index]
+    for ticker in tickers:
+        if ticker not in metrics_df.index and ticker not in errors:
+            errors[ticker] = 'Not enough data'
+
+    stocks_info = metrics_df.loc[analyzed_tickers, CAPM_METRIC_COLUMNS + DOWNSIDE_COLUMNS + TABLE_INFERENCE_COLUMNS]
+    sp500_excess_returns_df = pd.DataFrame({f'{index_name} Excess Returns (%)': excess_returns_sp500.round(REPORT_DECIMALS)})
+
+    #Data of each ticker for the workers
+    tasks = []
+    for ticker in analyzed_tickers:
+        ticker_excess_returns = excess_returns_panel[ticker].dropna().astype(float)
+        task = {'ticker': ticker, 'window_size': window_size}
+        if scatter:
+            task.update({
+                'excess_returns': ticker_excess_returns.round(REPORT_DECIMALS).rename(f'{ticker} Excess Returns (%)'),
+                'sp500_excess_returns': sp500_excess_returns_df,
+                'metrics': metrics_df.loc[ticker, ['Monthly Expected Returns (%)', 'Beta', 'Alpha (%)', 'R2']].to_dict(),
+                'sp500_expected_returns': sp500_expected_returns,
+                'rf': rf,
+            })
+        if rolling:
+            rolling_df = rolling_capm_windows(ticker_excess_returns, excess_returns_sp500, [window_size])[window_size]
+            task['rolling'] = rolling_df.round(REPORT_DECIMALS)
+        tasks.append(task)
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+
+    with open(output_path, 'w', encoding='utf-8') as f, without_template() as template:
+        f.write(page_header(title, analyzed_tickers, template))
+
+        #Summary of all tickers
+        alpha_fig, treynor_fig, sharpe_fig = create_metric_bar_charts(stocks_info)
+        for heading, fig in [('Betas, Alphas and R2', create_metrics_table(stocks_info)),
+                             ("Annualized Jensen's Alpha", alpha_fig),
+                             ('Annualized Treynor Ratio', treynor_fig),
+                             ('Annualized Sharpe Ratio', sharpe_fig)]:
+            f.write(f'<h3>{heading}</h3>\n<div class="figure">{figure_html(fig)}</div>\n')
+        if errors:
+            f.write('<h3>Tickers not analyzed</h3>\n<ul>\n')
+            f.writelines(f'<li>{html.escape(ticker)}: {html.escape(str(error))}</li>\n' for ticker, error in errors.items())
+            f.write('</ul>\n')
+
+        #Sections of each ticker, in the order of the tickers (map keeps the order of the chunks)
+        if scatter or rolling:
+            if workers > 1 and len(chunks) > 1:
+                with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+                    for sections in executor.map(build_ticker_sections, chunks):
+                        f.writelines(section for _, section in sections)
+            else:
+                for chunk in chunks:
+                    f.writelines(section for _, section in build_ticker_sections(chunk))
+
+        f.write('</body>\n</html>\n')
+
+    print(f"Report of {len(analyzed_tickers)}/{len(tickers)} tickers saved to {output_path} "
+          f"({os.path.getsize(output_path) / 1024 / 1024:.1f} MB, {time.time() - start:.1f}s)")
+    return output_path, errors
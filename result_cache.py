@@ -0,0 +1,128 @@
+#Disk cache for computed analyses (excess returns, rolling analyses)
+#- Keys are hashes of everything the result depends on (symbol, period, interval, window, outlier method
+#  and the version of the data), so when the data changes the key changes and old entries are never used
+#- Values are pickled and compressed (zlib), one file per entry
+#- When the cache is bigger than max_bytes, the least recently used entries are deleted
+#- Writes go to a temporary file that is then renamed, so several workers can share the same directory
+#- The directory is only created by the first write (nothing is created on disk when the app is imported)
+#The cache directory must only be writable by the app (entries are unpickled when read)
+import hashlib
+import json
+import os
+import pickle
+import threading
+import zlib
+from pathlib import Path
+
+#Extension of the cache entries
+ENTRY_SUFFIX = '.bin'
+
+
+class ResultCache:
+    def __init__(self, directory='.capm_cache', max_bytes=256 * 1024 * 1024, compression_level=6):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.compression_level = compression_level
+
+        self.lock = threading.Lock()
+        #Bytes written since the size of the directory was last checked
+        self.bytes_since_eviction = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"ResultCache({str(self.directory)!r}, max_bytes={self.max_bytes})"
+
+    #Key of a result: hash of all its inputs (any JSON-serializable values)
+    @staticmethod
+    def make_key(**parts):
+        serialized = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode()).hexdigest()
+
+    def path(self, key):
+        #Entries are spread in subdirectories (first 2 characters of the key) to keep directories small
+        return self.directory / key[:2] / f'{key}{ENTRY_SUFFIX}'
+
+    #Returns (True, value) if the key is in the cache, (False, None) otherwise
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.loads(zlib.decompress(f.read()))
+        except (FileNotFoundError, zlib.error, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return False, None
+
+        #Updating the modification time, which is used to find the least recently used entries
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return True, value
+
+    def set(self, key, value):
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), self.compression_level)
+        if len(data) > self.max_bytes:
+            return
+
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.bytes_since_eviction += len(data)
+            #Checking the size of the whole directory only from time to time
+            needs_eviction = self.bytes_since_eviction > self.max_bytes // 10
+            if needs_eviction:
+                self.bytes_since_eviction = 0
+        if needs_eviction:
+            self.evict()
+
+    #Returning the cached value or calculating and saving it
+    def get_or_compute(self, key, compute):
+        found, value = self.get(key)
+        if found:
+            return value
+        value = compute()
+        self.set(key, value)
+        return value
+
+    #Deleting the least recently used entries until the cache is under max_bytes
+    def evict(self):
+        entries = []
+        for path in self.directory.glob(f'*/*{ENTRY_SUFFIX}'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+        return total_bytes
+
+    def clear(self):
+        for path in self.directory.glob(f'*/*{ENTRY_SUFFIX}'):
+            path.unlink(missing_ok=True)
+
+
+#Cache configured by environment variables (the cache is off unless CAPM_CACHE_DIR is set):
+#CAPM_CACHE_DIR = directory of the cache (e.g. .capm_cache, not set or empty: no cache)
+#CAPM_CACHE_MAX_MB = maximum size of the cache in MB (default: 256)
+def get_result_cache():
+    directory = os.environ.get('CAPM_CACHE_DIR')
+    if not directory:
+        return None
+    max_bytes = int(float(os.environ.get('CAPM_CACHE_MAX_MB', 256)) * 1024 * 1024)
+    return ResultCache(directory, max_bytes=max_bytes)
@@ -0,0 +1,185 @@
+#Robust estimators of Beta and Alpha, an alternative to removing the outliers before the OLS regression
+#(crisis months are kept, but they cannot dominate the fit)
+#- Huber: iteratively reweighted least squares (IRLS), months with large residuals get a smaller weight
+#- Theil-Sen: the slope is the median of the slopes of every pair of months
+#Both are calculated for every ticker of a panel (dates x tickers) at once with NumPy
+#Theil-Sen does not enumerate the n(n-1)/2 pairs: the median slope is found by bisection, and the number of
+#slopes below a candidate is an inversion count done with a Fenwick tree in O(n log n)
+import numpy as np
+import pandas as pd
+
+from panel_analyzer import align_panel
+
+ROBUST_METHODS = ['huber', 'theil-sen']
+
+#Tuning constant of the Huber loss (95% efficiency when the residuals are normal)
+HUBER_T = 1.345
+
+
+#Weighted least squares of every ticker at once (closed form), w = 0 for missing months
+def weighted_line(x, y, w):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sum_w = w.sum(axis=0)
+        mean_x = (w * x).sum(axis=0) / sum_w
+        mean_y = (w * y).sum(axis=0) / sum_w
+        beta = (w * (x - mean_x) * (y - mean_y)).sum(axis=0) / (w * (x - mean_x) ** 2).sum(axis=0)
+    alpha = mean_y - beta * mean_x
+    return alpha, beta
+
+
+#Huber regression of every ticker (IRLS with the scale re-estimated by the MAD of the residuals at each step)
+#Returns arrays with the Alpha and Beta of each ticker
+def huber_panel(y, x, mask, t=HUBER_T, max_iter=100, tol=1e-8):
+    #Missing months are zeroed (their weight is always 0)
+    x = np.where(mask, x, 0.0)
+    y = np.where(mask, y, 0.0)
+    weights = mask.astype(float)
+    alpha, beta = weighted_line(x, y, weights)
+
+    for _ in range(max_iter):
+        residuals = np.where(mask, y - alpha - beta * x, np.nan)
+        #Median absolute residual, scaled to be the standard deviation for normal residuals (like statsmodels RLM)
+        scale = np.nanmedian(np.abs(residuals), axis=0) / 0.6745
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u = np.abs(residuals) / scale
+            weights = np.where(mask, np.where(u <= t, 1.0, t / u), 0.0)
+        #Perfect fits (scale 0) keep the weights of the previous step
+        weights = np.where(np.isfinite(weights), weights, mask)
+
+        new_alpha, new_beta = weighted_line(x, y, weights)
+        with np.errstate(invalid='ignore'):
+            change = np.nanmax(np.abs(np.concatenate([new_alpha - alpha, new_beta - beta]))) if y.shape[1] else 0.0
+        alpha, beta = new_alpha, new_beta
+        if not change > tol:
+            break
+
+    return alpha, beta
+
+
+#Number of pairs of months i < j (sorted by the market returns) with z[i] >= z[j], for every column of z
+#Fenwick tree (binary indexed tree) over the ranks of z, one tree per column updated together
+#Missing values (valid = False) are not counted
+def count_inversions(z, valid):
+    n, n_columns = z.shape
+    #Ranks from 1 to n inside each column (missing values get the highest ranks, they are never inserted)
+    order = np.argsort(np.where(valid, z, np.inf), axis=0, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(1, n + 1)[:, None], axis=0)
+
+    #Row 0 is always empty and row n + 1 is a dummy row for the updates that go past the end,
+    #so every step works on all the columns without checking which ones are done
+    tree = np.zeros((n + 2, n_columns), dtype=np.int64)
+    columns = np.arange(n_columns)
+    steps = int(n).bit_length()
+    inversions = np.zeros(n_columns, dtype=np.int64)
+    inserted = np.zeros(n_columns, dtype=np.int64)
+
+    for j in range(n):
+        #Values inserted before j that are smaller than z[j] (prefix sum of the ranks below)
+        smaller = np.zeros(n_columns, dtype=np.int64)
+        index = ranks[j] - 1
+        for _ in range(steps):
+            smaller += tree[index, columns]
+            index -= index & -index
+        inversions += np.where(valid[j], inserted - smaller, 0)
+
+        #Inserting z[j] (missing values go to the dummy row)
+        index = np.where(valid[j], ranks[j], n + 1)
+        for _ in range(steps):
+            tree[index, columns] += 1
+            index = np.minimum(index + (index & -index), n + 1)
+        inserted += valid[j]
+
+    return inversions
+
+
+#Theil-Sen regression of every ticker: Beta is the median of the pairwise slopes,
+#Alpha is median(y) - Beta*median(x) (same as scipy.stats.theilslopes)
+#The slope of the pair (i, j) with x[i] < x[j] is <= s exactly when z[i] >= z[j] with z = y - s*x,
+#so the number of slopes <= s is an inversion count, and the median is found by bisection on s
+#The bisection starts from the quantiles of a sample of pairs around the median (checked with one count),
+#so only a few counts are needed
+#Returns arrays with the Alpha and Beta of each ticker
+def theil_sen_panel(y, x, mask, tol=1e-6, max_iter=100, n_samples=2000, seed=0):
+    #Sorting the months by the market returns (same order for every ticker)
+    order = np.argsort(x[:, 0], kind='stable')
+    x = x[order]
+    y = np.where(mask[order], y[order], np.nan)
+    mask = mask[order]
+    n, n_columns = y.shape
+
+    n_valid = mask.sum(axis=0)
+    n_pairs = n_valid * (n_valid - 1) // 2
+    #Ranks (1-based) of the two middle slopes (the same one when the number of pairs is odd)
+    targets = np.concatenate([(n_pairs + 1) // 2, n_pairs // 2 + 1])
+
+    #Bracket containing every slope: the largest change of y over the smallest gap between two months
+    gaps = np.diff(x[:, 0][mask.any(axis=1)])
+    min_gap = gaps[gaps > 0].min() if (gaps > 0).any() else 1.0
+    with np.errstate(invalid='ignore'):
+        y_range = np.nanmax(y, axis=0) - np.nanmin(y, axis=0)
+    bound = np.nan_to_num(y_range / min_gap, nan=1.0) + 1.0
+
+    #Narrower bracket from a random sample of pairs: quantiles 5 standard errors around the median
+    rng = np.random.default_rng(seed)
+    first, second = rng.integers(0, n, (2, n_samples)) if n else (np.array([], int), np.array([], int))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sample_slopes = (y[second] - y[first]) / (x[second] - x[first])
+    sample_slopes[~np.isfinite(sample_slopes)] = np.nan
+    margin = 5 * np.sqrt(0.25 / max(n_samples, 1))
+    with np.errstate(invalid='ignore'):
+        sample_low, sample_high = np.nanquantile(sample_slopes, [0.5 - margin, 0.5 + margin], axis=0)
+
+    y = np.where(mask, y, 0.0)
+    #Both middle slopes of every ticker are searched together (two columns per ticker)
+    y_both = np.concatenate([y, y], axis=1)
+    mask_both = np.concatenate([mask, mask], axis=1)
+    x_both = np.broadcast_to(x, y_both.shape)
+
+    def count_below(slopes):
+        return count_inversions(np.where(mask_both, y_both - slopes * x_both, 0.0), mask_both)
+
+    #Keeping the sampled bracket only where it contains the middle slopes
+    sample_low = np.concatenate([sample_low, sample_low])
+    sample_high = np.concatenate([sample_high, sample_high])
+    low_ok = ~np.isnan(sample_low) & (count_below(np.nan_to_num(sample_low)) < targets)
+    high_ok = ~np.isnan(sample_high) & (count_below(np.nan_to_num(sample_high)) >= targets)
+    low = np.where(low_ok, sample_low, -np.concatenate([bound, bound]))
+    high = np.where(high_ok, sample_high, np.concatenate([bound, bound]))
+
+    for _ in range(max_iter):
+        if np.all(high - low <= tol * (1 + np.abs(low))):
+            break
+        middle = (low + high) / 2
+        #The target slope is <= middle when at least "target" slopes are <= middle
+        below = count_below(middle) >= targets
+        high = np.where(below, middle, high)
+        low = np.where(below, low, middle)
+
+    beta = (high[:n_columns] + high[n_columns:]) / 2
+    beta = np.where(n_pairs > 0, beta, np.nan)
+    y = np.where(mask, y, np.nan)
+    x_valid = np.where(mask, x, np.nan)
+    with np.errstate(invalid='ignore'):
+        alpha = np.nanmedian(y, axis=0) - beta * np.nanmedian(x_valid, axis=0)
+    return alpha, beta
+
+
+#Robust Alpha, Beta and R2 (share of the variance explained by the robust line) of every ticker of the panel
+#Returns a dataframe with one row per ticker
+def robust_capm_panel(excess_returns_panel, market_excess_returns, method='huber'):
+    if method not in ROBUST_METHODS:
+        raise ValueError(f"Unknown robust method '{method}', use one of {ROBUST_METHODS}")
+
+    y, x, mask = align_panel(excess_returns_panel, market_excess_returns)
+    if method == 'huber':
+        alpha, beta = huber_panel(y, x, mask)
+    else:
+        alpha, beta = theil_sen_panel(y, x, mask)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        residuals = np.where(mask, y - alpha - beta * x, np.nan)
+        deviations = np.where(mask, y - np.nanmean(np.where(mask, y, np.nan), axis=0), np.nan)
+        r_squared = 1 - np.nansum(residuals ** 2, axis=0) / np.nansum(deviations ** 2, axis=0)
+
+    return pd.DataFrame({'Alpha': alpha, 'Beta': beta, 'R2': r_squared}, index=excess_returns_panel.columns)
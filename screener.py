@@ -0,0 +1,130 @@
+#Screener over the CAPM metrics of the whole universe (one row per ticker, e.g. the S&P 500)
+#Every metric column has a sorted index (the values sorted once and the rows in that order), so:
+#- a range filter (e.g. Beta between 0.5 and 0.8) is two binary searches (np.searchsorted)
+#- a top-k query (e.g. the 10 highest Sharpe Ratios) reads the first k rows of the index
+#The metrics are calculated in one vectorized pass and the index is only rebuilt when the data version changes
+#The index is built by the warm-up of the worker (see warmup.py), queries always read the latest index built,
+#and a new index replaces the old one in one assignment once it is complete (queries never wait for a rebuild)
+import threading
+
+import numpy as np
+
+#Metrics that can be screened: short name (API parameters) -> column of the metrics table
+SCREEN_COLUMNS = {
+    'beta': 'Beta',
+    'expected_returns': 'Monthly Expected Returns (%)',
+    'alpha': 'Alpha (%)',
+    'r2': 'R2',
+    'treynor': 'Treynor Ratio (%)',
+    'sharpe': 'Sharpe Ratio',
+    'annual_alpha': 'Annual Alpha (%)',
+    'downside_beta': 'Downside Beta',
+    'sortino': 'Sortino Ratio',
+    'max_drawdown': 'Max Drawdown (%)',
+    'calmar': 'Calmar Ratio',
+}
+
+
+class MetricsIndex:
+    def __init__(self, metrics_df, columns=None):
+        self.metrics_df = metrics_df
+        self.n_rows = len(metrics_df)
+
+        self.sorted_values = {}
+        self.sorted_rows = {}
+        for column in columns or SCREEN_COLUMNS.values():
+            values = metrics_df[column].to_numpy(dtype=float)
+            rows = np.argsort(values, kind='stable')
+            #Missing values (sorted last) never match a filter
+            rows = rows[~np.isnan(values[rows])]
+            self.sorted_rows[column] = rows
+            self.sorted_values[column] = values[rows]
+
+    #Rows with low <= value <= high (None means no limit)
+    def range_rows(self, column, low=None, high=None):
+        values = self.sorted_values[column]
+        start = 0 if low is None else np.searchsorted(values, low, side='left')
+        end = len(values) if high is None else np.searchsorted(values, high, side='right')
+        return self.sorted_rows[column][start:end]
+
+    #filters: {column: (low, high)}, every filter has to match
+    #sort_by: column used to rank the results (highest first unless ascending=True)
+    #limit: maximum number of rows returned (top-k)
+    def query(self, filters=None, sort_by=None, ascending=False, limit=None):
+        mask = np.ones(self.n_rows, dtype=bool)
+        for column, (low, high) in (filters or {}).items():
+            column_mask = np.zeros(self.n_rows, dtype=bool)
+            column_mask[self.range_rows(column, low, high)] = True
+            mask &= column_mask
+
+        if sort_by is None:
+            rows = np.flatnonzero(mask)
+        else:
+            order = self.sorted_rows[sort_by] if ascending else self.sorted_rows[sort_by][::-1]
+            rows = order[mask[order]]
+
+        if limit is not None:
+            rows = rows[:limit]
+        return self.metrics_df.iloc[rows]
+
+
+#Index of the screener with the data version it was built from and the tickers that failed
+class BuiltIndex:
+    def __init__(self, index, data_version, errors):
+        self.index = index
+        self.data_version = data_version
+        self.errors = errors
+
+
+#Screener shared by the webapp and the API
+#get_tickers returns the tickers of the universe (called when the index is built)
+class UniverseScreener:
+    def __init__(self, capm_regression, get_tickers, workers=8):
+        self.capm_regression = capm_regression
+        self.get_tickers = get_tickers
+        self.workers = workers
+
+        #Latest index built (replaced as a whole, so a query never sees half of a rebuild)
+        self.built = None
+        #Only one build at a time
+        self.build_lock = threading.Lock()
+        self.rebuild_thread = None
+
+    @property
+    def errors(self):
+        built = self.built
+        return built.errors if built is not None else {}
+
+    #Building the index of the current data (the warm-up calls it before the worker is ready)
+    #A build already done for the same data version is not repeated
+    def build(self):
+        with self.build_lock:
+            data_version, _ = self.capm_regression.get_data_version()
+            built = self.built
+            if built is not None and built.data_version == data_version:
+                return built.index
+            metrics_df, errors = self.capm_regression.calculate_universe_metrics(self.get_tickers(), workers=self.workers)
+            self.built = BuiltIndex(MetricsIndex(metrics_df), data_version, errors)
+            return self.built.index
+
+    #Rebuilding in a background thread (one at a time), queries keep reading the current index meanwhile
+    def start_rebuild(self):
+        with self.build_lock:
+            if self.rebuild_thread is not None and self.rebuild_thread.is_alive():
+                return
+            self.rebuild_thread = threading.Thread(target=self.build, name='capm-screener-build', daemon=True)
+            self.rebuild_thread.start()
+
+    #Latest index built. Only the first query of a worker without warm-up waits for the build,
+    #an index of older data is still used while the new one is built
+    def get_index(self):
+        built = self.built
+        if built is None:
+            return self.build()
+        data_version, _ = self.capm_regression.get_data_version()
+        if built.data_version != data_version:
+            self.start_rebuild()
+        return built.index
+
+    def screen(self, filters=None, sort_by=None, ascending=False, limit=None):
+        return self.get_index().query(filters, sort_by, ascending, limit)
@@ -0,0 +1,178 @@
+#Sector and industry views of the universe, from the GICS metadata of the ticker store (data/sp500_tickers.json)
+#- Sector returns: equal- or cap-weighted mean of the excess returns of the tickers of each sector, every month
+#- Sector Beta, Alpha and R2: CAPM regression of the sector returns on the market (same formulas as the tickers)
+#- Dispersion of the Betas of the tickers inside each sector (mean, standard deviation, min, max)
+#The group of every ticker is encoded once (GroupIndex), then a sector aggregate is a matrix product with the
+#membership matrix (tickers x sectors) and a dispersion is a bincount, so 500 tickers are one NumPy pass
+import threading
+
+import numpy as np
+import pandas as pd
+
+#Levels of the GICS classification kept in the ticker store: level -> field of the store
+SECTOR_LEVELS = {'sector': 'sector', 'industry': 'industry'}
+
+#Weighting of the tickers inside a sector
+SECTOR_WEIGHTINGS = ['equal', 'cap']
+
+#Group of the tickers without metadata
+UNKNOWN_GROUP = 'Unknown'
+
+#Columns of the sector table (the first column is the name of the group)
+SECTOR_METRIC_COLUMNS = ['Tickers', 'Beta', 'Alpha (%)', 'R2', 'Sharpe Ratio', 'Annual Alpha (%)',
+                         'Annual Excess Returns (%)', 'Mean Beta', 'Beta Std', 'Beta Min', 'Beta Max']
+
+
+#Metadata of each ticker from the options of the ticker store ({'value', 'label', 'sector', 'industry', 'market_cap'})
+#Returns a dataframe indexed by ticker with the columns sector, industry and market_cap (missing values are NaN)
+def ticker_metadata(ticker_options):
+    rows = [option if isinstance(option, dict) else {'value': option} for option in ticker_options]
+    metadata_df = pd.DataFrame(rows, columns=['value', *SECTOR_LEVELS.values(), 'market_cap'])
+    metadata_df = metadata_df.drop_duplicates('value').set_index('value').rename_axis('Ticker')
+    metadata_df['market_cap'] = pd.to_numeric(metadata_df['market_cap'], errors='coerce')
+    return metadata_df
+
+
+#Group of every ticker encoded once: integer code per ticker and one-hot membership matrix (tickers x groups)
+class GroupIndex:
+    def __init__(self, labels):
+        labels = labels.fillna(UNKNOWN_GROUP)
+        codes, names = pd.factorize(labels, sort=True)
+        self.tickers = labels.index
+        self.codes = codes
+        self.names = pd.Index(names)
+        self.counts = np.bincount(codes, minlength=len(names))
+        self.membership = np.zeros((len(codes), len(names)))
+        self.membership[np.arange(len(codes)), codes] = 1.0
+
+    def __repr__(self):
+        return f"GroupIndex({len(self.tickers)} tickers, {len(self.names)} groups)"
+
+    #Weighted mean of the tickers of each group, every row (date) at once
+    #values: dates x tickers (in the order of self.tickers, NaN = missing), weights: one per ticker
+    #Missing values are left out of the mean (the weights of the other tickers of the group are rescaled)
+    #Returns dates x groups (NaN when no ticker of the group has a value)
+    def weighted_mean(self, values, weights):
+        valid = ~np.isnan(values)
+        weighted_sum = (np.where(valid, values, 0.0) * weights) @ self.membership
+        total_weight = (valid * weights) @ self.membership
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(total_weight > 0, weighted_sum / total_weight, np.nan)
+
+    #Count, mean, standard deviation (n-1), min and max of one value per ticker, by group (NaN values are left out)
+    def describe(self, values):
+        valid = ~np.isnan(values)
+        codes = self.codes[valid]
+        values = values[valid]
+        n_groups = len(self.names)
+
+        count = np.bincount(codes, minlength=n_groups)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.bincount(codes, values, minlength=n_groups) / count
+            squared_deviations = np.bincount(codes, (values - mean[codes]) ** 2, minlength=n_groups)
+            std = np.sqrt(squared_deviations / (count - 1))
+        minimum = np.full(n_groups, np.inf)
+        maximum = np.full(n_groups, -np.inf)
+        np.minimum.at(minimum, codes, values)
+        np.maximum.at(maximum, codes, values)
+
+        return pd.DataFrame({
+            'count': count,
+            'mean': mean,
+            'std': np.where(count > 1, std, np.nan),
+            'min': np.where(count > 0, minimum, np.nan),
+            'max': np.where(count > 0, maximum, np.nan),
+        }, index=self.names)
+
+
+#Sector returns and metrics of the universe
+#excess_returns_panel: dates x tickers, metrics_df: metrics of the tickers (for the dispersion of the Betas)
+#group_index: group of each ticker, weights: market cap of each ticker for the cap weighting (None: equal weights)
+#Returns (sector metrics dataframe with the SECTOR_METRIC_COLUMNS, sector excess returns dataframe dates x groups)
+def sector_metrics_panel(excess_returns_panel, market_excess_returns, metrics_df, group_index, sp500_expected_returns,
+                         rf, weights=None):
+    from panel_analyzer import capm_metrics_panel
+
+    #Same ticker order as the group index (tickers that could not be fetched are all NaN)
+    values = excess_returns_panel.reindex(columns=group_index.tickers).to_numpy(dtype=float)
+    if weights is None:
+        weights = np.ones(len(group_index.tickers))
+    else:
+        #Tickers without a market cap are left out of the cap-weighted returns
+        weights = np.nan_to_num(weights.reindex(group_index.tickers).to_numpy(dtype=float), nan=0.0)
+
+    sector_returns_df = pd.DataFrame(group_index.weighted_mean(values, weights), index=excess_returns_panel.index,
+                                     columns=group_index.names)
+    sector_returns_df = sector_returns_df.dropna(axis=1, how='all')
+
+    #Regression of each sector on the market (columns are the groups instead of tickers)
+    regression_df = capm_metrics_panel(sector_returns_df, market_excess_returns, sp500_expected_returns, rf)
+    betas = group_index.describe(metrics_df['Beta'].reindex(group_index.tickers).to_numpy(dtype=float))
+
+    #Tickers of each group that have metrics
+    sector_df = pd.DataFrame({'Tickers': betas['count']}, index=group_index.names)
+    sector_df = sector_df.join(regression_df[['Beta', 'Alpha (%)', 'R2', 'Sharpe Ratio', 'Annual Alpha (%)']])
+    sector_df['Annual Excess Returns (%)'] = sector_returns_df.mean() * 12
+    sector_df['Mean Beta'] = betas['mean']
+    sector_df['Beta Std'] = betas['std']
+    sector_df['Beta Min'] = betas['min']
+    sector_df['Beta Max'] = betas['max']
+
+    return sector_df[SECTOR_METRIC_COLUMNS].round(3), sector_returns_df
+
+
+#Sector views shared by the webapp and the API
+#The tickers and their Betas come from the screener (metrics of the whole universe), get_metadata returns the
+#metadata of the ticker store (see ticker_metadata). The group indexes are built once per level, and the
+#results are calculated again only when the data version changes
+class SectorAnalyzer:
+    def __init__(self, screener, get_metadata):
+        self.screener = screener
+        self.get_metadata = get_metadata
+
+        self.group_indexes = {}
+        #(level, weighting) -> (data version, sector metrics, sector returns)
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def get_group_index(self, level):
+        if level not in SECTOR_LEVELS:
+            raise ValueError(f"Unknown sector level '{level}', use one of {list(SECTOR_LEVELS)}")
+        if level not in self.group_indexes:
+            metadata_df = self.get_metadata()
+            #One "Unknown" group would not compare anything
+            if metadata_df[SECTOR_LEVELS[level]].isna().all():
+                raise ValueError(f"No ticker of the ticker store has a {level}. "
+                                 "Fill them in with python -m capm metadata (from the data provider)")
+            self.group_indexes[level] = GroupIndex(metadata_df[SECTOR_LEVELS[level]])
+        return self.group_indexes[level]
+
+    #Sector metrics and returns of one level (sector or industry) and weighting (equal or cap)
+    #Returns (sector metrics dataframe, sector excess returns dataframe)
+    def sector_view(self, level='sector', weighting='equal'):
+        if weighting not in SECTOR_WEIGHTINGS:
+            raise ValueError(f"Unknown weighting '{weighting}', use one of {SECTOR_WEIGHTINGS}")
+
+        capm_regression = self.screener.capm_regression
+        data_version, _ = capm_regression.get_data_version()
+        with self.lock:
+            cached = self.results.get((level, weighting))
+            if cached is not None and cached[0] == data_version:
+                return cached[1], cached[2]
+
+            group_index = self.get_group_index(level)
+            weights = None
+            if weighting == 'cap':
+                weights = self.get_metadata()['market_cap']
+                if weights.isna().all():
+                    raise ValueError("The ticker store has no market caps, save it again with market caps for the cap weighting")
+
+            metrics_df = self.screener.get_index().metrics_df
+            excess_returns_panel, excess_returns_sp500, _ = capm_regression.get_excess_returns_panel(list(metrics_df.index))
+            sp500_expected_returns, rf = capm_regression.get_market_expectations()
+            sector_df, sector_returns_df = sector_metrics_panel(excess_returns_panel, excess_returns_sp500, metrics_df,
+                                                                group_index, sp500_expected_returns, rf, weights)
+            sector_df = sector_df.rename_axis(level.capitalize())
+
+            self.results[(level, weighting)] = (data_version, sector_df, sector_returns_df)
+            return sector_df, sector_returns_df
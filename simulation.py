@@ -0,0 +1,312 @@
+#Monte Carlo simulation of the returns implied by the CAPM, with their distribution, VaR and CVaR over several horizons
+#Every path draws the market excess return of each month, from the history (bootstrap of the monthly excess returns
+#of the index) or from a normal distribution fitted to it, and every ticker follows the market through its Beta
+#plus its own risk (normal residual with the residual volatility of its regression):
+#  monthly total return = rf + Beta x market excess return + residual     (no Alpha: the return implied by the CAPM)
+#The returns are compounded month by month, and the index itself is simulated as a ticker with Beta 1 and no residual
+#The paths are split in chunks (arrays of paths x tickers) simulated by a process pool. A chunk only sends back running
+#sums, a histogram and its 5% worst and best returns, so only the 5% tails of the paths are kept (the memory still grows
+#with the number of paths, but 10 times less than keeping every path), and VaR and CVaR stay exact (the worst returns
+#of all the paths are among the worst returns of each chunk)
+#Each chunk has its own random stream (spawned from the seed), so the results do not depend on the number of workers
+#The webapp and the API share one pool of processes per server process, created on first use with a bounded number of
+#processes started with "spawn" (forking a threaded server can copy locks held by other threads), so concurrent
+#requests queue their chunks instead of starting processes of their own
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+#How the market excess returns of the paths are drawn
+SIMULATION_METHODS = ['bootstrap', 'normal']
+
+#Default paths and horizons (months) of a simulation
+DEFAULT_PATHS = 10000
+DEFAULT_HORIZONS = [1, 12]
+
+#Confidence levels of the VaR and CVaR
+VAR_LEVELS = [0.95, 0.99]
+
+#Share of the paths in the tails kept by each chunk (the 5th / 95th percentiles and the VaR need the 5% worst paths)
+TAIL_PROBABILITY = 0.05
+
+#Values (paths x tickers) of the arrays of one chunk: about 8 MB per array whatever the number of tickers
+CHUNK_CELLS = 1_000_000
+
+#Bins of the histogram of the returns of each ticker and horizon
+HISTOGRAM_BINS = 60
+
+#Maximum processes of the shared pool (CAPM_SIMULATION_WORKERS overrides the default: CPUs, at most this)
+MAX_POOL_WORKERS = 4
+
+#Shared pool of the process (see get_simulation_pool)
+shared_pool = None
+shared_pool_lock = threading.Lock()
+
+#Columns of the simulation table (one row per ticker and horizon, returns and losses in % over the horizon)
+#VaR / CVaR: loss not exceeded in 95% (99%) of the paths / mean loss of the 5% (1%) worst paths
+SIMULATION_COLUMNS = ['Ticker', 'Horizon (months)', 'Beta', 'Residual Vol (%)', 'Mean (%)', 'Std (%)', 'P5 (%)',
+                      'P95 (%)', 'Prob Loss (%)'] + [f'{name} {level * 100:g} (%)' for level in VAR_LEVELS
+                                                     for name in ['VaR', 'CVaR']]
+
+
+#Number of paths in a tail of probability p (at least one path)
+def tail_count(n_paths, probability):
+    return max(1, math.ceil(round(n_paths * probability, 9)))
+
+
+#Beta and residual volatility (% per month, n-2 degrees of freedom) of every ticker in one pass
+#(same closed-form regression as panel_analyzer.capm_metrics_panel)
+#Returns a dataframe indexed by ticker (tickers that cannot be regressed are left out)
+def simulation_parameters(excess_returns_panel, market_excess_returns):
+    from panel_analyzer import align_panel
+
+    y, x, mask = align_panel(excess_returns_panel, market_excess_returns)
+    x = np.where(mask, x, 0.0)
+    y = np.where(mask, y, 0.0)
+
+    n = mask.sum(axis=0)
+    sum_x = x.sum(axis=0)
+    sum_y = y.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = (x * y).sum(axis=0) - sum_x * sum_y / n
+        variance_x = (x * x).sum(axis=0) - sum_x ** 2 / n
+        variance_y = (y * y).sum(axis=0) - sum_y ** 2 / n
+        beta = covariance / variance_x
+        residual_variance = (variance_y - beta * covariance) / (n - 2)
+
+    parameters_df = pd.DataFrame({
+        'Beta': beta,
+        'Residual Vol (%)': np.sqrt(np.maximum(residual_variance, 0.0)),
+    }, index=excess_returns_panel.columns)
+    return parameters_df[(n >= 3) & (variance_x > 0)]
+
+
+#Range of the histogram of each ticker for a horizon: about +-4 standard deviations of the compounded return
+#(from the mean and volatility of the monthly returns, the few paths outside go to the first or last bin)
+#Returns the lower edge and the width of the bins (% of return, one per ticker)
+def histogram_ranges(betas, residual_vols, market_mean, market_std, rf, horizon):
+    monthly_mean = rf + betas * market_mean / 100
+    monthly_std = np.sqrt((betas * market_std) ** 2 + residual_vols ** 2) / 100
+    center = horizon * np.log1p(monthly_mean)
+    spread = 4 * np.sqrt(horizon) * np.maximum(monthly_std, 1e-6)
+    low = np.expm1(center - spread) * 100
+    high = np.expm1(center + spread) * 100
+    return low, (high - low) / HISTOGRAM_BINS
+
+
+#Number of paths in each bin of each ticker (returns: paths x tickers), in one bincount
+def histogram_counts(returns, low, width):
+    n_columns = returns.shape[1]
+    bins = np.clip(np.floor((returns - low) / width), 0, HISTOGRAM_BINS - 1).astype(np.int64)
+    bins += np.arange(n_columns) * HISTOGRAM_BINS
+    return np.bincount(bins.ravel(), minlength=n_columns * HISTOGRAM_BINS).reshape(n_columns, HISTOGRAM_BINS)
+
+
+def keep_lowest(values, size):
+    if len(values) <= size:
+        return values
+    return np.partition(values, size - 1, axis=0)[:size]
+
+
+def keep_highest(values, size):
+    if len(values) <= size:
+        return values
+    return np.partition(values, len(values) - size, axis=0)[len(values) - size:]
+
+
+#Processes of the shared pool: CAPM_SIMULATION_WORKERS, or the CPUs up to MAX_POOL_WORKERS (1: no pool)
+def pool_workers():
+    workers = os.environ.get('CAPM_SIMULATION_WORKERS')
+    if workers:
+        return max(1, int(workers))
+    return min(os.cpu_count() or 1, MAX_POOL_WORKERS)
+
+
+#Pool shared by the simulations of this process, created on first use (None when it would have one process)
+def get_simulation_pool():
+    global shared_pool
+    with shared_pool_lock:
+        if shared_pool is None and pool_workers() > 1:
+            shared_pool = ProcessPoolExecutor(max_workers=pool_workers(), mp_context=multiprocessing.get_context('spawn'))
+        return shared_pool
+
+
+#Dropping the shared pool (e.g. after a worker died), the next simulation creates a new one
+def reset_simulation_pool():
+    global shared_pool
+    with shared_pool_lock:
+        if shared_pool is not None:
+            shared_pool.shutdown(wait=False, cancel_futures=True)
+        shared_pool = None
+
+
+#Simulating one chunk of paths (runs in a worker process)
+#Returns {horizon: running sums, number of losses, worst and best returns, histogram} of the compounded returns (%)
+def simulate_chunk(task):
+    rng = np.random.default_rng(task['seed'])
+    n_paths = task['n_paths']
+    #Decimals instead of % (one multiplication less per month)
+    betas = task['betas'] / 100
+    residual_vols = task['residual_vols'] / 100
+    horizons = set(task['horizons'])
+
+    wealth = np.ones((n_paths, len(betas)))
+    results = {}
+    for month in range(1, max(horizons) + 1):
+        if task['method'] == 'bootstrap':
+            market = rng.choice(task['market_returns'], n_paths)
+        else:
+            market = rng.normal(task['market_mean'], task['market_std'], n_paths)
+
+        #Growth of 1 in the month: 1 + rf + Beta x market + residual (computed in place, one array per step)
+        growth = rng.standard_normal((n_paths, len(betas)))
+        growth *= residual_vols
+        growth += np.multiply.outer(market, betas)
+        growth += 1 + task['rf']
+        #A stock cannot lose more than everything in a month
+        np.maximum(growth, 0.0, out=growth)
+        wealth *= growth
+
+        if month in horizons:
+            returns = (wealth - 1) * 100
+            results[month] = {
+                'sum': returns.sum(axis=0),
+                'sum_squares': (returns ** 2).sum(axis=0),
+                'losses': (returns < 0).sum(axis=0),
+                'lowest': keep_lowest(returns, task['tail_size']),
+                'highest': keep_highest(returns, task['tail_size']),
+                'histogram': histogram_counts(returns, *task['ranges'][month]),
+            }
+    return results
+
+
+#Adding the results of a chunk to the totals of all the chunks (the tails keep the worst / best paths of both)
+def merge_chunk(totals, chunk, tail_size):
+    for horizon, result in chunk.items():
+        if horizon not in totals:
+            totals[horizon] = result
+            continue
+        total = totals[horizon]
+        for name in ['sum', 'sum_squares', 'losses', 'histogram']:
+            total[name] = total[name] + result[name]
+        total['lowest'] = keep_lowest(np.concatenate([total['lowest'], result['lowest']]), tail_size)
+        total['highest'] = keep_highest(np.concatenate([total['highest'], result['highest']]), tail_size)
+    return totals
+
+
+#Statistics of one horizon from the totals of all the paths (one value per ticker)
+def horizon_statistics(total, n_paths):
+    lowest = np.sort(total['lowest'], axis=0)
+    highest = np.sort(total['highest'], axis=0)
+    mean = total['sum'] / n_paths
+    variance = np.maximum(total['sum_squares'] - total['sum'] ** 2 / n_paths, 0.0) / max(n_paths - 1, 1)
+    tail = tail_count(n_paths, TAIL_PROBABILITY)
+
+    statistics = {
+        'Mean (%)': mean,
+        'Std (%)': np.sqrt(variance),
+        'P5 (%)': lowest[tail - 1],
+        'P95 (%)': highest[-tail],
+        'Prob Loss (%)': total['losses'] / n_paths * 100,
+    }
+    for level in VAR_LEVELS:
+        worst = tail_count(n_paths, 1 - level)
+        statistics[f'VaR {level * 100:g} (%)'] = -lowest[worst - 1]
+        statistics[f'CVaR {level * 100:g} (%)'] = -lowest[:worst].mean(axis=0)
+    return statistics
+
+
+#Simulated distribution of the returns of every ticker of the panel (and of the index)
+#excess_returns_panel / market_excess_returns: monthly excess returns (%) used for the Betas and residual volatilities
+#market_history: monthly excess returns (%) of the index drawn by the paths (default: market_excess_returns)
+#rf: monthly risk-free rate (decimal, constant), method: bootstrap or normal
+#workers: None uses the shared pool of the process (see get_simulation_pool), 1 simulates the chunks in this
+#process, more starts a pool of that many processes for this simulation only (command line)
+#A simulation of one chunk (e.g. 10,000 paths of a few tickers) always runs in this process
+#Returns (summary dataframe with the SIMULATION_COLUMNS, one row per ticker and horizon,
+#         histograms {horizon: {ticker: share of the paths (%) per bin, indexed by the return at the center of the bin}})
+def simulate_capm_returns(excess_returns_panel, market_excess_returns, rf, n_paths=None, horizons=None,
+                          method='bootstrap', seed=0, workers=None, market_history=None, market_name='SP500'):
+    if method not in SIMULATION_METHODS:
+        raise ValueError(f"Unknown simulation method '{method}', use one of {SIMULATION_METHODS}")
+    n_paths = int(n_paths or DEFAULT_PATHS)
+    horizons = sorted(set(int(horizon) for horizon in (horizons or DEFAULT_HORIZONS)))
+    if n_paths < 1 or horizons[0] < 1:
+        raise ValueError("The number of paths and the horizons must be positive")
+
+    if market_history is None:
+        market_history = market_excess_returns
+    market_returns = market_history.dropna().to_numpy(dtype=float)
+    if len(market_returns) < 3:
+        raise ValueError("Not enough months of the market to simulate")
+
+    #The index is the first column: Beta 1, no residual
+    parameters_df = simulation_parameters(excess_returns_panel, market_excess_returns)
+    parameters_df = pd.concat([pd.DataFrame({'Beta': [1.0], 'Residual Vol (%)': [0.0]}, index=[market_name]),
+                               parameters_df])
+    betas = parameters_df['Beta'].to_numpy()
+    residual_vols = parameters_df['Residual Vol (%)'].to_numpy()
+    market_mean = market_returns.mean()
+    market_std = market_returns.std(ddof=1)
+
+    chunk_size = max(1000, CHUNK_CELLS // len(betas))
+    chunk_sizes = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+    tail_size = tail_count(n_paths, TAIL_PROBABILITY)
+    ranges = {horizon: histogram_ranges(betas, residual_vols, market_mean, market_std, rf, horizon) for horizon in horizons}
+    tasks = [{
+        'seed': chunk_seed,
+        'n_paths': size,
+        'method': method,
+        'market_returns': market_returns,
+        'market_mean': market_mean,
+        'market_std': market_std,
+        'betas': betas,
+        'residual_vols': residual_vols,
+        'rf': rf,
+        'horizons': horizons,
+        'tail_size': tail_size,
+        'ranges': ranges,
+    } for chunk_seed, size in zip(np.random.SeedSequence(seed).spawn(len(chunk_sizes)), chunk_sizes)]
+
+    totals = {}
+    if len(tasks) > 1 and workers is None and get_simulation_pool() is not None:
+        try:
+            for chunk in get_simulation_pool().map(simulate_chunk, tasks):
+                merge_chunk(totals, chunk, tail_size)
+        except BrokenProcessPool:
+            #A worker died: the chunks are simulated again in this process, the next simulation gets a new pool
+            reset_simulation_pool()
+            totals = {}
+            for task in tasks:
+                merge_chunk(totals, simulate_chunk(task), tail_size)
+    elif len(tasks) > 1 and workers is not None and workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=multiprocessing.get_context('spawn')) as executor:
+            for chunk in executor.map(simulate_chunk, tasks):
+                merge_chunk(totals, chunk, tail_size)
+    else:
+        for task in tasks:
+            merge_chunk(totals, simulate_chunk(task), tail_size)
+
+    frames = []
+    histograms = {}
+    for horizon in horizons:
+        horizon_df = pd.DataFrame(horizon_statistics(totals[horizon], n_paths), index=parameters_df.index)
+        horizon_df.insert(0, 'Ticker', parameters_df.index)
+        horizon_df.insert(1, 'Horizon (months)', horizon)
+        frames.append(horizon_df.join(parameters_df))
+
+        low, width = ranges[horizon]
+        histograms[horizon] = {
+            ticker: pd.Series(totals[horizon]['histogram'][i] / n_paths * 100,
+                              index=low[i] + width[i] * (np.arange(HISTOGRAM_BINS) + 0.5))
+            for i, ticker in enumerate(parameters_df.index)
+        }
+
+    summary_df = pd.concat(frames)[SIMULATION_COLUMNS].round(3)
+    return summary_df, histograms
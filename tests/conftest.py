@@ -0,0 +1,9 @@
+#Tests run from the repository root modules with offline data (synthetic provider, no disk cache, no warm-up)
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('CAPM_DATA_PROVIDER', 'synthetic')
+os.environ.setdefault('CAPM_WARMUP', '0')
+os.environ.setdefault('CAPM_CACHE_DIR', '')
@@ -0,0 +1,24 @@
+import app
+
+
+#A response with errors cannot be revalidated, so the next request tries the failed tickers again
+def test_responses_with_errors_are_not_cached(monkeypatch):
+    client = app.app.server.test_client()
+    calculate_capm_metrics = app.capm_regression.calculate_capm_metrics
+
+    def fetch_failed(ticker, *args, **kwargs):
+        if ticker == 'MSFT':
+            raise ValueError("MSFT is not available")
+        return calculate_capm_metrics(ticker, *args, **kwargs)
+
+    monkeypatch.setattr(app.capm_regression, 'calculate_capm_metrics', fetch_failed)
+    response = client.get('/api/capm?tickers=AAPL,MSFT')
+    assert response.get_json()['errors'] == {'MSFT': 'MSFT is not available'}
+    assert 'ETag' not in response.headers and 'Last-Modified' not in response.headers
+    assert response.cache_control.no_store
+
+    monkeypatch.undo()
+    response = client.get('/api/capm?tickers=AAPL,MSFT')
+    assert response.get_json()['errors'] == {}
+    etag = response.headers['ETag']
+    assert client.get('/api/capm?tickers=AAPL,MSFT', headers={'If-None-Match': etag}).status_code == 304
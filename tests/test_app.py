@@ -0,0 +1,42 @@
+import pytest
+
+import app
+
+
+def heatmap(tickers, window_size):
+    return app.generate_rolling_heatmap(1, [{'value': ticker} for ticker in tickers], 'Beta', [], window_size, None)
+
+
+#A heatmap without any ticker to show gives a message, not a callback error
+def test_heatmap_without_data_shows_a_message(monkeypatch):
+    assert 'No ticker has 1000 months of data' in heatmap(['AAPL', 'MSFT'], 1000).children
+
+    def fetch_failed(ticker, refresh=False, outlier_method=None):
+        raise ValueError(f"{ticker} is not available")
+
+    monkeypatch.setattr(app.capm_regression, 'ticker_excess_returns_df', fetch_failed)
+    message = heatmap(['AAPL', 'MSFT'], 12).children
+    assert 'Could not fetch 2 tickers: AAPL, MSFT' in message
+
+
+#Tickers are sorted by their last value (rows of the heatmap, top to bottom)
+def test_heatmap_sorted_by_latest_value():
+    figure = heatmap(['AAPL', 'MSFT', 'NVDA'], 12).children[1].figure
+    rows = figure.data[0].z
+    latest_values = [next(value for value in reversed(row) if value == value) for row in rows]
+    assert latest_values == sorted(latest_values)
+
+
+#Without any sector in the ticker store, the sector view is replaced by a message (not one "Unknown" group)
+def test_sector_view_needs_sectors(monkeypatch):
+    from sectors import ticker_metadata
+
+    monkeypatch.setattr(app, 'get_ticker_metadata', lambda: ticker_metadata([{'label': 'AAPL', 'value': 'AAPL'}]))
+    monkeypatch.setattr(app.sector_analyzer, 'get_metadata', app.get_ticker_metadata)
+    monkeypatch.setattr(app.sector_analyzer, 'group_indexes', {})
+    assert 'python -m capm metadata' in app.sector_view_unavailable()
+    with pytest.raises(ValueError, match='No ticker of the ticker store has a sector'):
+        app.sector_analyzer.get_group_index('sector')
+
+    monkeypatch.setattr(app, 'get_ticker_metadata', lambda: ticker_metadata([{'label': 'AAPL', 'value': 'AAPL', 'sector': 'Energy'}]))
+    assert app.sector_view_unavailable() is None
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from capm_estimators import CAPMState
+from data_providers import SyntheticProvider
+from ticker_analyzer import TickerReturns
+
+
+def monthly_series(values, start='2010-01-01'):
+    return pd.Series(values, index=pd.date_range(start, periods=len(values), freq='MS').date)
+
+
+#Adding the months in two updates gives the same state as adding them at once
+def test_update_only_adds_new_months():
+    rng = np.random.default_rng(0)
+    market = monthly_series(rng.normal(0.5, 4, 120))
+    ticker = monthly_series(1.2 * market.to_numpy() + rng.normal(0, 3, 120))
+
+    full = CAPMState('TEST').update_from_series(ticker, market)
+    partial = CAPMState('TEST').update_from_series(ticker.iloc[:80], market)
+    partial.update_from_series(ticker, market)
+
+    assert partial.n == full.n and partial.n_y == full.n_y and partial.outliers == full.outliers
+    assert partial.last_date == full.last_date == str(ticker.index[-1])
+    assert partial.metrics()['Beta'] == pytest.approx(full.metrics()['Beta'])
+
+
+#An extreme month is left out when it arrives, the months before it are kept
+def test_online_outlier_rule():
+    rng = np.random.default_rng(0)
+    market = monthly_series(rng.normal(0.5, 4, 120))
+    ticker = monthly_series(market.to_numpy() + rng.normal(0, 2, 120))
+    state = CAPMState('TEST').update_from_series(ticker, market)
+    #About 1% of normal months, like the IQR rule
+    assert state.outliers <= 3
+    outliers, n_y = state.outliers, state.n_y
+
+    crash = monthly_series([0.5, -80.0], start='2020-01-01')
+    state.update_from_series(crash, monthly_series([0.0, 0.0], start='2020-01-01'))
+    assert state.outliers == outliers + 1
+    assert state.n_y == n_y + 1
+    assert state.last_date == str(crash.index[-1])
+
+
+#Refreshing the market data adds the new months to the states already calculated
+def test_refresh_updates_the_states():
+    provider = SyntheticProvider(end='2024-01-01')
+    capm_regression = TickerReturns(provider)
+    state = capm_regression.update_capm_state('AAPL')
+    assert state.last_date == '2024-01-01'
+    months = state.n_y + state.outliers
+
+    provider.end = pd.Timestamp('2024-06-01')
+    capm_regression.refresh_market_data()
+    assert capm_regression.capm_states['AAPL'] is state
+    assert state.last_date == '2024-06-01'
+    assert state.n_y + state.outliers == months + 5
@@ -0,0 +1,81 @@
+import json
+
+from data_preprocessing import DataPreprocessor
+from data_providers import SyntheticProvider
+
+
+#Synthetic data that records the symbols downloaded (and fails for the symbols in fail)
+class CountingProvider(SyntheticProvider):
+    def __init__(self, fail=()):
+        super().__init__()
+        self.fail = set(fail)
+        self.downloaded = []
+
+    def history(self, symbol, period, interval):
+        if symbol in self.fail:
+            raise ValueError(f"{symbol} is not available")
+        self.downloaded.append(symbol)
+        return super().history(symbol, period, interval)
+
+
+def ingest(tmp_path, provider, **kwargs):
+    output_path = tmp_path / 'panel.parquet'
+    return DataPreprocessor(provider).bulk_ingest(['AAPL', 'MSFT'], output_path=output_path, workers=2, **kwargs)
+
+
+def read_manifest(tmp_path):
+    with open(tmp_path / 'panel_manifest.json') as f:
+        return json.load(f)
+
+
+#An interrupted run only downloads the tickers it has not completed yet
+def test_resume_skips_tickers_of_the_same_run(tmp_path):
+    output_path, failed = ingest(tmp_path, CountingProvider(fail=['MSFT']))
+    assert output_path is None and list(failed) == ['MSFT']
+
+    provider = CountingProvider()
+    output_path, failed = ingest(tmp_path, provider)
+    assert output_path is not None and not failed
+    assert provider.downloaded == ['MSFT']
+
+    manifest = read_manifest(tmp_path)
+    assert {part['run'] for part in manifest['completed'].values()} == {manifest['run']['started']}
+    assert all(part['last_date'] for part in manifest['completed'].values())
+
+
+#A run from an earlier month (data older than the period asked for) or a refresh downloads every ticker again
+def test_old_runs_and_refresh_download_again(tmp_path):
+    ingest(tmp_path, CountingProvider())
+
+    provider = CountingProvider()
+    ingest(tmp_path, provider)
+    assert provider.downloaded == []
+
+    provider = CountingProvider()
+    ingest(tmp_path, provider, refresh=True)
+    assert sorted(provider.downloaded) == ['AAPL', 'MSFT', '^GSPC', '^TYX']
+
+    manifest = read_manifest(tmp_path)
+    manifest['run']['data_end'] = '2000-01-01'
+    with open(tmp_path / 'panel_manifest.json', 'w') as f:
+        json.dump(manifest, f)
+    provider = CountingProvider()
+    ingest(tmp_path, provider)
+    assert sorted(provider.downloaded) == ['AAPL', 'MSFT', '^GSPC', '^TYX']
+
+
+#Sectors missing from the ticker store are filled from the provider, the ones already saved are kept
+def test_fill_ticker_metadata(tmp_path):
+    tickers_path = tmp_path / 'tickers.json'
+    with open(tickers_path, 'w') as f:
+        json.dump([{'label': 'AAPL', 'value': 'AAPL', 'sector': 'Information Technology', 'industry': 'Technology Hardware'},
+                   {'label': 'MSFT', 'value': 'MSFT'}, 'NVDA'], f)
+
+    without_sector = DataPreprocessor(CountingProvider()).fill_ticker_metadata(tickers_path, market_caps=True)
+    assert without_sector == 0
+
+    with open(tickers_path) as f:
+        ticker_options = json.load(f)
+    assert ticker_options[0]['sector'] == 'Information Technology'
+    assert all(option['sector'] and option['industry'] and option['market_cap'] for option in ticker_options)
+    assert [option['value'] for option in ticker_options] == ['AAPL', 'MSFT', 'NVDA']
@@ -0,0 +1,31 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from exporter import stream_parquet
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+#A later chunk with other inferred types (all-NaN object column, integers, text) is cast to the first schema
+def test_parquet_chunks_with_different_types():
+    columns = ['Ticker', 'Beta', 'R2']
+    frames = [
+        pd.DataFrame({'Ticker': ['A'], 'Beta': [1.0], 'R2': [0.5]}),
+        pd.DataFrame({'Ticker': ['B'], 'Beta': pd.Series([None], dtype=object), 'R2': ['n/a']}),
+        pd.DataFrame({'Ticker': ['C'], 'Beta': [np.int64(2)]}),
+    ]
+    table = pq.read_table(io.BytesIO(b''.join(stream_parquet(iter(frames), columns))))
+
+    assert [str(field.type) for field in table.schema] == ['string', 'double', 'double']
+    exported_df = table.to_pandas()
+    assert list(exported_df['Ticker']) == ['A', 'B', 'C']
+    assert exported_df['Beta'].tolist()[0] == 1.0 and np.isnan(exported_df['Beta'][1]) and exported_df['Beta'][2] == 2.0
+    assert exported_df['R2'].isna().tolist() == [False, True, True]
+
+
+def test_parquet_without_rows():
+    table = pq.read_table(io.BytesIO(b''.join(stream_parquet(iter([]), ['Ticker', 'Beta']))))
+    assert table.num_rows == 0 and table.column_names == ['Ticker', 'Beta']
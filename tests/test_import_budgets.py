@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+import capm
+
+
+#No entry point loads the heavy libraries it imports lazily (independent of how fast the machine is)
+@pytest.mark.parametrize('module', list(capm.FORBIDDEN_IMPORTS))
+def test_entry_points_do_not_load_heavy_libraries(module):
+    elapsed, heaviest, loaded = capm.profile_import(module, capm.FORBIDDEN_IMPORTS[module])
+    assert loaded == []
+
+
+#An eager import of a heavy library is reported
+def test_forbidden_imports_are_reported():
+    elapsed, heaviest, loaded = capm.profile_import('statsmodels.api', forbidden=['statsmodels', 'dash'])
+    assert loaded == ['statsmodels']
+
+
+#Import times against the budgets, only with CAPM_CHECK_IMPORT_TIME=1 (wall-clock times depend on the machine,
+#the same check is python -m capm profile-imports)
+@pytest.mark.skipif(os.environ.get('CAPM_CHECK_IMPORT_TIME') != '1', reason='set CAPM_CHECK_IMPORT_TIME=1 to check the import times')
+def test_entry_points_import_within_budget(capsys):
+    exit_code = capm.main(['profile-imports', '--repeat', '2', '--top', '0'])
+    output = capsys.readouterr().out
+    assert exit_code == 0, output
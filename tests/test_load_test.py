@@ -0,0 +1,65 @@
+import load_test
+
+
+#Callback requests of one browser tab: the values returned by the callbacks are sent back as states
+class Session:
+    def __init__(self, client, dependencies, start_date=None):
+        self.client = client
+        self.dependencies = dependencies
+        self.start_date = start_date
+        self.page_values = {}
+
+    def run(self, name, tickers):
+        component_id, get_values = {step[0]: step[1:3] for step in load_test.SCENARIO_STEPS}[name]
+        dependency = load_test.find_callback(self.dependencies, component_id)
+        payload = load_test.build_payload(dependency, {**self.page_values, **get_values(tickers, 12, self.start_date)})
+        response = self.client.post('/_dash-update-component', json=payload).get_json()['response']
+        self.page_values.update(load_test.response_values(response))
+        return response
+
+
+#A session analyzing after another one does not change what the first one sees (tickers and period)
+def test_sessions_keep_their_own_analysis():
+    import app
+
+    client = app.app.server.test_client()
+    dependencies = client.get('/_dash-dependencies').get_json()
+    first = Session(client, dependencies, start_date='2020-01-01')
+    second = Session(client, dependencies)
+
+    first.run('analysis', ['AAPL', 'MSFT'])
+    second.run('analysis', ['NVDA'])
+    assert first.page_values['analysis-store.data']['tickers'] == ['AAPL', 'MSFT']
+
+    scatter = first.run('scatter', ['AAPL', 'MSFT'])
+    rolling = first.run('rolling', ['AAPL', 'MSFT'])
+    for response in (scatter, rolling):
+        assert load_test.foreign_tickers(response, ['AAPL', 'MSFT'], ['AAPL', 'MSFT', 'NVDA']) == []
+        assert not load_test.outside_period(response, '2020-01-01')
+    assert load_test.count_graphs(scatter) == 2
+
+    #Tickers analyzed by another session are not shown
+    assert load_test.count_graphs(first.run('scatter', ['NVDA'])) == 0
+
+
+#Users analyzing different tickers and periods at the same time only receive their own results
+def test_concurrent_sessions_are_isolated():
+    summary = load_test.run_load_test(users=3, iterations=2, tickers_per_user=2)
+    for name, _, _, _ in load_test.SCENARIO_STEPS:
+        assert summary[name]['errors'] == 0, summary[name]['error_examples']
+
+
+#Running the analysis again only calculates the tickers added since the previous analysis of the same session
+def test_analysis_diffs_against_the_session(capsys):
+    import app
+
+    client = app.app.server.test_client()
+    dependencies = client.get('/_dash-dependencies').get_json()
+    first = Session(client, dependencies, start_date='2019-01-01')
+    second = Session(client, dependencies, start_date='2019-01-01')
+
+    first.run('analysis', ['AAPL', 'MSFT'])
+    second.run('analysis', ['TSLA'])
+    capsys.readouterr()
+    first.run('analysis', ['MSFT', 'AMZN'])
+    assert 'Computed 1 new tickers, dropped 1 from the previous analysis of the session' in capsys.readouterr().out
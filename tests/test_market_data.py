@@ -0,0 +1,130 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from market_data import MarketDataClient, RateLimitedSession
+
+
+#Local stub of the market data API: the first "rate_limited" requests get a 429 with Retry-After,
+#the next ones a small JSON price history (sent after "delay" seconds)
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            rate_limited = len(server.requests) <= server.rate_limited
+        if rate_limited:
+            self.send_response(429)
+            self.send_header('Retry-After', str(server.retry_after))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        time.sleep(server.delay)
+        body = b'{"Close": [100.0, 101.0]}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.rate_limited = 0
+    server.retry_after = 1
+    server.delay = 0.0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+#Session that records the waiting time of each retry
+class RecordingSession(RateLimitedSession):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.backoffs = []
+
+    def backoff_time(self, attempt, response=None):
+        backoff = super().backoff_time(attempt, response)
+        self.backoffs.append(backoff)
+        return backoff
+
+
+#Client fetching the history from the stub server instead of Yahoo Finance
+class StubClient(MarketDataClient):
+    def __init__(self, url, session):
+        super().__init__(session)
+        self.url = url
+
+    def fetch_history(self, symbol, period, interval):
+        response = self.session.get(f'{self.url}/history/{symbol}', params={'period': period, 'interval': interval})
+        response.raise_for_status()
+        return pd.DataFrame(response.json())
+
+
+#A 429 is retried after the time asked by the Retry-After header
+def test_rate_limited_requests_wait_for_retry_after(stub_server):
+    stub_server.rate_limited = 2
+    session = RecordingSession(rate=100, burst=10, max_retries=5)
+
+    start = time.monotonic()
+    response = session.get(f'{stub_server.url}/history/AAPL')
+    elapsed = time.monotonic() - start
+
+    assert response.status_code == 200
+    assert len(stub_server.requests) == 3
+    assert session.backoffs == [1.0, 1.0]
+    assert elapsed >= 2.0
+
+
+#After max_retries the last 429 is returned to the caller
+def test_retries_are_limited(stub_server):
+    stub_server.rate_limited = 10
+    stub_server.retry_after = 0
+    session = RecordingSession(rate=100, burst=10, max_retries=2)
+
+    response = session.get(f'{stub_server.url}/history/AAPL')
+    assert response.status_code == 429
+    assert len(stub_server.requests) == 3
+    assert len(session.backoffs) == 2
+
+
+#Callers asking for the same history at the same time share a single request
+def test_concurrent_calls_share_one_request(stub_server):
+    stub_server.delay = 0.5
+    client = StubClient(stub_server.url, RateLimitedSession(rate=100, burst=10))
+    barrier = threading.Barrier(5)
+    results = []
+
+    def fetch():
+        barrier.wait()
+        results.append(client.history('AAPL', '20y', '1mo'))
+
+    threads = [threading.Thread(target=fetch) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(stub_server.requests) == 1
+    assert len(results) == 5
+    assert all(result['Close'].tolist() == [100.0, 101.0] for result in results)
+    #Every caller gets its own copy
+    assert len({id(result) for result in results}) == 5
+
+    #Once finished, a new call sends a new request
+    client.history('AAPL', '20y', '1mo')
+    assert len(stub_server.requests) == 2
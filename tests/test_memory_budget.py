@@ -0,0 +1,34 @@
+import threading
+
+from memory_budget import MemoryBudget
+
+
+#Readers using get() never fail while other threads fill the budget and evict entries
+def test_get_during_evictions():
+    budget = MemoryBudget(max_bytes=2000)
+    cache = budget.cache()
+    errors = []
+    stop = threading.Event()
+
+    def writer():
+        for i in range(5000):
+            cache[i % 50] = bytes(200)
+        stop.set()
+
+    def reader():
+        while not stop.is_set():
+            try:
+                for key in range(50):
+                    value = cache.get(key)
+                    assert value is None or len(value) == 200
+            except Exception as e:
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert budget.used_bytes <= budget.max_bytes
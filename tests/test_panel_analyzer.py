@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+from panel_analyzer import downside_risk_panel, max_drawdown
+
+
+#A fall in the first month is measured from the starting value (1), not from the value after that month
+def test_max_drawdown_starts_from_initial_wealth():
+    wealth = np.cumprod(1 + np.array([[-0.5, 0.1], [0.1, -0.2], [0.1, 0.3]]), axis=0)
+    np.testing.assert_allclose(max_drawdown(wealth), [-0.5, -0.2])
+
+
+def test_downside_risk_first_month_loss():
+    dates = pd.period_range('2020-01', periods=4, freq='M')
+    total_returns = pd.DataFrame({'A': [-0.2, 0.05, 0.05, 0.05]}, index=dates)
+    market = pd.Series([-1.0, 2.0, 1.0, -3.0], index=dates)
+    downside_df = downside_risk_panel(total_returns * 100, market, total_returns)
+
+    assert downside_df.loc['A', 'Max Drawdown (%)'] == -20.0
+    annual_returns = (0.8 * 1.05 ** 3) ** (12 / 4) - 1
+    assert downside_df.loc['A', 'Calmar Ratio'] == round(annual_returns / 0.2, 3)
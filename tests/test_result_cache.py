@@ -0,0 +1,99 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+import market_data
+from data_providers import YFinanceProvider
+from result_cache import ResultCache, get_result_cache
+from ticker_analyzer import TickerReturns
+
+
+#The disk cache is only used when CAPM_CACHE_DIR is set
+def test_cache_is_opt_in(monkeypatch, tmp_path):
+    monkeypatch.delenv('CAPM_CACHE_DIR', raising=False)
+    assert get_result_cache() is None
+    monkeypatch.setenv('CAPM_CACHE_DIR', str(tmp_path / 'cache'))
+    assert get_result_cache() is not None
+
+
+#The directory is created by the first write, not when the cache is created or read
+def test_directory_created_on_first_write(tmp_path):
+    cache = ResultCache(tmp_path / 'cache')
+    assert cache.get('missing') == (False, None)
+    assert not (tmp_path / 'cache').exists()
+
+    key = cache.make_key(name='test')
+    cache.set(key, [1, 2, 3])
+    assert cache.get(key) == (True, [1, 2, 3])
+
+
+class FakeClient:
+    def __init__(self):
+        self.closes = [100.0, 101.0]
+        self.requests = 0
+
+    def history(self, symbol, period, interval):
+        self.requests += 1
+        dates = pd.date_range('2024-01-01', periods=len(self.closes), freq='MS', tz='America/New_York')
+        return pd.DataFrame({'Close': self.closes}, index=dates)
+
+
+#The version of Yahoo Finance data changes with a new bar or a revised one, not only with the day
+def test_yfinance_version_follows_the_data(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(market_data, 'get_market_data_client', lambda: client)
+    provider = YFinanceProvider()
+
+    version = provider.data_version('AAPL', '20y', '1mo')
+    assert '2024-02-01' in version
+    assert provider.data_version('AAPL', '20y', '1mo') == version
+    assert client.requests == 1
+
+    #The history is reused with its version until it is older than the TTL
+    assert provider.history('AAPL', '20y', '1mo')['Close'].tolist() == [100.0, 101.0]
+    assert client.requests == 1
+
+    #Revised last bar, seen once the history is fetched again
+    client.closes = [100.0, 102.0]
+    provider.expire('AAPL', '20y', '1mo')
+    revised = provider.data_version('AAPL', '20y', '1mo')
+    assert revised != version
+
+    #New bar, seen when the version is older than the TTL
+    client.closes = [100.0, 102.0, 103.0]
+    monkeypatch.setattr(YFinanceProvider, 'VERSION_TTL', -1)
+    assert '2024-03-01' in provider.data_version('AAPL', '20y', '1mo')
+
+
+#Yahoo Finance stub with 10 years of monthly prices for any symbol, counting the downloads of each symbol
+class CountingClient:
+    def __init__(self):
+        self.requests = Counter()
+
+    def history(self, symbol, period, interval):
+        self.requests[symbol] += 1
+        rng = np.random.default_rng(len(symbol))
+        dates = pd.date_range('2014-01-01', periods=120, freq='MS', tz='America/New_York')
+        closes = 100 * np.cumprod(1 + rng.normal(0.01, 0.05, len(dates)))
+        return pd.DataFrame({'Close': closes}, index=dates)
+
+
+#With the cache, a miss downloads each symbol once and a hit (new process, same cache) downloads nothing
+def test_cached_analysis_downloads_each_symbol_once(monkeypatch, tmp_path):
+    client = CountingClient()
+    monkeypatch.setattr(market_data, 'get_market_data_client', lambda: client)
+
+    metrics = TickerReturns(provider=YFinanceProvider(), result_cache=ResultCache(tmp_path)).calculate_capm_metrics('AAPL')
+    assert client.requests == {'AAPL': 1, '^GSPC': 1, '^TYX': 1}
+
+    client.requests.clear()
+    restarted = TickerReturns(provider=YFinanceProvider(), result_cache=ResultCache(tmp_path))
+    assert restarted.calculate_capm_metrics('AAPL') == metrics
+    assert client.requests == {}
+
+    #Versions older than the TTL are checked again
+    monkeypatch.setattr(YFinanceProvider, 'VERSION_TTL', -1)
+    restarted = TickerReturns(provider=YFinanceProvider(), result_cache=ResultCache(tmp_path))
+    restarted.calculate_capm_metrics('AAPL')
+    assert set(client.requests) == {'AAPL', '^GSPC', '^TYX'}
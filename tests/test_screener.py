@@ -0,0 +1,64 @@
+import threading
+
+import pandas as pd
+
+from screener import SCREEN_COLUMNS, UniverseScreener
+from warmup import WarmUp
+
+
+#Regression with a data version that can be changed and builds that can be held until released
+class FakeRegression:
+    def __init__(self):
+        self.data_version = 'v1'
+        self.builds = []
+        self.release = threading.Event()
+        self.release.set()
+
+    #Market data loaded by the warm-up
+    def get_sp500_excess_returns_df(self):
+        pass
+
+    def get_monthly_tbill_yield(self):
+        pass
+
+    def get_market_expectations(self):
+        pass
+
+    def get_data_version(self):
+        return self.data_version, None
+
+    def calculate_universe_metrics(self, tickers, workers=8):
+        data_version = self.data_version
+        self.release.wait(5)
+        self.builds.append(data_version)
+        metrics_df = pd.DataFrame({column: [1.0] for column in SCREEN_COLUMNS.values()}, index=[data_version])
+        return metrics_df, {}
+
+
+#The warm-up builds the index, so the first query does not
+def test_warmup_builds_the_index():
+    capm_regression = FakeRegression()
+    screener = UniverseScreener(capm_regression, lambda: ['AAPL'])
+    warmup = WarmUp(capm_regression, hot_tickers=[], screener=screener)
+    warmup.run()
+    assert capm_regression.builds == ['v1']
+
+    screener.screen()
+    assert capm_regression.builds == ['v1']
+
+
+#New data is indexed in the background, queries read the previous index until the new one replaces it
+def test_queries_read_the_latest_index_while_rebuilding():
+    capm_regression = FakeRegression()
+    screener = UniverseScreener(capm_regression, lambda: ['AAPL'])
+    screener.build()
+
+    capm_regression.data_version = 'v2'
+    capm_regression.release.clear()
+    assert list(screener.get_index().metrics_df.index) == ['v1']
+    assert list(screener.get_index().metrics_df.index) == ['v1']
+
+    capm_regression.release.set()
+    screener.rebuild_thread.join(5)
+    assert capm_regression.builds == ['v1', 'v2']
+    assert list(screener.get_index().metrics_df.index) == ['v2']
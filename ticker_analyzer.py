@@ -1,18 +1,102 @@
 import pandas as pd
-import yfinance as yf
 import time
-import statsmodels.api as sm
-from statsmodels.regression.rolling import RollingOLS
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from data_providers import get_provider
+from result_cache import get_result_cache
+from memory_budget import budgeted_dict, get_memory_budget, get_returns_dtype
+
+#yfinance (through the data provider) and statsmodels are slow to import (around 1s together), so they are imported
+#inside the methods that use them. This keeps importing this file (webapp workers, command line) fast
 
 start_time = time.time()
 
+#Window sizes of the rolling analysis that can be selected in the webapp slider (months)
+ROLLING_WINDOW_SIZES = list(range(6, 37, 3))
+
+#Columns of the metrics table shown in the webapp (one row per ticker)
+CAPM_METRIC_COLUMNS = ['Ticker','Beta','Monthly Expected Returns (%)', 'Alpha (%)','R2','Treynor Ratio (%)','Sharpe Ratio', 'Annual Alpha (%)']
+
+#Standard errors and t-stats are rounded like the metrics, p-values keep 4 decimals
+def round_inference(inference_df):
+    p_value_columns = [column for column in inference_df.columns if column.endswith(' p')]
+    return inference_df.round(3).assign(**{column: inference_df[column].round(4) for column in p_value_columns})
+
+#Methods to remove outliers from the excess returns before the regressions
+#'iqr': months outside [Q1 - 1.5*IQR, Q3 + 1.5*IQR] are removed (default)
+#'none': every month is kept (used by the robust regressions, which down-weight the outliers instead)
+OUTLIER_METHODS = ['iqr', 'none']
+
+def remove_outliers(excess_returns, method='iqr'):
+    if method == 'none':
+        return excess_returns
+    if method != 'iqr':
+        raise ValueError(f"Unknown outlier method '{method}', use one of {OUTLIER_METHODS}")
+
+    #Detecting outliers using the IQR method
+    #Calculating the upper and lower limits
+    #(both quartiles in one call, the series is only sorted once)
+    Q1, Q3 = excess_returns.quantile([0.25, 0.75])
+    IQR = Q3 - Q1
+
+    #These would be the lower and upper bounds of the series with no outliers
+    lower = Q1 - 1.5*IQR
+    upper = Q3 + 1.5*IQR
+
+    #Adding all outliers (bigger than upper bound or smaller than lower bound)
+    all_outliers = (excess_returns > upper) | (excess_returns < lower)
+
+    # Report removal
+    print(f"Removed {all_outliers.sum()} outliers from {excess_returns.name}")
+
+    #Keeping only the months where all_outliers is false
+    #~ is a bitwise NOT operator (so it will select only NON-outliers)
+    return excess_returns[~all_outliers]
+
+#Number of date ranges whose results are kept (see TickerReturns.with_date_range)
+MAX_DATE_RANGES = 8
+
+#Date from a date or a string: '2008' (year), '2008-06' (month) or '2008-06-30' (day)
+#end=True gives the last day of the year/month (so '2012' as an end date includes all of 2012)
+def parse_date(value, end=False):
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    period = pd.Period(str(value))
+    return (period.end_time if end else period.start_time).date()
+
+#Months of a series (indexed by sorted dates) between start_date and end_date, both included
+#Positional slice of the series, so the values are a view of the original (no copy)
+def slice_dates(series, start_date=None, end_date=None):
+    first = series.index.searchsorted(start_date, side='left') if start_date is not None else 0
+    last = series.index.searchsorted(end_date, side='right') if end_date is not None else len(series)
+    return series.iloc[first:last]
+
 class TickerReturns():
-    def __init__(self):
+    #provider is where the price history comes from (see data_providers.py)
+    #By default it is chosen by the CAPM_DATA_PROVIDER environment variable (yfinance if not set)
+    #result_cache keeps computed results on disk (see result_cache.py), shared by restarts and workers
+    #By default it is configured by the CAPM_CACHE_DIR environment variable (not set: no disk cache)
+    #memory_budget limits the size of the results kept in memory (see memory_budget.py)
+    #By default it is configured by the CAPM_MEMORY_BUDGET_MB environment variable (None: no limit)
+    #returns_dtype is the storage type of the excess returns: 'float64' or 'float32' (CAPM_RETURNS_DTYPE)
+    def __init__(self, provider=None, result_cache=None, memory_budget=None, returns_dtype=None):
+        self.provider = provider if provider is not None else get_provider()
+        self.result_cache = result_cache if result_cache is not None else get_result_cache()
+        self.memory_budget = memory_budget if memory_budget is not None else get_memory_budget()
+        self.returns_dtype = returns_dtype or get_returns_dtype()
         self.ticker_list = []
         self.index_ticker = "^GSPC"
         self.tbill_30y_ticker = "^TYX"
         self.period = "20y"
         self.interval = "1mo"
+        #Method used to remove outliers from the excess returns (see OUTLIER_METHODS)
+        self.outlier_method = "iqr"
         self.all_tickers_returns_df = pd.DataFrame()
         self.sp500_excess_returns_df = pd.DataFrame()
         self.index_returns_data = pd.DataFrame()
@@ -21,6 +105,88 @@ class TickerReturns():
         self.ticker_returns_df = pd.DataFrame()
         self.ticker_excess_returns = pd.DataFrame()
 
+        #CAPM metrics already calculated for each ticker (ticker -> row of the metrics table)
+        #Used so that re-running the analysis only computes the tickers that were added
+        self.capm_metrics = {}
+
+        #Excess returns already calculated ((ticker, outlier method) -> series of monthly excess returns in %)
+        #Part of the memory budget: entries can be dropped and are then calculated again (or read from the disk cache)
+        self.excess_returns = budgeted_dict(self.memory_budget)
+        #Same for the SP500 (outlier method -> series)
+        self.sp500_excess_returns = {}
+
+        #Standard errors, t-stats and p-values of Alpha and Beta already calculated (ticker -> dictionary)
+        self.capm_inference = {}
+        #ticker -> downside risk metrics (see calculate_downside_risk)
+        self.downside_risk = {}
+
+        #Robust metrics already calculated ((regression method, ticker) -> row of the metrics table)
+        self.robust_metrics = {}
+
+        #Rolling analyses already calculated ((ticker, window size) -> dataframe with Alpha, Beta and R2)
+        self.rolling_analysis = budgeted_dict(self.memory_budget)
+
+        #When the SP500 data was fetched (used as the Last-Modified date of the results)
+        self.data_fetched_at = None
+
+        #Streaming CAPM states of the tickers (ticker -> capm_estimators.CAPMState), a refresh of the market data
+        #only adds the new months to them (see update_capm_states)
+        self.capm_states = {}
+
+        #Analyses of date ranges ((start date, end date) -> DateRangeReturns), least recently used first
+        self.date_ranges = OrderedDict()
+        #Sessions of the webapp ask for their date range at the same time
+        self.date_ranges_lock = threading.Lock()
+
+    #Getting a result from the disk cache, or calculating it with compute() and saving it
+    #The key has every input of the result: name of the result, symbols used (with the version of their data),
+    #period, interval, outlier method and the other parameters (e.g. window size)
+    #refresh=True calculates the result again and replaces the saved one
+    def cached_result(self, name, compute, symbols, refresh=False, outlier_method=None, **params):
+        if self.result_cache is None:
+            return compute()
+
+        key = self.result_cache.make_key(
+            name=name,
+            data_versions={symbol: self.data_version(symbol, refresh) for symbol in symbols},
+            provider=repr(self.provider),
+            period=self.period,
+            interval=self.interval,
+            outlier_method=outlier_method or self.outlier_method,
+            **params,
+        )
+        if not refresh:
+            found, value = self.result_cache.get(key)
+            if found:
+                return value
+
+        value = compute()
+        self.result_cache.set(key, value)
+        return value
+
+    #Version of the data of a symbol (part of the keys of the disk cache)
+    #When the provider trusts versions for a while (VERSION_TTL, e.g. yfinance), the version is saved in the cache too,
+    #so a restart or another worker finds the saved results without downloading the data to check its version
+    def data_version(self, symbol, refresh=False):
+        ttl = self.provider.VERSION_TTL
+        if ttl is None:
+            return self.provider.data_version(symbol, self.period, self.interval)
+
+        known = self.provider.known_version(symbol, self.period, self.interval)
+        if known is not None:
+            return known[1]
+
+        key = self.result_cache.make_key(name='data_version', provider=repr(self.provider), symbol=symbol,
+                                         period=self.period, interval=self.interval)
+        if not refresh:
+            found, saved = self.result_cache.get(key)
+            if found and time.time() - saved[0] <= ttl:
+                return saved[1]
+
+        version = self.provider.data_version(symbol, self.period, self.interval)
+        self.result_cache.set(key, (time.time(), version))
+        return version
+
     #Transforming the list (input by the user) into the list of the instance 
     #Important for fetching the data
     def set_ticker_list(self,list_input):
@@ -34,8 +200,7 @@ class TickerReturns():
 
         #Iteration of each ticker in the ticker list to add into one single df
         for each_ticker in self.ticker_list:
-            ticker_info = yf.Ticker(each_ticker)
-            historical_data = pd.DataFrame(ticker_info.history(period=self.period,interval=self.interval))
+            historical_data = pd.DataFrame(self.provider.history(each_ticker,self.period,self.interval))
             
             #This pct change method will get exactly the returns we need from each given ticker
             ticker_returns_data = historical_data['Close'].astype(float).pct_change()
@@ -54,9 +219,7 @@ class TickerReturns():
     #Function will only provide the returns for one ticker
     #Doing a df with all returns is too inefficient (especially if the user select several tickers in the webapp)
     def get_ticker_returns_df(self, ticker):
-
-        ticker_info = yf.Ticker(ticker)
-        historical_data = pd.DataFrame(ticker_info.history(period=self.period,interval=self.interval))
+        historical_data = pd.DataFrame(self.provider.history(ticker,self.period,self.interval))
         
         #This pct change method will get exactly the returns we need from each given ticker
         ticker_returns_data = historical_data['Close'].astype(float).pct_change()
@@ -67,9 +230,20 @@ class TickerReturns():
         return self.ticker_returns_df
     
 
-    def get_monthly_tbill_yield(self):
-        tbill_info = yf.Ticker(self.tbill_30y_ticker)
-        tbill_historical_data = pd.DataFrame(tbill_info.history(period=self.period,interval=self.interval))
+    #The risk free rate and the SP500 are the same for every ticker, so they are only fetched once
+    #refresh=True forces fetching them again from the API
+    def get_monthly_tbill_yield(self, refresh=False):
+        if not refresh and not self.monthly_tbill_yield.empty:
+            return self.monthly_tbill_yield
+
+        self.monthly_tbill_yield = self.cached_result(
+            'monthly_tbill_yield', self.calculate_monthly_tbill_yield, [self.tbill_30y_ticker],
+            refresh=refresh, outlier_method='none',
+        )
+        return self.monthly_tbill_yield
+
+    def calculate_monthly_tbill_yield(self):
+        tbill_historical_data = pd.DataFrame(self.provider.history(self.tbill_30y_ticker,self.period,self.interval))
 
         #Converting each of the risk free rate to a monthly risk free rate and adding to a df
         #Notice we are using a simple interest approach (common in excess return calculations)
@@ -78,32 +252,55 @@ class TickerReturns():
         monthly_tbill_yield = tbill_historical_data['Close']/12/100
         monthly_tbill_yield.name = f"{self.tbill_30y_ticker} Monthly Rate"
         monthly_tbill_yield.index = pd.to_datetime(monthly_tbill_yield.index).date
-        self.monthly_tbill_yield = monthly_tbill_yield
-        
-        return self.monthly_tbill_yield
+
+        return monthly_tbill_yield
     
-    def get_sp500_monthly_returns(self):
-        index_info = yf.Ticker(self.index_ticker)
-        index_historical_data = pd.DataFrame(index_info.history(period=self.period,interval=self.interval))
+    def get_sp500_monthly_returns(self, refresh=False):
+        if not refresh and not self.index_returns_data.empty:
+            return self.index_returns_data
+
+        self.index_returns_data = self.cached_result(
+            'sp500_monthly_returns', self.calculate_sp500_monthly_returns, [self.index_ticker],
+            refresh=refresh, outlier_method='none',
+        )
+        self.data_fetched_at = datetime.now(timezone.utc)
+
+        return self.index_returns_data
+
+    def calculate_sp500_monthly_returns(self):
+        index_historical_data = pd.DataFrame(self.provider.history(self.index_ticker,self.period,self.interval))
             
         #pctchange() method will get exactly the returns we need from each given ticker
         index_returns_data = index_historical_data['Close'].astype(float).pct_change()
         index_returns_data.name = "SP500 Monthly Returns"
         index_returns_data.index = pd.to_datetime(index_returns_data.index).date
 
-        self.index_returns_data = index_returns_data
-
-        return self.index_returns_data
+        return index_returns_data
  
     #Use of SP500 as the proxy (data availability, liquidity of assets and 
     #Most importantly most diversifiable index - evaluation of systematic risk)
-    def get_sp500_excess_returns_df(self):
+    #outlier_method: see OUTLIER_METHODS (default: self.outlier_method)
+    def get_sp500_excess_returns_df(self, refresh=False, outlier_method=None):
+        outlier_method = outlier_method or self.outlier_method
+        if not refresh and outlier_method in self.sp500_excess_returns:
+            return self.sp500_excess_returns[outlier_method]
+
+        sp500_excess_returns = self.cached_result(
+            'sp500_excess_returns', lambda: self.calculate_sp500_excess_returns(refresh, outlier_method),
+            [self.index_ticker, self.tbill_30y_ticker], refresh=refresh, outlier_method=outlier_method,
+        )
+        self.sp500_excess_returns[outlier_method] = sp500_excess_returns
+        if outlier_method == self.outlier_method:
+            self.sp500_excess_returns_df = sp500_excess_returns
+        return sp500_excess_returns
+
+    def calculate_sp500_excess_returns(self, refresh=False, outlier_method='iqr'):
         #Calculating Excess Returns
         #Excess Returns = Returns on investment - Returns on a risk-free investment (proxy)
         #Returns on investments will be the monthly returns of each asset
         #Proxy for all returns (sp500 and stocks) will be the monthly risk-free rate of 20y T-Bills
-        self.get_sp500_monthly_returns()
-        self.get_monthly_tbill_yield()
+        self.get_sp500_monthly_returns(refresh)
+        self.get_monthly_tbill_yield(refresh)
 
         #Creating a DataFrame with both Series (aligned by date, since they have the same indexes)
         combined_df = pd.DataFrame({
@@ -119,100 +316,354 @@ class TickerReturns():
 
         combined_df[excess_returns_col] = (combined_df['Index_Returns'] - combined_df['Risk_Free_Rate'])*100
 
-        #Detecting outliers using the IQR method
-        #Calculating the upper and lower limits
-        Q1 = combined_df[excess_returns_col].quantile(0.25)
-        Q3 = combined_df[excess_returns_col].quantile(0.75)
-        IQR = Q3 - Q1
-        
-        #These would be the lower and upper bounds of the dataframe with no outliers
-        lower = Q1 - 1.5*IQR
-        upper = Q3 + 1.5*IQR
-
-        #Counting outliers (bigger than upper bound)
-        upper_outliers = combined_df[excess_returns_col] > upper
-
-        #Counting outliers (smaller than lower bound)
-        lower_outliers = combined_df[excess_returns_col] < lower
-
-        #Adding all outliers
-        all_outliers = upper_outliers | lower_outliers
-
-        #Creating a DataFrame that contains only the rows where all_outliers is false
-        #~ is a bitwise NOT operator (so it will select only NON-outliers)
-        combined_df_filtered = combined_df[~all_outliers]
-
-        # Report removal
-        print(f"Removed {all_outliers.sum()} outliers from {excess_returns_col} ")
-
-        self.sp500_excess_returns_df=combined_df_filtered[excess_returns_col]
-
-        return self.sp500_excess_returns_df
+        return remove_outliers(combined_df[excess_returns_col], outlier_method)
 
     #Getting the excess returns of a particular ticker
-    def ticker_excess_returns_df(self,ticker):
-
+    #Results are kept in self.excess_returns, so the same ticker is not fetched twice
+    #outlier_method: see OUTLIER_METHODS (default: self.outlier_method)
+    def ticker_excess_returns_df(self,ticker, refresh=False, outlier_method=None):
+        outlier_method = outlier_method or self.outlier_method
+        #One lookup (done under the lock of the budget): the entry can be evicted by another thread at any time
+        if not refresh:
+            ticker_excess_returns = self.excess_returns.get((ticker, outlier_method))
+            if ticker_excess_returns is not None:
+                return ticker_excess_returns
+
+        ticker_excess_returns = self.cached_result(
+            'ticker_excess_returns', lambda: self.calculate_ticker_excess_returns(ticker, outlier_method),
+            [ticker, self.tbill_30y_ticker], refresh=refresh, outlier_method=outlier_method, ticker=ticker,
+        )
+        #Stored as float32 when configured (no copy with float64)
+        ticker_excess_returns = ticker_excess_returns.astype(self.returns_dtype, copy=False)
+        self.ticker_excess_returns = ticker_excess_returns
+        self.excess_returns[(ticker, outlier_method)] = ticker_excess_returns
+
+        return ticker_excess_returns
+
+    def calculate_ticker_excess_returns(self, ticker, outlier_method='iqr'):
         #Getting monthly returns dataframe 
-        self.get_ticker_returns_df(ticker)
+        #Using the returned values (not the attributes) so several threads can share the same instance
+        ticker_returns = self.get_ticker_returns_df(ticker)
         #Getting monthly tbill yield dataframe
-        self.get_monthly_tbill_yield()
-
-        #Creating a copy to not alter the original dataset
-        ticker_returns = self.ticker_returns_df.copy()
-        tbill_yield = self.monthly_tbill_yield.copy()
-
-        #Column name in which we are fetching given ticker returns data
-        ticker_returns_column = f'{ticker} Returns'
-
-        #Creating df with ticker returns and risk free rate for calculation of excess returns
-        combined_df=pd.DataFrame({
-            ticker_returns_column:ticker_returns,
-            f'Risk_Free_Rate':tbill_yield
-        })
-
-        #Dropping rows with missing values
-        combined_df = combined_df.dropna()
-
+        tbill_yield = self.get_monthly_tbill_yield()
+
+        #Calculating excess returns directly on the series (aligned by date, the inputs are not modified)
+        #Months missing in either series are NaN and dropped
+        excess_returns = ticker_returns.sub(tbill_yield).dropna()
+        excess_returns *= 100
+        excess_returns.name = f'{ticker} Excess Returns (%)'
+
+        return remove_outliers(excess_returns, outlier_method)
+
+    #Excess returns of several tickers in one dataframe (dates x tickers), used by the vectorized
+    #calculations in panel_analyzer. Tickers are fetched in parallel by "workers" threads
+    #Returns the panel, the SP500 excess returns and the tickers that could not be fetched
+    def get_excess_returns_panel(self, tickers, workers=8, outlier_method=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        excess_returns_sp500 = self.get_sp500_excess_returns_df(outlier_method=outlier_method)
+
+        def fetch(ticker):
+            try:
+                return ticker, self.ticker_excess_returns_df(ticker, outlier_method=outlier_method), None
+            except Exception as e:
+                return ticker, None, str(e)
+
+        all_excess_returns = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for ticker, ticker_excess_returns, error in executor.map(fetch, tickers):
+                if error is None:
+                    all_excess_returns[ticker] = ticker_excess_returns
+                else:
+                    errors[ticker] = error
+
+        excess_returns_panel = pd.DataFrame(all_excess_returns, columns=[ticker for ticker in tickers if ticker in all_excess_returns])
+        excess_returns_panel = excess_returns_panel.sort_index()
+
+        return excess_returns_panel, excess_returns_sp500, errors
+    
+    #Expected returns of the market and the risk-free rate (monthly means), same for all assets
+    def get_market_expectations(self):
+        sp500_monthly_returns = self.get_sp500_monthly_returns().dropna()
+        sp500_expected_returns = sp500_monthly_returns.mean()
 
-        #Calculating excess returns
-        excess_returns_col = f'{ticker} Excess Returns (%)'
-        combined_df[excess_returns_col] = (combined_df[ticker_returns_column] - combined_df['Risk_Free_Rate'])*100
+        risk_free_rate = self.get_monthly_tbill_yield().dropna()
+        rf = risk_free_rate.mean()
 
-        #Detecting outliers using the IQR method
-        #Calculating the upper and lower limits
-        Q1 = combined_df[excess_returns_col].quantile(0.25)
-        Q3 = combined_df[excess_returns_col].quantile(0.75)
-        IQR = Q3 - Q1
-        
-        #These would be the lower and upper bounds of the dataframe with no outliers
-        lower = Q1 - 1.5*IQR
-        upper = Q3 + 1.5*IQR
+        return sp500_expected_returns, rf
 
-        #Counting outliers (bigger than upper bound)
-        upper_outliers = combined_df[excess_returns_col] > upper
+    #Calculating Beta, Alpha, R2, Treynor and Sharpe Ratio of a ticker (one row of the metrics table)
+    #Results are kept in self.capm_metrics, so the same ticker is not calculated twice
+    #ticker_excess_returns can be passed if the excess returns were already fetched
+    def calculate_capm_metrics(self, ticker, ticker_excess_returns=None, refresh=False):
+        if not refresh and ticker in self.capm_metrics:
+            return self.capm_metrics[ticker]
 
-        #Counting outliers (smaller than lower bound)
-        lower_outliers = combined_df[excess_returns_col] < lower
+        if ticker_excess_returns is None:
+            ticker_excess_returns = self.ticker_excess_returns_df(ticker)
+        excess_returns_sp500 = self.get_sp500_excess_returns_df()
 
-        #Adding all outliers
-        all_outliers = upper_outliers | lower_outliers
+        import statsmodels.api as sm
 
-        #Creating a DataFrame that contains only the rows where all_outliers is false
-        #~ is a bitwise NOT operator (so it will select only NON-outliers)
-        combined_df_filtered = combined_df[~all_outliers]
+        #Same regression done by the plotly OLS trendline (months missing in either series are dropped)
+        combined_df = pd.DataFrame({
+            'ticker_excess':ticker_excess_returns,
+            'sp500_excess':excess_returns_sp500
+        }).dropna()
+
+        model_results = sm.OLS(combined_df['ticker_excess'], sm.add_constant(combined_df['sp500_excess'])).fit()
+
+        #Fecthing beta, alpha and rsquared (found with ols regression line)
+        beta = round(model_results.params[1],3)
+        alpha = model_results.params[0]
+        alpha_rounded = round(alpha,3)
+        r_squared = round(model_results.rsquared,3)
+
+        #Making Alpha annualized
+        annual_alpha = round(alpha*12,3)
+
+        #CAPM formula is: E[rA] = rf + βA × (E[rm] - rf)
+        sp500_expected_returns, rf = self.get_market_expectations()
+        expected_returns = rf + beta*(sp500_expected_returns-rf)
+
+        #Making Expected Returns in %
+        expected_returns = round(expected_returns*100,3)
+
+        #Treynor Ratio = (Portfolio Return - Risk-Free Rate) / Portfolio Beta
+        #Average excess return of each asset / Asset Beta (annualized, data is monthly)
+        mean_excess_returns = ticker_excess_returns.mean()
+        treynor_ratio = round(mean_excess_returns/beta*12,3)
+
+        #Sharpe Ratio = (Portfolio Return - Risk-Free Rate) / Standard deviation of portfolio's excess returns
+        #Multiplying by sqrt(12) because sharpe ratio uses std deviation (has to be sqrt of time)
+        std_dev_excess_returns = ticker_excess_returns.std()
+        sharpe_ratio = round((mean_excess_returns/std_dev_excess_returns)*(12**0.5),3)
+
+        metrics = dict(zip(CAPM_METRIC_COLUMNS, [ticker, beta, expected_returns, alpha_rounded, r_squared, treynor_ratio, sharpe_ratio, annual_alpha]))
+        self.capm_metrics[ticker] = metrics
+
+        return metrics
+
+    #Metrics table of many tickers (e.g. the whole S&P 500) calculated in one vectorized pass
+    #(see panel_analyzer.capm_metrics_panel), the tickers are fetched in parallel by "workers" threads
+    #Returns the metrics (one row per ticker, indexed by ticker) and the tickers that could not be fetched
+    def calculate_universe_metrics(self, tickers, workers=8):
+        from panel_analyzer import capm_metrics_panel, capm_inference_panel, downside_risk_panel
+
+        excess_returns_panel, excess_returns_sp500, errors = self.get_excess_returns_panel(tickers, workers=workers)
+        sp500_expected_returns, rf = self.get_market_expectations()
+        metrics_df = capm_metrics_panel(excess_returns_panel, excess_returns_sp500, sp500_expected_returns, rf)
+        inference_df = round_inference(capm_inference_panel(excess_returns_panel, excess_returns_sp500))
+        all_months_panel, _, _ = self.get_excess_returns_panel(list(excess_returns_panel.columns), workers=workers, outlier_method='none')
+        downside_df = downside_risk_panel(excess_returns_panel, excess_returns_sp500, self.get_total_returns_panel(all_months_panel))
+        metrics_df = metrics_df.join(downside_df).join(inference_df)
+
+        return metrics_df, errors
+
+    #Monthly total returns (decimals) from a panel of excess returns (%): the risk-free rate is added back
+    def get_total_returns_panel(self, excess_returns_panel):
+        monthly_tbill_yield = self.get_monthly_tbill_yield().reindex(excess_returns_panel.index)
+        return excess_returns_panel.div(100).add(monthly_tbill_yield, axis=0)
+
+    #Downside Beta, Upside Beta, Sortino Ratio, Max Drawdown and Calmar Ratio of several tickers
+    #(see panel_analyzer.downside_risk_panel), tickers not calculated yet are done together in one vectorized pass
+    #The Betas and the Sortino Ratio use the same excess returns as calculate_capm_metrics, the drawdown
+    #uses every month (the outliers removed from the regressions are real losses)
+    #Returns {ticker: {column: value}} with the DOWNSIDE_COLUMNS
+    def calculate_downside_risk(self, tickers, workers=8):
+        from panel_analyzer import downside_risk_panel
+
+        missing_tickers = [ticker for ticker in tickers if ticker not in self.downside_risk]
+        if missing_tickers:
+            excess_returns_panel, excess_returns_sp500, _ = self.get_excess_returns_panel(missing_tickers, workers=workers)
+            all_months_panel, _, _ = self.get_excess_returns_panel(list(excess_returns_panel.columns), workers=workers, outlier_method='none')
+            downside_df = downside_risk_panel(excess_returns_panel, excess_returns_sp500, self.get_total_returns_panel(all_months_panel))
+            for ticker, row in downside_df.iterrows():
+                self.downside_risk[ticker] = row.to_dict()
+
+        return {ticker: self.downside_risk[ticker] for ticker in tickers if ticker in self.downside_risk}
+
+    #Significance of the OLS Alpha and Beta of several tickers (see panel_analyzer.capm_inference_panel):
+    #classical and Newey-West standard errors, t-stats and p-values, from the same excess returns as
+    #calculate_capm_metrics. Tickers not calculated yet are done together in one vectorized pass
+    #Returns {ticker: {column: value}} with the INFERENCE_COLUMNS (tickers that could not be regressed are missing)
+    def calculate_capm_inference(self, tickers, workers=8):
+        from panel_analyzer import capm_inference_panel
+
+        missing_tickers = [ticker for ticker in tickers if ticker not in self.capm_inference]
+        if missing_tickers:
+            excess_returns_panel, excess_returns_sp500, _ = self.get_excess_returns_panel(missing_tickers, workers=workers)
+            inference_df = round_inference(capm_inference_panel(excess_returns_panel, excess_returns_sp500))
+            for ticker, row in inference_df.iterrows():
+                self.capm_inference[ticker] = row.to_dict()
+
+        return {ticker: self.capm_inference[ticker] for ticker in tickers if ticker in self.capm_inference}
+
+    #Robust Beta and Alpha of several tickers (Huber or Theil-Sen, see robust_regression.py)
+    #Every month is kept (no outlier removal): the robust regressions give less weight to extreme months
+    #instead of removing them. Tickers not calculated yet are regressed together in one batch
+    #Returns the rows of the metrics table (same columns as calculate_capm_metrics), in the order of tickers
+    def calculate_robust_metrics(self, tickers, method='huber', workers=8):
+        from robust_regression import robust_capm_panel
+
+        missing_tickers = [ticker for ticker in tickers if (method, ticker) not in self.robust_metrics]
+        if missing_tickers:
+            excess_returns_panel, excess_returns_sp500, errors = self.get_excess_returns_panel(missing_tickers, workers=workers, outlier_method='none')
+            if errors:
+                raise ValueError(f"Could not fetch {', '.join(sorted(errors))}")
+            robust_df = robust_capm_panel(excess_returns_panel, excess_returns_sp500, method)
+
+            sp500_expected_returns, rf = self.get_market_expectations()
+            mean_excess_returns = excess_returns_panel.mean()
+            std_dev_excess_returns = excess_returns_panel.std()
+            for ticker, row in robust_df.iterrows():
+                #Same formulas and rounding as calculate_capm_metrics
+                beta = round(row['Beta'],3)
+                expected_returns = round((rf + beta*(sp500_expected_returns-rf))*100,3)
+                treynor_ratio = round(mean_excess_returns[ticker]/beta*12,3)
+                sharpe_ratio = round((mean_excess_returns[ticker]/std_dev_excess_returns[ticker])*(12**0.5),3)
+                self.robust_metrics[(method, ticker)] = dict(zip(CAPM_METRIC_COLUMNS, [
+                    ticker, beta, expected_returns, round(row['Alpha'],3), round(row['R2'],3),
+                    treynor_ratio, sharpe_ratio, round(row['Alpha']*12,3)]))
+
+        return [self.robust_metrics[(method, ticker)] for ticker in tickers]
+
+    #Monte Carlo simulation of the returns implied by the CAPM (distribution, VaR and CVaR, see simulation.py)
+    #The Betas and residual volatilities come from the same excess returns as calculate_capm_metrics, the paths
+    #draw every month of the SP500 (crashes removed as outliers from the regressions are real risk here)
+    #workers: None shares the pool of the process (see simulation.get_simulation_pool), 1 runs in this process
+    #Returns (summary dataframe with the SIMULATION_COLUMNS, histograms, tickers that could not be fetched)
+    def simulate_returns(self, tickers, n_paths=None, horizons=None, method='bootstrap', seed=0, workers=None):
+        from simulation import simulate_capm_returns
+
+        excess_returns_panel, excess_returns_sp500, errors = self.get_excess_returns_panel(tickers)
+        all_months_sp500 = self.get_sp500_excess_returns_df(outlier_method='none')
+        _, rf = self.get_market_expectations()
+        summary_df, histograms = simulate_capm_returns(excess_returns_panel, excess_returns_sp500, rf, n_paths=n_paths,
+                                                       horizons=horizons, method=method, seed=seed, workers=workers,
+                                                       market_history=all_months_sp500)
+        return summary_df, histograms, errors
+
+    #Analysis restricted to the months between start and end (dates or strings, see parse_date, None = no limit)
+    #The months are sliced from the history already fetched (the provider is not called again), and the
+    #metrics and rolling analyses are calculated again over those months only
+    #Returns self without a range. The last MAX_DATE_RANGES ranges are kept with their results
+    def with_date_range(self, start=None, end=None):
+        start_date, end_date = parse_date(start), parse_date(end, end=True)
+        if start_date is None and end_date is None:
+            return self
+        if start_date is not None and end_date is not None and start_date > end_date:
+            raise ValueError(f"Start date {start_date} is after end date {end_date}")
+
+        key = (start_date, end_date)
+        with self.date_ranges_lock:
+            date_range = self.date_ranges.pop(key, None) or DateRangeReturns(self, start_date, end_date)
+            self.date_ranges[key] = date_range
+            while len(self.date_ranges) > MAX_DATE_RANGES:
+                self.date_ranges.popitem(last=False)
+        return date_range
+
+    #Fetching the SP500 and the risk free rate again, results calculated from the old data are discarded
+    def refresh_market_data(self):
+        #The SP500 and the T-Bill yield are downloaded again, even if the provider still trusts the data it has
+        for symbol in (self.index_ticker, self.tbill_30y_ticker):
+            self.provider.expire(symbol, self.period, self.interval)
+        self.date_ranges.clear()
+        self.sp500_excess_returns.clear()
+        self.get_sp500_excess_returns_df(refresh=True)
+        self.capm_metrics.clear()
+        self.capm_inference.clear()
+        self.downside_risk.clear()
+        self.excess_returns.clear()
+        self.rolling_analysis.clear()
+        self.robust_metrics.clear()
+        self.update_capm_states()
+        return self.get_data_version()
+
+    #Fingerprint of the market data the results are calculated from (SP500 and risk free rate)
+    #Changes whenever a refresh brings new or different data, so it can be used to invalidate cached results
+    #Returns the version string and the date the data was fetched
+    def get_data_version(self):
+        index_returns = self.get_sp500_monthly_returns()
+        tbill_yield = self.get_monthly_tbill_yield()
+
+        fingerprint = hashlib.sha1()
+        fingerprint.update(f"{self.provider!r}|{self.period}|{self.interval}|{self.index_ticker}|{self.tbill_30y_ticker}".encode())
+        for series in (index_returns, tbill_yield):
+            fingerprint.update(f"|{len(series)}|{series.index[-1] if len(series) else ''}".encode())
+            fingerprint.update(pd.util.hash_pandas_object(series, index=False).values.tobytes())
+
+        return fingerprint.hexdigest()[:16], self.data_fetched_at
+
+    #Beta, Alpha and R2 over time with an online estimator (see capm_estimators.py)
+    #halflife = None gives the expanding window (all months since the start), otherwise an EWMA
+    #Same format as calculate_rol_analysis_ols (dates as index, columns Alpha, Beta and R2)
+    def calculate_online_analysis(self, ticker, halflife=None, min_periods=12):
+        from capm_estimators import OnlineCAPMEstimator
+
+        #Same months as the rolling analysis (months missing in either series are dropped)
+        combined_df = pd.DataFrame({
+            ticker:self.ticker_excess_returns_df(ticker),
+            'sp500_excess':self.get_sp500_excess_returns_df()
+        }).dropna()
+
+        estimator = OnlineCAPMEstimator(1, halflife=halflife, min_periods=min_periods)
+        results = estimator.run(combined_df[[ticker]], combined_df['sp500_excess'])
+
+        parameters_df = pd.DataFrame({metric: results[metric][ticker] for metric in ['Alpha', 'Beta', 'R2']})
+        return parameters_df.dropna()
+
+    #Streaming state of a ticker (see capm_estimators.CAPMState), kept in self.capm_states
+    #Only the months after state.last_date are added, the history is not scanned again
+    #The excess returns keep their outliers: the state leaves them out with its online rule, as they arrive
+    #(the IQR of the whole history would change the months already added)
+    def update_capm_state(self, ticker, state=None):
+        from capm_estimators import CAPMState
+
+        if state is None:
+            state = self.capm_states.get(ticker) or CAPMState(ticker)
+        state.update_from_series(self.ticker_excess_returns_df(ticker, outlier_method='none'),
+                                 self.get_sp500_excess_returns_df(outlier_method='none'))
+        self.capm_states[ticker] = state
+        return state
+
+    #Adding the new months to the states of the tickers (default: every ticker with a state)
+    #Returns the tickers that could not be updated (ticker -> error)
+    def update_capm_states(self, tickers=None):
+        errors = {}
+        for ticker in list(self.capm_states if tickers is None else tickers):
+            try:
+                self.update_capm_state(ticker)
+            except Exception as e:
+                errors[ticker] = str(e)
+                print(f"Error updating the CAPM state of {ticker}: {e}")
+        return errors
 
-        # Report removal
-        print(f"Removed {all_outliers.sum()} outliers from {excess_returns_col}")
-        
-        self.ticker_excess_returns = combined_df_filtered[excess_returns_col]
-    
-        return self.ticker_excess_returns
-    
     #Calculating Rolling beta for each ticker given a specific window size (in months)
     #Default window size is set for 12 (12 months)
     #This method uses the OLS method (same used for the beta caculation in plotly-dash app) in order...
     #... to maintain the same beta calculation as in the application
-    def calculate_rol_analysis_ols(self,ticker,window_size = 12):
+    #Results are kept in self.rolling_analysis, so the same ticker and window are not calculated twice
+    def calculate_rol_analysis_ols(self,ticker,window_size = 12, refresh=False):
+        if not refresh:
+            parameters_df = self.rolling_analysis.get((ticker, window_size))
+            if parameters_df is not None:
+                return parameters_df
+
+        parameters_df = self.cached_result(
+            'rolling_analysis_ols', lambda: self.calculate_rolling_ols(ticker, window_size),
+            [ticker, self.index_ticker, self.tbill_30y_ticker], refresh=refresh, ticker=ticker, window_size=window_size,
+        )
+        self.rolling_analysis[(ticker, window_size)] = parameters_df
+
+        #Returning a dataframe with the alphas and betas for the given rolling windows for a particular stock
+        return parameters_df
+
+    def calculate_rolling_ols(self, ticker, window_size):
+        import statsmodels.api as sm
+        from statsmodels.regression.rolling import RollingOLS
+
         excess_returns_ticker_df = self.ticker_excess_returns_df(ticker)
         excess_returns_sp500 = self.get_sp500_excess_returns_df()
 
@@ -256,5 +707,66 @@ class TickerReturns():
             "sp500_excess":"Beta"
         })
 
-        #Returning a dataframe with the alphas and betas for the given rolling windows for a particular stock
-        return parameters_df
\ No newline at end of file
+        return parameters_df
+
+    #Rolling Beta, Alpha and R2 of a ticker for every window size of the slider, calculated in one pass
+    #(see panel_analyzer.rolling_capm_windows), so changing the window does not need any new calculation
+    #Returns a dictionary {window size: dataframe with Alpha, Beta and R2}
+    def calculate_rol_analysis_windows(self, ticker, window_sizes=None, refresh=False):
+        from panel_analyzer import rolling_capm_windows
+
+        window_sizes = list(window_sizes or ROLLING_WINDOW_SIZES)
+        return self.cached_result(
+            'rolling_analysis_windows',
+            lambda: rolling_capm_windows(self.ticker_excess_returns_df(ticker), self.get_sp500_excess_returns_df(), window_sizes),
+            [ticker, self.index_ticker, self.tbill_30y_ticker], refresh=refresh, ticker=ticker, window_sizes=window_sizes,
+        )
+
+
+#Analysis of the months between start_date and end_date of another TickerReturns (the parent)
+#Every series (excess returns, SP500 returns, risk free rate) is a slice of the series cached by the parent,
+#so nothing is fetched again. The outliers are the ones removed from the whole history
+#Metrics, rolling analyses, robust regressions and panels are inherited and use the sliced series
+#Created with TickerReturns.with_date_range
+class DateRangeReturns(TickerReturns):
+    def __init__(self, parent, start_date=None, end_date=None):
+        super().__init__(provider=parent.provider, result_cache=parent.result_cache,
+                         memory_budget=parent.memory_budget, returns_dtype=parent.returns_dtype)
+        self.parent = parent
+        self.start_date = start_date
+        self.end_date = end_date
+        for setting in ('ticker_list', 'index_ticker', 'tbill_30y_ticker', 'period', 'interval', 'outlier_method'):
+            setattr(self, setting, getattr(parent, setting))
+
+    def __repr__(self):
+        return f"DateRangeReturns({self.start_date}, {self.end_date})"
+
+    #Results saved on disk also depend on the range
+    def cached_result(self, name, compute, symbols, refresh=False, outlier_method=None, **params):
+        return super().cached_result(name, compute, symbols, refresh=refresh, outlier_method=outlier_method,
+                                     date_range=[str(self.start_date), str(self.end_date)], **params)
+
+    def slice(self, series):
+        return slice_dates(series, self.start_date, self.end_date)
+
+    def get_ticker_returns_df(self, ticker):
+        return self.slice(self.parent.get_ticker_returns_df(ticker))
+
+    def get_monthly_tbill_yield(self, refresh=False):
+        return self.slice(self.parent.get_monthly_tbill_yield(refresh))
+
+    def get_sp500_monthly_returns(self, refresh=False):
+        return self.slice(self.parent.get_sp500_monthly_returns(refresh))
+
+    def get_sp500_excess_returns_df(self, refresh=False, outlier_method=None):
+        return self.slice(self.parent.get_sp500_excess_returns_df(refresh, outlier_method))
+
+    def ticker_excess_returns_df(self, ticker, refresh=False, outlier_method=None):
+        return self.slice(self.parent.ticker_excess_returns_df(ticker, refresh, outlier_method))
+
+    def get_data_version(self):
+        data_version, data_fetched_at = self.parent.get_data_version()
+        return f'{data_version}:{self.start_date or ""}:{self.end_date or ""}', data_fetched_at
+
+    def refresh_market_data(self):
+        return self.parent.refresh_market_data()
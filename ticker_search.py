@@ -0,0 +1,136 @@
+#Search-as-you-type index over the tickers of the universe (symbols and company names)
+#The page is sent without the list of tickers: the dropdown asks the server for the best matches of what is typed,
+#so the first page load stays small however many tickers (ETFs, international stocks...) the universe has
+#Matches are ranked: exact symbol, symbols starting with the text, company names with a word starting with it,
+#then close matches (typos like "APPL") when there are not enough
+#The prefixes are found with binary searches in sorted lists of keys, and the close matches are only scored
+#for the keys sharing the most pairs of letters with the text (inverted index of letter pairs), all built once
+import difflib
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+#Maximum number of tickers returned for each search
+MAX_SEARCH_RESULTS = 20
+
+#Minimum similarity (0 to 1) of a close match
+FUZZY_CUTOFF = 0.6
+
+#Keys scored for the close matches of a search (the ones sharing the most pairs of letters with the text)
+FUZZY_CANDIDATES = 100
+
+
+#Pairs of consecutive letters of a key, with the start and the end marked (" aapl " -> " a", "aa", "ap", "pl", "l ")
+def letter_pairs(key):
+    key = f' {key} '
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+
+#Label of a ticker in the dropdown (symbol and company name, when the store has it)
+def ticker_label(option):
+    name = option.get('name')
+    return f"{option['value']} - {name}" if name else option['value']
+
+
+class TickerSearchIndex:
+    #ticker_options: entries of the ticker store ({'value', 'label', 'name', ...})
+    def __init__(self, ticker_options):
+        self.options = []
+        self.positions = {}
+        symbol_keys = []
+        name_keys = []
+        for option in ticker_options:
+            if option['value'] in self.positions:
+                continue
+            position = len(self.options)
+            self.positions[option['value']] = position
+            self.options.append({'label': ticker_label(option), 'value': option['value']})
+
+            symbol_keys.append((option['value'].lower(), position))
+            name = (option.get('name') or '').lower()
+            #Every word of the name can be a prefix (e.g. "bank" finds "Bank of America" and "Citizens Bank")
+            for word in dict.fromkeys([name] + name.split()):
+                if word:
+                    name_keys.append((word, position))
+
+        #Shorter symbols first among the symbols with the same prefix
+        self.symbol_keys = sorted(symbol_keys)
+        self.name_keys = sorted(name_keys)
+        #Key -> position, for the exact and the close matches
+        self.symbols = dict(symbol_keys)
+        self.names = {}
+        for word, position in name_keys:
+            self.names.setdefault(word, position)
+
+        #Pair of letters -> keys containing it (symbols and words of the names)
+        self.fuzzy_keys = [*self.symbols.items(), *self.names.items()]
+        self.bigrams = defaultdict(list)
+        for key_id, (key, _) in enumerate(self.fuzzy_keys):
+            for bigram in letter_pairs(key):
+                self.bigrams[bigram].append(key_id)
+
+    def __len__(self):
+        return len(self.options)
+
+    def __repr__(self):
+        return f"TickerSearchIndex({len(self)} tickers)"
+
+    #Positions of the keys starting with the prefix (binary search, then the keys in order)
+    @staticmethod
+    def prefix_matches(keys, prefix):
+        for index in range(bisect_left(keys, (prefix,)), len(keys)):
+            key, position = keys[index]
+            if not key.startswith(prefix):
+                break
+            yield position
+
+    #Best matches of the text typed, as dropdown options
+    def search(self, query, limit=MAX_SEARCH_RESULTS):
+        query = (query or '').strip().lower()
+        if not query:
+            return []
+
+        #Dictionary used as an ordered set (a ticker is only returned once, at its best rank)
+        matches = {}
+        exact = self.symbols.get(query)
+        if exact is not None:
+            matches[exact] = True
+        for keys in (self.symbol_keys, self.name_keys):
+            for position in self.prefix_matches(keys, query):
+                if len(matches) >= limit:
+                    break
+                matches.setdefault(position, True)
+
+        options = [self.options[position] for position in matches][:limit]
+        if len(options) < limit:
+            options += self.fuzzy_search(query, limit - len(options), exclude=matches)
+        return options
+
+    #Close matches of the symbols and names (difflib similarity), for typos
+    #The options carry the text typed as their search value, so the dropdown does not filter them out
+    def fuzzy_search(self, query, limit, exclude=()):
+        shared_pairs = Counter()
+        for bigram in letter_pairs(query):
+            shared_pairs.update(self.bigrams.get(bigram, ()))
+
+        matcher = difflib.SequenceMatcher(b=query)
+        scored = []
+        for key_id, _ in shared_pairs.most_common(FUZZY_CANDIDATES):
+            key, position = self.fuzzy_keys[key_id]
+            matcher.set_seq1(key)
+            score = matcher.ratio()
+            if score >= FUZZY_CUTOFF:
+                scored.append((-score, key, position))
+
+        seen = set(exclude)
+        options = []
+        for _, _, position in sorted(scored):
+            if position in seen or len(options) >= limit:
+                continue
+            seen.add(position)
+            options.append({**self.options[position], 'search': f"{self.options[position]['label']} {query}"})
+        return options
+
+    #Options of the given tickers (e.g. the selected ones, which must stay in the dropdown)
+    def get_options(self, values):
+        return [self.options[self.positions[value]] if value in self.positions else {'label': value, 'value': value}
+                for value in values or []]
@@ -0,0 +1,131 @@
+#Warm start of a webapp worker: the data every analysis needs is loaded before the first user arrives
+#- the SP500 and the T-Bill yield (used by every ticker), and the market expectations
+#- a hot list of tickers (excess returns, metrics and rolling windows), CAPM_HOT_TICKERS
+#- the index of the screener (metrics of the whole universe), when a screener is given
+#It runs in a background thread when the server starts, and the worker reports itself ready (/api/ready)
+#once it is done, so a load balancer only sends traffic to warm workers
+#A ticker that fails does not block the readiness, the SP500 and the T-Bill yield do (the analysis needs them)
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+#Hot list used when CAPM_HOT_TICKERS is not set (the fallback tickers of the webapp)
+DEFAULT_HOT_TICKERS = ["AAPL", "MSFT", "TSLA", "GOOG", "AMZN", "NVDA", "META"]
+
+
+#Tickers warmed at start: CAPM_HOT_TICKERS = comma-separated tickers (empty value: none)
+def get_hot_tickers():
+    hot_tickers = os.environ.get('CAPM_HOT_TICKERS')
+    if hot_tickers is None:
+        return list(DEFAULT_HOT_TICKERS)
+    return [ticker.strip().upper() for ticker in hot_tickers.split(',') if ticker.strip()]
+
+
+#CAPM_WARMUP=0 disables the warm-up (the worker is ready at once and the first users load the data)
+def warmup_enabled():
+    return os.environ.get('CAPM_WARMUP', '1') != '0'
+
+
+class WarmUp:
+    #preload: other functions called first (e.g. loading the ticker store), their errors are only reported
+    #retries: attempts to load the SP500 and the T-Bill yield before giving up (waiting retry_delay * attempt)
+    #screener: screener.UniverseScreener whose index is built before the worker is ready
+    def __init__(self, capm_regression, hot_tickers=None, preload=None, retries=3, retry_delay=5.0, enabled=True,
+                 screener=None):
+        self.capm_regression = capm_regression
+        self.screener = screener
+        self.hot_tickers = get_hot_tickers() if hot_tickers is None else list(hot_tickers)
+        self.preload = list(preload or [])
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.enabled = enabled
+
+        self.ready = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.state = 'pending'
+        self.started_at = None
+        self.finished_at = None
+        self.warmed_tickers = []
+        self.errors = {}
+        if not enabled:
+            self.state = 'disabled'
+            self.ready.set()
+
+    def __repr__(self):
+        return f"WarmUp(state={self.state}, hot_tickers={len(self.hot_tickers)})"
+
+    #Starting the background thread (only the first call does something)
+    def start(self):
+        with self.lock:
+            if self.thread is not None or not self.enabled:
+                return
+            self.thread = threading.Thread(target=self.run, name='capm-warmup', daemon=True)
+            self.thread.start()
+
+    #Blocks until the worker is ready (or the timeout in seconds), returns True if it is ready
+    def wait(self, timeout=None):
+        return self.ready.wait(timeout)
+
+    def run(self):
+        self.state = 'running'
+        self.started_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+
+        for function in self.preload:
+            try:
+                function()
+            except Exception as e:
+                self.errors[getattr(function, '__name__', repr(function))] = str(e)
+
+        #Benchmark and risk-free rate: without them no analysis can run, so they are retried
+        for attempt in range(1, self.retries + 1):
+            try:
+                self.capm_regression.get_sp500_excess_returns_df()
+                self.capm_regression.get_monthly_tbill_yield()
+                self.capm_regression.get_market_expectations()
+                break
+            except Exception as e:
+                self.errors['market'] = str(e)
+                print(f"Warm-up could not load the market data (attempt {attempt}/{self.retries}): {e}")
+                if attempt == self.retries:
+                    self.state = 'failed'
+                    self.finished_at = datetime.now(timezone.utc)
+                    return
+                time.sleep(self.retry_delay * attempt)
+        self.errors.pop('market', None)
+
+        for ticker in self.hot_tickers:
+            try:
+                self.capm_regression.calculate_capm_metrics(ticker)
+                self.capm_regression.calculate_rol_analysis_windows(ticker)
+                self.warmed_tickers.append(ticker)
+            except Exception as e:
+                self.errors[ticker] = str(e)
+
+        #Screens are answered from this index (the first query does not build it)
+        if self.screener is not None:
+            try:
+                self.screener.build()
+            except Exception as e:
+                self.errors['screener'] = str(e)
+
+        self.finished_at = datetime.now(timezone.utc)
+        self.state = 'ready'
+        self.ready.set()
+        print(f"Warm-up done in {time.perf_counter() - start:.1f}s: {len(self.warmed_tickers)}/{len(self.hot_tickers)} hot tickers")
+
+    #Readiness report (body of /api/ready)
+    def status(self):
+        seconds = None
+        if self.started_at is not None:
+            seconds = round(((self.finished_at or datetime.now(timezone.utc)) - self.started_at).total_seconds(), 2)
+        return {
+            'ready': self.ready.is_set(),
+            'state': self.state,
+            'seconds': seconds,
+            'hot_tickers': self.hot_tickers,
+            'warmed_tickers': list(self.warmed_tickers),
+            'errors': dict(self.errors),
+        }